@@ -1,4 +1,5 @@
 import os
+import hashlib
 import threading
 import logging
 import time
@@ -7,8 +8,99 @@ import concurrent.futures
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from lxml import etree
 from argparse import ArgumentParser
+try:
+    from lxml import etree
+except ImportError:
+    import xml.etree.ElementTree as etree
+
+
+def localname(tag):
+    """ Tag without namespace """
+    return tag.rsplit('}', 1)[-1]
+
+
+# Bump to invalidate existing per-file caches when the cached format changes
+CACHE_VERSION = 1
+
+
+def read_demands(path):
+    """
+    Reads the demands of one xml file. The file is streamed with iterparse: every demand element is cleared and removed
+    from its parent once it is read, so memory does not grow with the file size. Demand values are collected in a
+    preallocated array, which grows by doubling.
+        Args:
+            path: str: path to the file
+        Returns: (meta, nodes, demand_values): meta: dict of the meta section, nodes: str array of source node names,
+                 demand_values: float array
+    """
+    meta = {}
+    nodes = np.empty(256, dtype=object)
+    demand_values = np.empty(256)
+    num_demands = 0
+    # open elements: the parent of an element is the last one when it ends
+    parents = []
+    for event, elem in etree.iterparse(path, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        tag = localname(elem.tag)
+        if tag == "meta":
+            for item in elem:
+                meta[localname(item.tag)] = item.text
+        elif tag == "demand":
+            node_name = None
+            demand_value = None
+            for item in elem:
+                item_tag = localname(item.tag)
+                if item_tag == "source":
+                    node_name = item.text
+                elif item_tag == "demandValue":
+                    demand_value = item.text
+            if num_demands == len(nodes):
+                nodes = np.concatenate([nodes, np.empty(len(nodes), dtype=object)])
+                demand_values = np.concatenate([demand_values, np.empty(len(demand_values))])
+            nodes[num_demands] = node_name
+            demand_values[num_demands] = float(demand_value)
+            num_demands += 1
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+    return meta, nodes[:num_demands].astype(str), demand_values[:num_demands]
+
+
+def file_hash(path):
+    """ SHA-1 of the content of a file """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_demands(path, cache_dir=None):
+    """
+    Returns the demands of one xml file like read_demands. Runs in a worker process, so it only takes and returns
+    picklable values. If cache_dir is set, the demands are cached there in a .npz file per file content (keyed by the
+    hash of the file), so only new or changed files are parsed.
+        Returns: (meta, nodes, demand_values, cached): cached: bool: whether the demands were read from the cache
+    """
+    if not cache_dir:
+        return read_demands(path) + (False,)
+    cache_file = os.path.join(cache_dir, f"{file_hash(path)}-v{CACHE_VERSION}.npz")
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            return yaml.safe_load(str(data["meta"])), data["nodes"], data["demand_values"], True
+    except (OSError, ValueError, KeyError):
+        pass
+    meta, nodes, demand_values = read_demands(path)
+    # write to a temporary file first: other processes may read the same cache file
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, meta=np.array(yaml.dump(meta, sort_keys=False)), nodes=nodes, demand_values=demand_values)
+    os.replace(tmp_file, cache_file)
+    return meta, nodes, demand_values, False
 
 
 class TraceXMLReader():
@@ -27,7 +119,8 @@ class TraceXMLReader():
 
     def __init__(self, source=None, _from=0, to=None, scale_factor=0.001, run_duration=100,
                  change_rate=2, node_name_map=None, intermediate_result_filename=None, result_trace_filename=None,
-                 ingress_nodes=None, plot_figsize=(20, 10), squash_rate=1, *args, **kwargs):
+                 ingress_nodes=None, plot_figsize=(20, 10), squash_rate=1, workers=None,
+                 chunk_size=1000000, cache_dir=None, *args, **kwargs):
         """
         Handles all parameters of the reader.
             source: str: path to directory or to intermediat .csv file
@@ -40,18 +133,27 @@ class TraceXMLReader():
             node_name_map: dict or str(path): defines how to rename nodes (from keys to values). If argumnet is None old
                                               names will be kept. If a node is set to None it will be removed from the
                                               dataframe. If a node is not in the dict or yaml it will be ignored, the
-                                              name will be kept. Applied in function read_one_file.
+                                              name will be kept. Applied in function rename_nodes.
             intermediate_result_filename: str: filename of csv with intermediate results.
                                                If None f'{directory}_{_from}-{to}_intermediate.csv'
             result_trace_filename: str: filename of csv with resulting trace.
                                                If None - f'{directory}_{_from}-{to}_trace.csv'
             ingress_nodes: list: only this nodes in resulting trace. If None - all nodes will appear in the trace.
                                  Applied in function process_df.
+            workers: int: number of processes reading xml files. If None - number of CPUs.
+            chunk_size: int: number of rows of the intermediate csv processed at once, applied in function
+                             process_intermediate_csv
+            cache_dir: str: directory of the per-file cache of parsed xml files, see load_demands.
+                            If None - f'{source}_cache', if False - no cache.
         """
         self.source = source
         self._from = _from
         self.to = to
-        self._lock = threading.Lock()
+        self.workers = workers
+        self.chunk_size = chunk_size
+        if cache_dir is None and source:
+            cache_dir = f"{os.path.normpath(source)}_cache"
+        self.cache_dir = cache_dir
         if result_trace_filename:
             self.result_trace_filename = result_trace_filename
         else:
@@ -80,6 +182,8 @@ class TraceXMLReader():
         elif isinstance(node_name_map, str):
             with open(node_name_map, "r") as f:
                 self.node_name_map = yaml.load(f)
+        else:
+            self.node_name_map = None
 
     def append_meta(self, meta):
         """
@@ -97,52 +201,25 @@ class TraceXMLReader():
                 self.meta[key] = value
         self.lock_meta.release()
 
-    def read_one_file(self, path):
+    def rename_nodes(self, nodes, demand_values):
         """
-        Reads relevant information from one xml file. Function meant for starting a new thread.
-            Args:
-                path: str: path to the file
-            Also there is the object attribute self.node_name_map, which defines, what node names will look like and
-            which nodes should be removed.
-
-            Returns: None, stores it in self.intermediate_result_df
-            Raises: None, Exceptions written to logging.info
+        Applies self.node_name_map to the source nodes of demands and removes the demands of nodes mapped to None.
+        Returns (nodes, demand_values)
         """
-        try:
-            tree = etree.parse(path)
-            root = tree.getroot()
-
-            namespaces = root.nsmap
-
-            meta = {}
-            for item in root.find("meta", namespaces):
-                meta[etree.QName(item).localname] = item.text
-
-            df = pd.DataFrame({})
-            for item in root.find("demands", namespaces):
-                if self.node_name_map:
-                    node_name = self.node_name_map[item.find("source", namespaces).text]
-                else:
-                    node_name = item.find("source", namespaces).text
-                if node_name:
-                    demand_dict = {"time": meta["time"],
-                                   "node": node_name,
-                                   "demandValue": item.find("demandValue", namespaces).text}
-                    df = df.append(demand_dict, ignore_index=True)
-
-            self._lock.acquire()
-            self.intermediate_result_df = self.intermediate_result_df.append(df)
-            self._lock.release()
-
-            self.append_meta(meta)
-        except BaseException as e:
-            logging.info(str(type(e)), str(e), str(path))
+        if not self.node_name_map:
+            return nodes.astype(object), demand_values
+        names, inverse = np.unique(nodes, return_inverse=True)
+        nodes = np.array([self.node_name_map.get(name, name) for name in names] + [None], dtype=object)[:-1][inverse]
+        keep = nodes.astype(bool)
+        return nodes[keep], demand_values[keep]
 
     def read_files_parallel(self):
         """
-        Reads xml files from a given directory using os.listdir(self.source)[self._from:self.to]. Uses function
-        read_one_file() to start threads for every file. Behavior defined by object attributes: self.directory,
-        self._from, self.to, self.node_name_map.
+        Reads xml files from a given directory using os.listdir(self.source)[self._from:self.to]. The files are read
+        by load_demands() in a pool of self.workers processes (files in the cache self.cache_dir are not parsed again),
+        the results are concatenated once, in file order. Behavior defined by object attributes: self.directory,
+        self._from, self.to, self.node_name_map, self.workers, self.cache_dir.
+        Files which cannot be read are skipped (written to logging.warning).
         """
         files = list(map(lambda file: os.path.join(self.source, file), os.listdir(self.source)))
         files = list(filter(os.path.isfile, files))
@@ -159,16 +236,37 @@ class TraceXMLReader():
 
         logging.info(f"{str(len(files))}  files chosen in total")
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            logging.info("Starting threads...")
-            t0 = time.clock()
-            executor.map(self.read_one_file, files)
-            logging.info("Started")
-            executor.shutdown(wait=True)
-            t1 = time.clock() - t0
-        logging.info(f"Elapsed time:  {t1}")
-
-        self.intermediate_result_df = self.intermediate_result_df.sort_values("time", ascending=True)
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        times, nodes, demand_values = [], [], []
+        num_cached = 0
+        t0 = time.perf_counter()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            logging.info("Starting processes...")
+            futures = [executor.submit(load_demands, path, self.cache_dir) for path in files]
+            for path, future in zip(files, futures):
+                try:
+                    meta, file_nodes, file_demand_values, cached = future.result()
+                except Exception as e:
+                    logging.warning(f"Skipping {path}: {type(e).__name__}: {e}")
+                    continue
+                num_cached += cached
+                file_nodes, file_demand_values = self.rename_nodes(file_nodes, file_demand_values)
+                times.append(np.full(len(file_nodes), meta["time"], dtype=object))
+                nodes.append(file_nodes)
+                demand_values.append(file_demand_values)
+                self.append_meta(meta)
+        t1 = time.perf_counter() - t0
+        logging.info(f"Elapsed time:  {t1}, {num_cached} of {len(files)} files from the cache")
+
+        if demand_values:
+            self.intermediate_result_df = pd.DataFrame({"time": np.concatenate(times),
+                                                        "node": np.concatenate(nodes),
+                                                        "demandValue": np.concatenate(demand_values)})
+        else:
+            self.intermediate_result_df = pd.DataFrame({"time": [], "node": [], "demandValue": []})
+        # stable: demands of one time step keep their file order
+        self.intermediate_result_df = self.intermediate_result_df.sort_values("time", ascending=True, kind="mergesort")
         self.intermediate_result_df["demandValue"] = self.intermediate_result_df["demandValue"].astype(float)
         self.intermediate_result_df.to_csv(self.intermediate_result_filename, index=False)
 
@@ -179,25 +277,73 @@ class TraceXMLReader():
         with open(self.meta_filename, "w") as f:
             yaml.dump(self.meta, f)
 
+    def sum_demands(self, chunks):
+        """
+        Sums the demandValue per time and node over chunks (DataFrames) of the intermediate results, keeping only the
+        ingress nodes (attribute self.ingress_nodes). Only the sums are kept in memory, so the intermediate results can
+        be read in chunks. As long as the intermediate results are sorted by time (as written by read_files_parallel),
+        the rows of every time step are summed at once, in order, so the sums equal the sums over the whole DataFrame.
+
+        Returns (DataFrame with columns time, node, demandValue sorted by time and node, sorted array of all time steps)
+        """
+        partial_sums = []
+        times = set()
+        carry = None
+        for chunk in chunks:
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+                carry = None
+            if chunk.empty:
+                continue
+            times.update(chunk["time"].unique())
+            # the last time step may continue in the next chunk
+            last = chunk["time"] == chunk["time"].iloc[-1]
+            carry, chunk = chunk[last], chunk[~last]
+            partial_sums.append(self.sum_chunk(chunk))
+        if carry is not None:
+            partial_sums.append(self.sum_chunk(carry))
+        if not partial_sums:
+            return pd.DataFrame({"time": [], "node": [], "demandValue": []}), np.array([])
+        # groups spanning chunks only occur if the intermediate results are not sorted by time
+        df_sums = pd.concat(partial_sums).groupby(["time", "node"])["demandValue"].sum().reset_index()
+        return df_sums, np.sort(np.array(list(times)))
+
+    def sum_chunk(self, df):
+        """ Sums of the demandValue per time and node of one chunk (only ingress nodes) """
+        if self.ingress_nodes:
+            df = df[df["node"].isin(self.ingress_nodes)]
+        return df.groupby(["time", "node"])["demandValue"].sum().reset_index()
+
     def process_intermediate(self):
         """
-        Processes the df with the intermediate results. Applies the scale_factor and converts the data rate into
-        inter_arrival_mean. Also the choice of ingress nodes (attribute self.ingress_nodes) is applied here and the time
-        axis, which is defined by self.run_duration and self.change_rate is calculated.
+        Processes the df with the intermediate results (self.intermediate_result_df), see process_sums.
 
-        Trace is written to a csv file with the filename self.result_trace_filename.
+        Returns dataframe with resulting trace
+        """
+        df_sums, _ = self.sum_demands([self.intermediate_result_df])
+        return self.process_sums(df_sums)
+
+    def process_intermediate_csv(self, path):
+        """
+        Processes the intermediate csv file in chunks of self.chunk_size rows, so it never has to fit into memory.
+        Applies self._from and self.to (like slice_intermediate) to the time steps, see process_sums.
 
         Returns dataframe with resulting trace
         """
-        df = self.intermediate_result_df
+        df_sums, time_steps = self.sum_demands(pd.read_csv(path, chunksize=self.chunk_size))
+        df_sums = df_sums[df_sums["time"].isin(self.slice_time_steps(time_steps))].reset_index(drop=True)
+        return self.process_sums(df_sums)
 
-        if self.ingress_nodes:
-            mask = df["node"] == self.ingress_nodes[0]
-            for ing in self.ingress_nodes[1:]:
-                mask = np.logical_or(df["node"] == ing, mask)
-            df = df[mask]
+    def process_sums(self, df_sums):
+        """
+        Processes the data rate sums per time and node. Applies the scale_factor and converts the data rate into
+        inter_arrival_mean. The time axis is defined by self.run_duration and self.change_rate: the i-th time step
+        starts at i * run_duration * change_rate.
 
-        df_sums = df.groupby(["time", "node"]).sum().reset_index()
+        Trace is written to a csv file with the filename self.result_trace_filename.
+
+        Returns dataframe with resulting trace
+        """
         df_sums["demandValue"] = df_sums["demandValue"]*self.scale_factor
         self.data_rate_sums = df_sums
         self.data_rate_sums.to_csv(self.data_rate_sums_filename, index=False)
@@ -205,12 +351,9 @@ class TraceXMLReader():
             df_sums = self.squash_sums()
 
         inter_arrival_mean = 1/(df_sums["demandValue"])
-        groupby_time = df_sums.groupby(["time"])
-        num_timesteps = len(groupby_time)
-        arange = np.arange(0, num_timesteps*self.run_duration*self.change_rate, self.run_duration*self.change_rate)
-
-        time_col = np.concatenate([np.array([i]*len(t[1]["node"])) for t, i in zip(groupby_time, arange)])
-        df_sums["time"] = time_col
+        # index of the time step of every row
+        time_step = np.unique(df_sums["time"], return_inverse=True)[1]
+        df_sums["time"] = time_step*(self.run_duration*self.change_rate)
         df_sums["inter_arrival_mean"] = inter_arrival_mean
         df_sums = df_sums.drop(axis=1, labels=["demandValue"])
 
@@ -222,29 +365,34 @@ class TraceXMLReader():
 
     def squash_sums(self):
         """
-        Squashes traffic into a smaller time period
+        Squashes traffic into a smaller time period: every squash_rate time steps are merged into the first of them,
+        with the mean data rate per node.
         :return:
         DataFrame with new trace
         """
-        df = pd.DataFrame()
-        time_steps = list(self.data_rate_sums.groupby(["time"]).groups.keys())
-        time_steps.sort()
-        time_steps = [time_steps[i:i+self.squash_rate] for i in range(0, len(time_steps), self.squash_rate)]
-        for _time_steps in time_steps:
-            masks = [self.data_rate_sums["time"] == t for t in _time_steps]
-            mask = masks[0]
-            for m in masks[1:]:
-                mask = np.logical_or(m, mask)
-            _df = self.data_rate_sums[mask]
-            _df = _df.groupby(["node"]).sum().reset_index()
-            _df["time"] = [_time_steps[0]]*_df.shape[0]
-            _df["demandValue"] = _df["demandValue"]/self.squash_rate
-            df = df.append(_df)
-        df = df.reset_index()
-        df = df.drop(axis=1, labels=["index"])
+        df = self.data_rate_sums
+        time_steps = np.unique(df["time"])
+        squashed = np.searchsorted(time_steps, df["time"]) // self.squash_rate
+        sums = df.groupby([squashed, df["node"]])["demandValue"].sum()
+        df = pd.DataFrame({"node": sums.index.get_level_values(1),
+                           "time": time_steps[::self.squash_rate][sums.index.get_level_values(0)],
+                           "demandValue": sums.to_numpy()/self.squash_rate})
         self.data_rate_sums = df
         return df
 
+    def slice_time_steps(self, time_steps):
+        """ Returns the sorted time steps time_steps[self._from:self.to] """
+        time_steps = sorted(time_steps)
+        if self.to and self.to <= len(time_steps):
+            logging.info(f"Chosen trace part: trace[{str(self._from)}:{str(self.to)}]")
+            time_steps = time_steps[self._from:self.to]
+        elif self._from <= len(time_steps):
+            logging.info(f"Chosen trace part: trace[{str(self._from)}:]")
+            time_steps = time_steps[self._from:]
+        else:
+            logging.info(f"Chosen trace part: trace[:]")
+        return time_steps
+
     def slice_intermediate(self):
         """
         Slices the intermediate DataFrame, applying self._from and self.to.
@@ -253,17 +401,7 @@ class TraceXMLReader():
         DataFrame written to self.intermediate_result_df
         """
         groupby = self.intermediate_result_df.groupby(["time"])
-        groups = list(groupby.groups.keys())
-        groups.sort()
-
-        if self.to and self.to <= len(groups):
-            logging.info(f"Chosen trace part: trace[{str(self._from)}:{str(self.to)}]")
-            groups = groups[self._from:self.to]
-        elif self._from <= len(groups):
-            logging.info(f"Chosen trace part: trace[{str(self._from)}:]")
-            groups = groups[self._from:]
-        else:
-            logging.info(f"Chosen trace part: trace[:]")
+        groups = self.slice_time_steps(groupby.groups.keys())
 
         self.intermediate_result_df = pd.concat([groupby.get_group(group) for group in groups])
 
@@ -333,10 +471,7 @@ def main(config_file, **kwargs):
         reader.source = reader.intermediate_result_filename
     if os.path.isfile(reader.source):
         logging.info("Process intermediate csv")
-        reader.intermediate_result_df = pd.read_csv(reader.source)
-        logging.info("loaded intermediate csv")
-        reader.slice_intermediate()
-        df_result = reader.process_intermediate()
+        df_result = reader.process_intermediate_csv(reader.source)
 
     logging.info("\n" + str(df_result))
     logging.info(f'inter_arrival_mean range: {min(df_result["inter_arrival_mean"])}, {max(df_result["inter_arrival_mean"])}')
@@ -345,7 +480,7 @@ def main(config_file, **kwargs):
     logging.info(f'... std:  {df_result["inter_arrival_mean"].std()}')
 
     if kwargs.get("plot", None) or kwargs.get("save_plots", None):
-        if not reader.intermediate_result_df.empty:
+        if not reader.data_rate_sums.empty:
             fig, ax = reader.plot_data_rate()
             if 'data_rate' in kwargs.get("save_plots", None):
                 plot_filename = f"""{os.path.splitext(reader.result_trace_filename)[0]}_data_rate.{
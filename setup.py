@@ -21,6 +21,11 @@ lstm_extra_requirements = [
     "scikit-learn",
     'keras==2.2.5',
 ]
+# extra requirements for zstd and lz4 compressed results (gzip is always available)
+compression_extra_requirements = [
+    'zstandard',
+    'lz4',
+]
 test_requirements = [
     'flake8',
     'nose2'
@@ -39,13 +44,18 @@ setup(
     packages=find_packages('src'),
     python_requires=">=3.6.0",
     install_requires=requirements,
-    extras_require={"lstm": lstm_extra_requirements},
+    extras_require={"lstm": lstm_extra_requirements, "compression": compression_extra_requirements},
     tests_require=test_requirements,
     zip_safe=False,
     entry_points={
         'console_scripts': [
             'coord-sim=coordsim.main:main',
             'animation=animations.animations:main',
+            'merge-results=coordsim.writer.merge_shards:main',
+            'coord-sim-bench=coordsim.bench.runner:main',
+            'coord-sim-generate=coordsim.generator.generate:main',
+            'coord-sim-workload=coordsim.generator.flow_workload:main',
+            'coord-sim-flow-trace=coordsim.trace_processor.flow_trace:main',
             'lstm-predict=coordsim.traffic_predictor.lstm_predictor:main'
         ],
     },
@@ -8,6 +8,7 @@ import networkx
 import pandas as pd
 import os
 import yaml
+from coordsim.results.result_set import ResultSet
 
 
 # https://stackoverflow.com/questions/40233986/python-is-there-a-function-or-formula-to-find-the-complementary-colour-of-a-rgb
@@ -45,6 +46,10 @@ class PlacementAnime:
         self.resources_file = os.path.join(test_dir, resources_file)
         self.node_metrics_file = os.path.join(test_dir, node_metrics_file)
         self.run_flows_file = os.path.join(test_dir, run_flows_file)
+        # parsed result files, cached in binary sidecar files for the next animation of the same test
+        self.results = ResultSet(test_dir, files={'placements': placement_file, 'rl_state': rl_state_file,
+                                                  'resources': resources_file, 'node_metrics': node_metrics_file,
+                                                  'run_flows': run_flows_file})
         if video_filename:
             self.video_filename = video_filename
         elif not test_dir == ".":
@@ -56,7 +61,7 @@ class PlacementAnime:
         self.interval = interval
 
         self.node_metrics = None
-        self._resources = None
+        self.resources_table = None
         self.rl_state = None
         self.additional_subplots = additional_subplots
         self.place_per_axis = place_per_axis
@@ -64,12 +69,13 @@ class PlacementAnime:
         self.net_x = networkx.read_graphml(self.network_file)
         self.set_linkDelay()  # compute LinkDelay from nodes positions and write it to the networkx object
         self.get_ingress_and_resources_files()
-        self.placement = pd.read_csv(self.placement_file)
-        self.placement = self.placement.groupby(["time"])
-        self.run_duration = int(np.mean(np.diff(list(self.placement.groups.keys()))))
+        self.placement = self.results['placements']
+        self.placement_times = list(self.results.times('placements'))
+        self.run_duration = int(np.mean(np.diff(self.placement_times)))
         if "dropped_flows" in additional_subplots:
-            if os.path.split(self.run_flows_file)[1] in os.listdir(self.test_dir):
-                self.run_flows = pd.read_csv(self.run_flows_file)
+            if self.results.has('run_flows'):
+                # copy: set_total_flows adds a column, the frames of the ResultSet are shared
+                self.run_flows = self.results['run_flows'].copy()
                 self.set_total_flows()
                 self.dropped_flows_last_point = {"successful_flows": [0, 0],
                                                  "dropped_flows": [0, 0],
@@ -125,13 +131,14 @@ class PlacementAnime:
         Reads node_metrics.csv or resources.csv and rl_state.csv resolving the different cases.
         :return: None
         """
-        if os.path.split(self.node_metrics_file)[1] in os.listdir(self.test_dir):
-            self.node_metrics = pd.read_csv(self.node_metrics_file)
+        if self.results.has('node_metrics'):
+            self.node_metrics = self.results['node_metrics']
+            self.resources_table = 'node_metrics'
         else:
-            if os.path.split(self.resources_file)[1] in os.listdir(self.test_dir):
-                self._resources = pd.read_csv(self.resources_file).groupby(["time"])
-            if os.path.split(self.rl_state_file)[1] in os.listdir(self.test_dir):
-                self.rl_state = pd.read_csv(self.rl_state_file, header=None)
+            if self.results.has('resources'):
+                self.resources_table = 'resources'
+            if self.results.has('rl_state'):
+                self.rl_state = self.results['rl_state'].copy()
                 self.rl_state.columns = ["episode", "time"] + [f"pop{i}" for i in range(self.net_x.number_of_nodes())]
             else:
                 self.additional_subplots.remove("ingress_traffic")
@@ -144,8 +151,8 @@ class PlacementAnime:
         :return: float
         """
         if self.node_metrics is not None:
-            ret = self.node_metrics["ingress_traffic"][self.node_metrics["time"] == frame]
-            return ret[self.node_metrics["node"] == node].iloc[0]
+            rows = self.results.at('node_metrics', frame)
+            return rows["ingress_traffic"][rows["node"] == node].iloc[0]
         elif self.rl_state is not None:
             return self.rl_state[node][self.rl_state["time"] == frame].iloc[0]
         else:
@@ -157,10 +164,9 @@ class PlacementAnime:
         Returns Groupby object either of node_metrics or resources
         :return:
         """
-        if self.node_metrics is not None:
-            return self.node_metrics.groupby(["time"])
-        else:
-            return self._resources
+        if self.resources_table is None:
+            return None
+        return self.results[self.resources_table].groupby(["time"])
 
     def get_network_filename(self):
         listdir = os.listdir(self.test_dir)
@@ -238,7 +244,7 @@ class PlacementAnime:
         :return: axis
         """
         ln = []
-        for node, data in self.placement.get_group(frame).groupby(["node"]):
+        for node, data in self.results.at('placements', frame).groupby(["node"]):
             x, y = self.node_pos[node.replace("pop", "")]
             for component in data["sf"]:
                 ln.append(self.ax.text(x + self.component_offsets[component], y - self.component_offsets_y, component,
@@ -264,7 +270,7 @@ class PlacementAnime:
         """
         ln = []
         node_colors = [(0.0, 0.0, 0.0, 1.0)] * self.net_x.number_of_nodes()
-        for node, data in self.resources.get_group(frame).groupby(["node"]):
+        for node, data in self.results.at(self.resources_table, frame).groupby(["node"]):
             x, y = self.node_pos[node.replace("pop", "")] + 1
             capacity = data['node_capacity'].iloc[0]
             if capacity != 0:
@@ -413,7 +419,7 @@ class PlacementAnime:
         # for the slider attempt
         ln = []
         self.init()
-        for frame in self.placement.groups:
+        for frame in self.placement_times:
             ln.append(self.plot_moment(frame))
         self.moments.extend(ln)
 
@@ -452,9 +458,7 @@ class PlacementAnime:
         Creates artists
         :return: axis
         """
-        groups = list(self.placement.groups)
-        groups.sort()
-        groups = groups[::self.sample_rate]
+        groups = self.placement_times[::self.sample_rate]
         ln = []
         for frame in groups[::self.sample_rate]:
             ln.append(self.update(frame))
@@ -0,0 +1,302 @@
+"""
+Golden-metrics equivalence of engine configurations
+
+An engine configuration is a dict of simulator config overrides, e.g., other flow forwarder, processor or generator
+classes or writer options. check_equivalence runs a scenario matrix (deterministic and stochastic traffic, a trace,
+the MMPP two-state arrival model; DurationController and FlowController) through a reference and a candidate engine
+with the same seeds and compares:
+- per-run rows: the metrics, run_flows, drop_reasons and node_metrics tables
+- final metrics: the scalar entries of Metrics.get_metrics() and the drop reasons
+- per-flow outcomes: generation (time, node, SFC, duration) and processing or drop (time, node, reason) of every flow
+- written result files: the simulations run in test mode, so the result writer (and its backend options) run as well.
+  The CSV result files (see RESULT_FILES, compressed or not, except the wall-clock runtimes) of both engines have to
+  match. Disable this for candidates with other writer backends (sqlite, columnar, sharded), which write other files.
+Numbers are compared with math.isclose(rel_tol, abs_tol), everything else exactly. The differences form the diff
+report (see format_report). Flow events are taken from the event tracer, so trace_events is enabled for both engines.
+
+Run from the command line: python -m coordsim.bench.equivalence --candidate writer_async=true
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+from collections import namedtuple
+import yaml
+from coordsim.bench.runner import flow_action, scheduling_action
+from coordsim.bench.scenarios import SCENARIO_DEFAULTS, write_scenario
+from coordsim.results.result_set import RESULT_FILES, ResultSet
+from coordsim.simulation.tracer import EventCode
+
+log = logging.getLogger(__name__)
+
+# Tables with one row per run (or per node and run) that have to match
+RUN_TABLES = ('metrics', 'run_flows', 'drop_reasons', 'node_metrics')
+
+# Written result files that have to match (runtimes are wall-clock times)
+FILE_TABLES = tuple(table for table in RESULT_FILES if table != 'runtimes')
+
+# Traffic variants of the scenario matrix: scenario parameters (see SCENARIO_DEFAULTS) and config overrides
+TRAFFIC = {
+    'deterministic': {'config': {'deterministic_arrival': True}},
+    'stochastic': {'size_shape': 1.5, 'inter_arrival_mean': 5.0},
+    'trace': {'trace': [(0, 10.0), (150, 2.0), (300, 20.0), (450, 5.0)]},
+    'mmpp': {'config': {'use_states': True, 'init_state': 'state_1', 'rand_init_state': False,
+                        'states': {'state_1': {'inter_arr_mean': 10.0, 'switch_p': 0.8},
+                                   'state_2': {'inter_arr_mean': 2.0, 'switch_p': 0.3}}}},
+}
+
+# One difference between the reference and the candidate engine. kind: run, metric, flow or file
+Difference = namedtuple('Difference', ['scenario', 'seed', 'kind', 'key', 'reference', 'candidate'])
+
+
+def equivalence_scenarios(traffic=None, controllers=('DurationController', 'FlowController'), **parameters):
+    """
+    Return the scenario matrix: every traffic variant (names in TRAFFIC, default: all) with every controller.
+    parameters override SCENARIO_DEFAULTS for all scenarios, e.g., duration=500.
+    """
+    scenarios = []
+    for name in (traffic or TRAFFIC):
+        for controller in controllers:
+            scenario = dict(SCENARIO_DEFAULTS, nodes=6, ingress=2, duration=600)
+            scenario.update(parameters)
+            variant = TRAFFIC[name]
+            scenario.update({key: value for key, value in variant.items() if key != 'config'})
+            scenario['config'] = dict(variant.get('config', {}))
+            scenario['controller'] = controller
+            scenario['name'] = f"{name}-{controller}"
+            scenarios.append(scenario)
+    return scenarios
+
+
+class FlowOutcomes:
+    """ Tracer sink (see coordsim.simulation.tracer) and drops subscriber collecting the outcome of every flow """
+    def __init__(self):
+        self.names = None
+        # flow id --> outcome dict
+        self.flows = {}
+
+    def open(self, names):
+        self.names = names
+
+    def write(self, records):
+        for record in records:
+            code = record['code']
+            if code == EventCode.FLOW_GENERATED:
+                self.flows.setdefault(int(record['flow']), {}).update(
+                    generated=(float(record['time']), self.names['node'][record['node']],
+                               self.names['sfc'][record['sfc']], float(record['value'])))
+            elif code == EventCode.FLOW_DEPARTED:
+                self.flows.setdefault(int(record['flow']), {}).update(
+                    processed=(float(record['time']), self.names['node'][record['node']]))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def drops(self, table, rows):
+        for _, time, flow_id, node, sf, reason in rows:
+            self.flows.setdefault(int(flow_id), {}).update(dropped=(time, node, sf, reason))
+
+
+def read_files(test_dir):
+    """ Return the written result files of a test dir: table --> list of rows (missing values are None) """
+    import pandas as pd
+
+    results = ResultSet(test_dir, cache=False)
+    files = {}
+    for table in FILE_TABLES:
+        if not results.has(table):
+            continue
+        try:
+            df = results[table]
+        except pd.errors.EmptyDataError:
+            files[table] = []
+            continue
+        files[table] = df.astype(object).where(df.notna(), None).values.tolist()
+    return files
+
+
+def run_engine(scenario, engine, seed, files=True):
+    """
+    Run a scenario with the config overrides of an engine in test mode.
+    Returns dict: 'runs' (table --> rows), 'metrics' (name --> final value), 'flows' (flow id --> outcome) and, if
+    files, 'files' (table --> rows of the written result file, see read_files)
+    """
+    from siminterface.simulator import Simulator
+
+    with tempfile.TemporaryDirectory(prefix='coord-sim-equivalence-') as directory:
+        config = dict(scenario.get('config', {}))
+        config.update(engine)
+        config['trace_events'] = True
+        scenario = dict(scenario, seed=seed, config=config)
+        if 'trace' in scenario:
+            # Not next to the network file, where the simulator copies the trace to
+            trace_file = os.path.join(directory, 'traces', 'trace.csv')
+            os.makedirs(os.path.dirname(trace_file))
+            with open(trace_file, 'w') as f:
+                f.write('time,inter_arrival_mean\n')
+                f.writelines(f"{time},{inter_arrival_mean}\n" for time, inter_arrival_mean in scenario['trace'])
+            scenario['config']['trace_path'] = trace_file
+        network_file, service_file, config_file = write_scenario(scenario, directory)
+        test_dir = os.path.join(directory, 'results')
+        simulator = Simulator(network_file, service_file, config_file, test_mode=True, test_dir=test_dir)
+
+        runs = {table: [] for table in RUN_TABLES}
+        simulator.subscribe(lambda table, rows: runs[table].extend(list(row) for row in rows), RUN_TABLES)
+        outcomes = FlowOutcomes()
+        simulator.subscribe(outcomes.drops, ['drops'])
+        simulator.tracer.add_sink(outcomes)
+
+        state = simulator.init(seed)
+        if scenario['controller'] == 'FlowController':
+            while simulator.env.now < scenario['duration']:
+                state = simulator.apply(flow_action(state))
+        else:
+            action = scheduling_action(simulator)
+            while simulator.env.now < scenario['duration']:
+                simulator.apply(action)
+        final_metrics = simulator.metrics.get_metrics()
+        metrics = {name: value for name, value in final_metrics.items()
+                   if isinstance(value, (int, float)) and name != 'running_time'}
+        metrics.update({f"dropped_flow_reasons.{reason}": count
+                        for reason, count in final_metrics['dropped_flow_reasons'].items()})
+        simulator.close()
+        result = {'runs': runs, 'metrics': metrics, 'flows': outcomes.flows}
+        if files:
+            result['files'] = read_files(test_dir)
+    return result
+
+
+def equal(reference, candidate, rel_tol, abs_tol):
+    if isinstance(reference, (list, tuple)) and isinstance(candidate, (list, tuple)):
+        return len(reference) == len(candidate) and all(equal(r, c, rel_tol, abs_tol)
+                                                        for r, c in zip(reference, candidate))
+    if isinstance(reference, dict) and isinstance(candidate, dict):
+        return reference.keys() == candidate.keys() and all(equal(reference[key], candidate[key], rel_tol, abs_tol)
+                                                            for key in reference)
+    numbers = (int, float)
+    if isinstance(reference, numbers) and isinstance(candidate, numbers) and not isinstance(reference, bool):
+        return math.isclose(reference, candidate, rel_tol=rel_tol, abs_tol=abs_tol)
+    return reference == candidate
+
+
+def compare_runs(scenario_name, seed, reference, candidate, rel_tol=1e-9, abs_tol=1e-9):
+    """ Return the differences of two results of run_engine """
+    differences = []
+    for table in RUN_TABLES:
+        ref_rows, cand_rows = reference['runs'][table], candidate['runs'][table]
+        for i in range(max(len(ref_rows), len(cand_rows))):
+            ref_row = ref_rows[i] if i < len(ref_rows) else None
+            cand_row = cand_rows[i] if i < len(cand_rows) else None
+            if not equal(ref_row, cand_row, rel_tol, abs_tol):
+                differences.append(Difference(scenario_name, seed, 'run', f"{table}[{i}]", ref_row, cand_row))
+    for name in sorted(reference['metrics'].keys() | candidate['metrics'].keys()):
+        ref_value, cand_value = reference['metrics'].get(name), candidate['metrics'].get(name)
+        if not equal(ref_value, cand_value, rel_tol, abs_tol):
+            differences.append(Difference(scenario_name, seed, 'metric', name, ref_value, cand_value))
+    for flow_id in sorted(reference['flows'].keys() | candidate['flows'].keys()):
+        ref_flow, cand_flow = reference['flows'].get(flow_id), candidate['flows'].get(flow_id)
+        if not equal(ref_flow, cand_flow, rel_tol, abs_tol):
+            differences.append(Difference(scenario_name, seed, 'flow', flow_id, ref_flow, cand_flow))
+    if 'files' in reference and 'files' in candidate:
+        for table in FILE_TABLES:
+            ref_rows, cand_rows = reference['files'].get(table), candidate['files'].get(table)
+            if ref_rows is None or cand_rows is None:
+                if ref_rows is not cand_rows:
+                    differences.append(Difference(scenario_name, seed, 'file', table,
+                                                  ref_rows is not None, cand_rows is not None))
+                continue
+            for i in range(max(len(ref_rows), len(cand_rows))):
+                ref_row = ref_rows[i] if i < len(ref_rows) else None
+                cand_row = cand_rows[i] if i < len(cand_rows) else None
+                if not equal(ref_row, cand_row, rel_tol, abs_tol):
+                    differences.append(Difference(scenario_name, seed, 'file', f"{table}[{i}]", ref_row, cand_row))
+    return differences
+
+
+def check_equivalence(reference_engine, candidate_engine, scenarios=None, seeds=(1234,), rel_tol=1e-9, abs_tol=1e-9,
+                      files=True):
+    """
+    Run all scenarios (default: equivalence_scenarios()) and seeds with both engines (dicts of config overrides).
+    files: also compare the written result files (see module docstring)
+    Returns the list of differences, empty if the engines are equivalent.
+    """
+    differences = []
+    for scenario in (scenarios if scenarios is not None else equivalence_scenarios()):
+        for seed in seeds:
+            log.info(f"Comparing engines on scenario {scenario['name']} with seed {seed}")
+            reference = run_engine(scenario, reference_engine, seed, files)
+            candidate = run_engine(scenario, candidate_engine, seed, files)
+            differences.extend(compare_runs(scenario['name'], seed, reference, candidate, rel_tol, abs_tol))
+    return differences
+
+
+def format_report(differences, max_per_scenario=20):
+    """ Human-readable diff report: number of differences per scenario, seed and kind and the first ones """
+    if not differences:
+        return "Engines are equivalent"
+    lines = [f"{len(differences)} differences"]
+    groups = {}
+    for difference in differences:
+        groups.setdefault((difference.scenario, difference.seed), []).append(difference)
+    for (scenario, seed), group in groups.items():
+        counts = {}
+        for difference in group:
+            counts[difference.kind] = counts.get(difference.kind, 0) + 1
+        lines.append(f"{scenario} (seed {seed}): " + ", ".join(f"{n} {kind}" for kind, n in counts.items()))
+        for difference in group[:max_per_scenario]:
+            lines.append(f"  {difference.kind} {difference.key}: {difference.reference} != {difference.candidate}")
+        if len(group) > max_per_scenario:
+            lines.append(f"  ... {len(group) - max_per_scenario} more")
+    return "\n".join(lines)
+
+
+def parse_engine(items):
+    engine = {}
+    for item in items:
+        key, value = item.split('=', 1)
+        engine[key] = yaml.safe_load(value)
+    return engine
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Compare the results of two engine configurations")
+    parser.add_argument('--reference', nargs='+', default=[], metavar='KEY=VALUE',
+                        help="Config overrides of the reference engine (default: none)")
+    parser.add_argument('--candidate', nargs='+', default=[], metavar='KEY=VALUE',
+                        help="Config overrides of the candidate engine, e.g. flow_forwarder_class=MyForwarder")
+    parser.add_argument('--traffic', nargs='+', default=None, choices=sorted(TRAFFIC))
+    parser.add_argument('--controller', nargs='+', default=['DurationController', 'FlowController'],
+                        choices=['DurationController', 'FlowController'])
+    parser.add_argument('--duration', type=int, default=600, help="Simulated time per scenario")
+    parser.add_argument('--seeds', nargs='+', type=int, default=[1234])
+    parser.add_argument('--rel-tol', type=float, default=1e-9)
+    parser.add_argument('--abs-tol', type=float, default=1e-9)
+    parser.add_argument('--no-files', action='store_true',
+                        help="Do not compare the written result files (e.g. for other writer backends)")
+    parser.add_argument('-o', '--output', default=None, help="Also write the differences as JSON")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    scenarios = equivalence_scenarios(args.traffic, args.controller, duration=args.duration)
+    differences = check_equivalence(parse_engine(args.reference), parse_engine(args.candidate), scenarios,
+                                    args.seeds, args.rel_tol, args.abs_tol, not args.no_files)
+    print(format_report(differences))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump([difference._asdict() for difference in differences], f, indent=2, default=str)
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    main()
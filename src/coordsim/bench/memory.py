@@ -0,0 +1,153 @@
+"""
+Memory-growth regression check for long episodes
+
+check_memory runs a single long episode of a benchmark scenario (see coordsim.bench.scenarios) and samples the memory
+traced by tracemalloc and the RSS after every run. Once steady state is reached (after the warmup fraction of the
+runs), memory must not grow by more than max_growth bytes per run (slope of a least-squares fit of the traced memory).
+The report lists the call sites that allocated most of the memory retained during steady state.
+
+Run from the command line: python -m coordsim.bench.memory --runs 1000 --max-growth 4096
+"""
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import tracemalloc
+import numpy as np
+from coordsim.bench.runner import flow_action, scheduling_action
+from coordsim.bench.scenarios import SCENARIO_DEFAULTS, write_scenario
+from coordsim.metrics.exporter import resident_memory
+
+# Frames of tracemalloc, the import system and this module (samples) are not allocations of the simulation
+IGNORED_FRAMES = (tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                  '<frozen importlib._bootstrap_external>')
+
+
+def growth_per_run(runs, values):
+    """ Slope of the least-squares line through (run, value) """
+    if len(runs) < 2:
+        return 0.0
+    return float(np.polyfit(runs, values, 1)[0])
+
+
+def top_allocations(start, end, limit=10, frames=1):
+    """ Call sites (the innermost frames) with the largest growth from snapshot start to end """
+    filters = [tracemalloc.Filter(False, pattern) for pattern in IGNORED_FRAMES]
+    start = start.filter_traces(filters)
+    end = end.filter_traces(filters)
+    key_type = 'lineno' if frames == 1 else 'traceback'
+    allocations = []
+    for stat in end.compare_to(start, key_type)[:limit]:
+        allocations.append({
+            'site': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback][:frames],
+            'size_diff': stat.size_diff,
+            'count_diff': stat.count_diff,
+            'size': stat.size,
+        })
+    return allocations
+
+
+def check_memory(scenario, runs=200, warmup=0.25, max_growth=4096, top=10, frames=1):
+    """
+    Run a scenario for the given number of runs and check its memory growth in steady state (see module docstring).
+    Returns the report: dict with the samples per run, the growth per run of the traced memory and RSS, the top
+    allocating call sites and 'passed'.
+    """
+    from siminterface.simulator import Simulator
+
+    scenario = dict(scenario, duration=runs * scenario['run_duration'])
+    steady_run = max(1, int(runs * warmup))
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(frames)
+    samples = []
+    start_snapshot = None
+    try:
+        with tempfile.TemporaryDirectory(prefix='coord-sim-memory-') as directory:
+            network_file, service_file, config_file = write_scenario(scenario, directory)
+            simulator = Simulator(network_file, service_file, config_file)
+            state = simulator.init(scenario['seed'])
+            action = scheduling_action(simulator)
+            run = 0
+            while simulator.env.now < scenario['duration']:
+                if scenario['controller'] == 'FlowController':
+                    state = simulator.apply(flow_action(state))
+                else:
+                    simulator.apply(action)
+                if simulator.env.now < (run + 1) * scenario['run_duration']:
+                    continue
+                run += 1
+                samples.append({'run': run, 'sim_time': simulator.env.now,
+                                'traced_bytes': tracemalloc.get_traced_memory()[0], 'rss_bytes': resident_memory()})
+                if run == steady_run:
+                    start_snapshot = tracemalloc.take_snapshot()
+            end_snapshot = tracemalloc.take_snapshot()
+            simulator.close()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+
+    steady = [sample for sample in samples if sample['run'] >= steady_run]
+    steady_runs = [sample['run'] for sample in steady]
+    traced_growth = growth_per_run(steady_runs, [sample['traced_bytes'] for sample in steady])
+    rss_growth = growth_per_run(steady_runs, [sample['rss_bytes'] for sample in steady])
+    return {
+        'scenario': scenario,
+        'runs': len(samples),
+        'steady_state_run': steady_run,
+        'max_growth_per_run': max_growth,
+        'traced_growth_per_run': traced_growth,
+        'rss_growth_per_run': rss_growth,
+        'passed': traced_growth <= max_growth,
+        'top_allocations': top_allocations(start_snapshot, end_snapshot, top, frames) if start_snapshot else [],
+        'samples': samples,
+    }
+
+
+def format_report(report):
+    lines = [f"{'PASSED' if report['passed'] else 'FAILED'}: traced memory grows by "
+             f"{report['traced_growth_per_run']:.0f} bytes per run (limit {report['max_growth_per_run']}), RSS by "
+             f"{report['rss_growth_per_run']:.0f} bytes per run in runs {report['steady_state_run']}-{report['runs']}",
+             "Top allocating call sites in steady state:"]
+    for allocation in report['top_allocations']:
+        lines.append(f"  {allocation['size_diff']:+d} B ({allocation['count_diff']:+d} blocks) "
+                     f"{' <- '.join(allocation['site'])}")
+    return "\n".join(lines)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Check the memory growth of a long simulation episode")
+    parser.add_argument('--runs', type=int, default=1000, help="Number of runs of the episode")
+    parser.add_argument('--warmup', type=float, default=0.25, help="Fraction of runs before steady state")
+    parser.add_argument('--max-growth', type=float, default=4096, help="Allowed growth in bytes per run")
+    parser.add_argument('--top', type=int, default=10, help="Number of reported call sites")
+    parser.add_argument('--frames', type=int, default=1, help="Traceback frames per call site")
+    parser.add_argument('--nodes', type=int, default=SCENARIO_DEFAULTS['nodes'])
+    parser.add_argument('--ingress', type=int, default=SCENARIO_DEFAULTS['ingress'])
+    parser.add_argument('--inter-arrival', type=float, default=SCENARIO_DEFAULTS['inter_arrival_mean'])
+    parser.add_argument('--controller', default='DurationController',
+                        choices=['DurationController', 'FlowController'])
+    parser.add_argument('--run-duration', type=int, default=SCENARIO_DEFAULTS['run_duration'])
+    parser.add_argument('--seed', type=int, default=SCENARIO_DEFAULTS['seed'])
+    parser.add_argument('-o', '--output', default=None, help="Also write the report as JSON")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.WARNING)
+    scenario = dict(SCENARIO_DEFAULTS, nodes=args.nodes, ingress=min(args.ingress, args.nodes),
+                    inter_arrival_mean=args.inter_arrival, controller=args.controller,
+                    run_duration=args.run_duration, seed=args.seed)
+    report = check_memory(scenario, args.runs, args.warmup, args.max_growth, args.top, args.frames)
+    print(format_report(report))
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == "__main__":
+    main()
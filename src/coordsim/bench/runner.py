@@ -0,0 +1,183 @@
+"""
+coord-sim-bench: run synthetic benchmark scenarios and report their performance as JSON
+
+Every scenario runs in a fresh process (unless --in-process), so peak RSS and startup time are those of the scenario.
+Reported per scenario:
+- startup_s: wall time to create the simulator and initialize the episode (reading files, shortest paths, ...)
+- wall_s: wall time of the simulation after startup
+- events, events_per_s: SimPy events scheduled (None if SimPy's event id counter is not available)
+- flows, flows_per_s: generated flows
+- sim_time_ratio: simulated time per wall-clock second
+- peak_rss_bytes: peak resident set size of the process
+- decisions: applied actions (one per run for DurationController, one per flow for FlowController)
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections import namedtuple
+import yaml
+from spinterface import SimulatorAction
+from coordsim.bench.scenarios import SCENARIO_DEFAULTS, scenario_grid, scenario_name, write_scenario
+from coordsim.simulation.profiler import next_event_id
+
+log = logging.getLogger(__name__)
+
+# Action of the FlowController: decide the next node of a single flow
+FlowAction = namedtuple('FlowAction', ['flow', 'destination_node_id'])
+
+
+def peak_rss():
+    """ Peak RSS of this process in bytes (ru_maxrss is in kilobytes on Linux, in bytes on macOS) """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def scheduling_action(simulator):
+    """ Place all SFs everywhere; process half of the flows locally and balance the rest over the neighbors """
+    network = simulator.network
+    sfs = list(simulator.sf_list.keys())
+    placement = {node: sfs for node in network.nodes}
+    scheduling = {}
+    for node in network.nodes:
+        neighbors = list(network.neighbors(node))
+        probabilities = {dest: 0.0 for dest in network.nodes}
+        probabilities[node] = 0.5 if neighbors else 1.0
+        for neighbor in neighbors:
+            probabilities[neighbor] = 0.5 / len(neighbors)
+        scheduling[node] = {sfc: {sf: probabilities for sf in sfc_sfs}
+                            for sfc, sfc_sfs in simulator.sfc_list.items()}
+    return SimulatorAction(placement=placement, scheduling=scheduling)
+
+
+def flow_action(state):
+    """ Process every flow at its current node and let it depart there """
+    flow = state.flow
+    if flow.forward_to_eg and flow.egress_node_id is None:
+        flow.egress_node_id = flow.current_node_id
+    return FlowAction(flow, flow.egress_node_id if flow.forward_to_eg else flow.current_node_id)
+
+
+def run_scenario(scenario, test_mode=False):
+    """ Run a scenario in this process and return its measurements """
+    from siminterface.simulator import Simulator
+
+    with tempfile.TemporaryDirectory(prefix='coord-sim-bench-') as directory:
+        network_file, service_file, config_file = write_scenario(scenario, directory)
+        start = time.perf_counter()
+        simulator = Simulator(network_file, service_file, config_file, test_mode=test_mode,
+                              test_dir=f"{directory}/results")
+        state = simulator.init(scenario['seed'])
+        startup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        decisions = 0
+        if scenario['controller'] == 'FlowController':
+            while simulator.env.now < scenario['duration']:
+                state = simulator.apply(flow_action(state))
+                decisions += 1
+        else:
+            action = scheduling_action(simulator)
+            while simulator.env.now < scenario['duration']:
+                simulator.apply(action)
+                decisions += 1
+        wall = time.perf_counter() - start
+        # The number of scheduled events is the next id of SimPy's event id counter
+        events = next_event_id(simulator.env)
+        flows = simulator.metrics.metrics['generated_flows']
+        sim_time = simulator.env.now
+        simulator.close()
+
+    return {
+        'scenario': scenario_name(scenario),
+        'parameters': scenario,
+        'startup_s': startup,
+        'wall_s': wall,
+        'sim_time': sim_time,
+        'sim_time_ratio': sim_time / wall if wall > 0 else None,
+        'events': events,
+        'events_per_s': events / wall if wall > 0 and events is not None else None,
+        'flows': flows,
+        'flows_per_s': flows / wall if wall > 0 else None,
+        'decisions': decisions,
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def run_isolated(scenario, test_mode=False):
+    """ Run a scenario in a fresh (spawned) process """
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(1) as pool:
+        return pool.apply(run_scenario, (scenario, test_mode))
+
+
+def parse_value(value):
+    return None if value in ('det', 'none', 'None') else yaml.safe_load(value)
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark coord-sim on synthetic scenarios and report JSON")
+    parser.add_argument('--nodes', nargs='+', type=int, default=[10, 50], help="Topology sizes")
+    parser.add_argument('--ingress', nargs='+', type=int, default=[1, 5], help="Numbers of ingress nodes")
+    parser.add_argument('--sfc-length', nargs='+', type=int, default=[3], help="Numbers of SFs per SFC")
+    parser.add_argument('--inter-arrival', nargs='+', type=float, default=[10.0, 1.0],
+                        help="Mean inter-arrival times of flows per ingress node")
+    parser.add_argument('--size-shape', nargs='+', type=parse_value, default=[None],
+                        help="Pareto shapes of the flow sizes, 'det' for deterministic sizes")
+    parser.add_argument('--controller', nargs='+', default=['DurationController', 'FlowController'],
+                        choices=['DurationController', 'FlowController'])
+    parser.add_argument('--duration', type=int, default=SCENARIO_DEFAULTS['duration'], help="Simulated time")
+    parser.add_argument('--run-duration', type=int, default=SCENARIO_DEFAULTS['run_duration'])
+    parser.add_argument('--seed', type=int, default=SCENARIO_DEFAULTS['seed'])
+    parser.add_argument('--set', nargs='+', default=[], metavar='KEY=VALUE', dest='config',
+                        help="Simulator config overrides for all scenarios, e.g. writer_async=true")
+    parser.add_argument('--test-mode', action='store_true', help="Write results (to a temporary directory)")
+    parser.add_argument('--in-process', action='store_true',
+                        help="Run all scenarios in this process (peak RSS is then the maximum so far)")
+    parser.add_argument('-o', '--output', default=None, help="JSON output file (default: stdout)")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    # The simulator logs flow events at INFO level, only log the progress of the benchmark
+    logging.basicConfig(level=logging.WARNING)
+    log.setLevel(logging.INFO)
+    config = {}
+    for item in args.config:
+        key, value = item.split('=', 1)
+        config[key] = yaml.safe_load(value)
+    scenarios = scenario_grid(nodes=args.nodes, ingress=args.ingress, sfc_length=args.sfc_length,
+                              inter_arrival_mean=args.inter_arrival, size_shape=args.size_shape,
+                              controller=args.controller, duration=[args.duration],
+                              run_duration=[args.run_duration], seed=[args.seed], config=[config])
+    results = []
+    for scenario in scenarios:
+        log.info(f"Running scenario {scenario_name(scenario)}")
+        if args.in_process:
+            results.append(run_scenario(scenario, args.test_mode))
+        else:
+            results.append(run_isolated(scenario, args.test_mode))
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'isolated': not args.in_process,
+        'results': results,
+    }
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic, scalable benchmark scenarios
+
+A scenario is a dict of the swept parameters (see SCENARIO_DEFAULTS). write_scenario creates the network (GraphML),
+service and config files of a scenario, so the simulator runs it exactly like user-provided files.
+"""
+
+import itertools
+import os
+import networkx as nx
+import yaml
+from coordsim.generator import topology as generator_topology
+
+SCENARIO_DEFAULTS = {
+    # number of nodes of the topology (connected Watts-Strogatz graph with degree 4)
+    'nodes': 10,
+    # number of ingress nodes
+    'ingress': 1,
+    # number of SFs in the (single) SFC
+    'sfc_length': 3,
+    # mean inter-arrival time of flows per ingress node (exponentially distributed)
+    'inter_arrival_mean': 10.0,
+    # Pareto shape of the flow sizes (heavy tail for small shapes) or None for deterministic flow sizes
+    'size_shape': None,
+    # 'DurationController' (schedule-based decisions per run) or 'FlowController' (one external decision per flow)
+    'controller': 'DurationController',
+    # simulated time
+    'duration': 1000,
+    'run_duration': 100,
+    'seed': 1234,
+}
+
+
+def scenario_grid(**sweeps):
+    """
+    Return the scenarios of the cartesian product of the swept values, e.g., scenario_grid(nodes=[10, 100]).
+    Parameters that are not swept have their default value.
+    """
+    names = list(sweeps.keys())
+    scenarios = []
+    for values in itertools.product(*(sweeps[name] for name in names)):
+        scenario = dict(SCENARIO_DEFAULTS)
+        scenario.update(zip(names, values))
+        scenario['ingress'] = min(scenario['ingress'], scenario['nodes'])
+        scenarios.append(scenario)
+    return scenarios
+
+
+def scenario_name(scenario):
+    size = 'det' if scenario['size_shape'] is None else f"pareto{scenario['size_shape']}"
+    return (f"n{scenario['nodes']}-i{scenario['ingress']}-l{scenario['sfc_length']}-"
+            f"a{scenario['inter_arrival_mean']}-{size}-{scenario['controller']}")
+
+
+def create_topology(num_nodes, num_ingress, seed):
+    """ Connected topology with node and link capacities and delays as read by reader.read_network """
+    return generator_topology.create_topology('small_world', num_nodes, num_ingress, seed=seed, node_cap=100,
+                                              link_cap=1000, delay=(1, 5))
+
+
+def write_scenario(scenario, directory):
+    """
+    Write the files of a scenario to directory
+    Returns: paths of the network, service and config files
+    """
+    os.makedirs(directory, exist_ok=True)
+    network_file = os.path.join(directory, 'network.graphml')
+    nx.write_graphml(create_topology(scenario['nodes'], scenario['ingress'], scenario['seed']), network_file)
+
+    sfs = [f"sf{i}" for i in range(scenario['sfc_length'])]
+    services = {
+        'sfc_list': {'sfc_1': sfs},
+        'sf_list': {sf: {'processing_delay_mean': 5.0, 'processing_delay_stdev': 0.0} for sf in sfs},
+    }
+    service_file = os.path.join(directory, 'services.yaml')
+    with open(service_file, 'w') as f:
+        yaml.dump(services, f, default_flow_style=False)
+
+    config = {
+        'inter_arrival_mean': scenario['inter_arrival_mean'],
+        'deterministic_arrival': False,
+        'flow_dr_mean': 1.0,
+        'flow_dr_stdev': 0.0,
+        'flow_size_shape': 0.001 if scenario['size_shape'] is None else scenario['size_shape'],
+        'deterministic_size': scenario['size_shape'] is None,
+        'run_duration': scenario['run_duration'],
+        'ttl_choices': [100],
+        'use_states': False,
+        'controller_class': scenario['controller'],
+    }
+    if scenario['controller'] == 'FlowController':
+        config['decision_maker_class'] = 'ExternalDecisionMaker'
+    config.update(scenario.get('config', {}))
+    config_file = os.path.join(directory, 'config.yaml')
+    with open(config_file, 'w') as f:
+        yaml.dump(config, f, default_flow_style=False)
+    return network_file, service_file, config_file
@@ -8,6 +8,9 @@ class BaseDecisionMaker:
     """ Base Decision Maker class
     All decision maker classes must inherit this class
     """
+    # Methods timed by the profiler (see coordsim.simulation.profiler)
+    profiled_methods = ('decide_next_node',)
+
     def __init__(self, env: Environment, params: SimulatorParams):
         self.env = env
         self.params: SimulatorParams = params
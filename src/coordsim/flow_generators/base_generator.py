@@ -1,4 +1,5 @@
 import logging
+import operator
 import numpy as np
 import random
 from typing import Tuple
@@ -12,6 +13,13 @@ class BaseFlowGenerator:
     """ Base Flow Generator class
     All flow generator classes must inherit this class
     """
+    # Methods timed by the profiler (see coordsim.simulation.profiler); generate_flow is profiled per ingress node
+    profiled_methods = ('generate_flow',)
+    profiled_nodes = {'generate_flow': operator.itemgetter(1)}
+    # Streaming generators decide when and where flows arrive (see next_arrival). Otherwise, flows arrive at every
+    # ingress node with the inter-arrival times returned by generate_flow.
+    streaming = False
+
     def __init__(self, env: Environment, params: SimulatorParams):
         raise NotImplementedError
 
@@ -22,3 +30,9 @@ class BaseFlowGenerator:
             - Flow: flow object containing all required parameters set
         """
         raise NotImplementedError
+
+    def next_arrival(self) -> Tuple[float, str]:
+        """ Streaming generators only: return the arrival time and ingress node of the next flow, None if there are no
+        more flows. The flow is then created by generate_flow at its arrival time.
+        """
+        raise NotImplementedError
@@ -0,0 +1,41 @@
+import logging
+import os
+from typing import Tuple
+from coordsim.network.flow import Flow
+from coordsim.flow_generators import BaseFlowGenerator
+from coordsim.generator.flow_workload import open_workload
+log = logging.getLogger(__name__)
+
+
+class MappedListFlowGenerator(BaseFlowGenerator):
+    """
+    Replays the pre-generated flows of a memory-mapped workload file (config: workload_path, relative to the CWD; see
+    coordsim.generator.flow_workload). Every episode starts again with the first flow of each ingress node.
+    """
+    def __init__(self, env, params):
+        self.env = env
+        self.params = params
+        self.workload = open_workload(os.path.join(os.getcwd(), params.config['workload_path']))
+        missing = set(params.sfc_list.keys()) - set(self.workload.sfcs)
+        assert not missing, f"SFCs {missing} are not in the workload {self.workload.path}"
+        # index of the next flow per ingress node
+        self.flow_idx = {ing[0]: 0 for ing in params.ing_nodes}
+
+    def generate_flow(self, flow_id, node_id) -> Tuple[float, Flow]:
+        """ Generate the next flow of the workload for a given node_id """
+        flows = self.workload.flows(node_id)
+        idx = self.flow_idx[node_id]
+        if idx >= len(flows['dr']):
+            raise ValueError(f"Workload {self.workload.path} has only {idx} flows for ingress node {node_id}. "
+                             f"Generate it for a longer duration.")
+        self.flow_idx[node_id] = idx + 1
+        egress = flows['egress'][idx]
+        flow_egress_node = self.workload.egress[egress] if egress >= 0 else None
+        # Generate flow based on given params
+        flow = Flow(str(flow_id), self.workload.sfcs[flows['sfc'][idx]], float(flows['dr'][idx]),
+                    float(flows['size'][idx]), self.env.now, current_node_id=node_id,
+                    egress_node_id=flow_egress_node, ttl=flows['ttl'][idx].item())
+        # Update metrics for the generated flow
+        self.params.metrics.generated_flow(flow, node_id)
+
+        return float(flows['inter_arrival'][idx]), flow
@@ -0,0 +1,81 @@
+import logging
+import os
+import random
+import numpy as np
+from typing import Tuple
+from coordsim.network.flow import Flow
+from coordsim.flow_generators import BaseFlowGenerator
+from coordsim.trace_processor.flow_trace import iter_flow_trace
+log = logging.getLogger(__name__)
+
+
+class TraceFlowGenerator(BaseFlowGenerator):
+    """
+    Replays the flows of a per-flow trace (see coordsim.trace_processor.flow_trace) at their recorded arrival times
+    and ingress nodes. The trace is streamed in chunks of flow_trace_chunk_size records, so only one chunk is in
+    memory at a time.
+    Config:
+    - flow_trace_path: CSV or binary flow trace, relative to the CWD
+    - flow_trace_time_scale: simulated time units per trace time unit (default: 1, e.g., 1000 for traces in seconds)
+    - flow_trace_start: trace time replayed at simulated time 0 (default: time of the first flow). Earlier flows are
+      skipped.
+    Flows without SFC, egress node or TTL get a random one like with the DefaultFlowGenerator.
+    """
+    streaming = True
+
+    def __init__(self, env, params):
+        self.env = env
+        self.params = params
+        self.time_scale = params.config.get('flow_trace_time_scale', 1.0)
+        self.start_time = params.config.get('flow_trace_start', None)
+        self.chunks = iter_flow_trace(os.path.join(os.getcwd(), params.config['flow_trace_path']),
+                                      params.config.get('flow_trace_chunk_size', 65536))
+        self.chunk = None
+        self.idx = 0
+        self.num_records = 0
+        self.ingress_nodes = {ing[0] for ing in params.ing_nodes}
+
+    def next_record(self):
+        """ Move to the next record; False at the end of the trace """
+        self.idx += 1
+        while self.chunk is None or self.idx >= len(self.chunk['time']):
+            self.chunk = next(self.chunks, None)
+            self.idx = 0
+            if self.chunk is None:
+                return False
+        self.num_records += 1
+        return True
+
+    def next_arrival(self):
+        """ Return the simulated arrival time and ingress node of the next flow, None at the end of the trace """
+        while self.next_record():
+            if self.start_time is None:
+                self.start_time = self.chunk['time'][self.idx]
+            arrival_time = (self.chunk['time'][self.idx] - self.start_time) * self.time_scale
+            if arrival_time < 0:
+                continue
+            node_id = self.chunk['ingress'][self.idx]
+            if node_id not in self.ingress_nodes:
+                raise ValueError(f"Flow {self.num_records} of the flow trace arrives at {node_id}, "
+                                 f"which is not an ingress node")
+            return float(arrival_time), node_id
+        log.info(f"End of the flow trace after {self.num_records} flows")
+        return None
+
+    def generate_flow(self, flow_id, node_id) -> Tuple[float, Flow]:
+        """ Generate the flow of the current record, which arrives now at node_id """
+        chunk, idx = self.chunk, self.idx
+        flow_sfc = chunk['sfc'][idx]
+        if flow_sfc is None:
+            flow_sfc = np.random.choice([sfc for sfc in self.params.sfc_list.keys()])
+        flow_egress_node = chunk['egress'][idx]
+        if flow_egress_node is None and self.params.eg_nodes:
+            flow_egress_node = random.choice(self.params.eg_nodes)
+        ttl = chunk['ttl'][idx]
+        ttl = random.choice(self.params.ttl_choices) if ttl < 0 else ttl.item()
+        flow = Flow(str(flow_id), flow_sfc, float(chunk['dr'][idx]), float(chunk['size'][idx]), self.env.now,
+                    current_node_id=node_id, egress_node_id=flow_egress_node, ttl=ttl)
+        # Update metrics for the generated flow
+        self.params.metrics.generated_flow(flow, node_id)
+        # Arrivals are scheduled by FlowSimulator.stream_arrivals, there is no inter-arrival time
+        return None, flow
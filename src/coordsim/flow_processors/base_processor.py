@@ -3,6 +3,7 @@ import numpy as np
 import logging
 from coordsim.network.flow import Flow
 from coordsim.simulation.simulatorparams import SimulatorParams
+from coordsim.simulation.tracer import EventCode
 log = logging.getLogger(__name__)
 
 
@@ -10,6 +11,9 @@ class BaseFlowProcessor:
     """ Base Flow Processor class
     All flow processor classes must inherit this class
     """
+    # Methods timed by the profiler (see coordsim.simulation.profiler)
+    profiled_methods = ('process_flow',)
+
     def __init__(self, env: Environment, params: SimulatorParams):
         self.env = env
         self.params = params
@@ -58,10 +62,10 @@ class BaseFlowProcessor:
         node_cap = self.params.network.nodes[node_id]["cap"]
         node_remaining_cap = self.params.network.nodes[node_id]["remaining_cap"]
         assert node_remaining_cap >= 0, "Remaining node capacity cannot be less than 0 (zero)!"
+        tracer = self.params.tracer
         if demanded_total_capacity <= node_cap:
-            self.params.logger.info(
-                "Flow {} started processing at sf {} at node {}. Time: {}"
-                .format(flow.flow_id, sf, node_id, self.env.now))
+            if tracer is not None:
+                tracer.record(EventCode.SF_STARTED, self.env.now, flow.flow_id, node_id, sf=sf)
 
             # Update processing level of flow
             flow.processing_index += 1
@@ -96,8 +100,8 @@ class BaseFlowProcessor:
 
             return True
         else:
-            self.params.logger.info(
-                f"Not enough capacity for flow {flow.flow_id} at node {flow.current_node_id}. Dropping flow.")
+            if tracer is not None:
+                tracer.record(EventCode.NODE_NO_CAP, self.env.now, flow.flow_id, flow.current_node_id)
             return False
 
     def finish_processing(self, flow: Flow, node_id: str, sf: str) -> bool:
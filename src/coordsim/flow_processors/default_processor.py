@@ -1,5 +1,6 @@
 import logging
 from coordsim.flow_processors import BaseFlowProcessor
+from coordsim.simulation.tracer import EventCode
 import numpy as np
 log = logging.getLogger(__name__)
 
@@ -22,9 +23,9 @@ class DefaultFlowProcessor(BaseFlowProcessor):
         sf = sfc[flow.current_position]
         flow.current_sf = sf
 
-        self.params.logger.info(
-            "Flow {} STARTED PROCESSING at node {} for processing. Time: {}"
-            .format(flow.flow_id, flow.current_node_id, self.env.now))
+        tracer = self.params.tracer
+        if tracer is not None:
+            tracer.record(EventCode.PROCESSING_STARTED, self.env.now, flow.flow_id, current_node_id)
 
         if sf in self.params.sf_placement[current_node_id]:
             processing_delay = self.get_processing_delay(flow, sf)
@@ -36,9 +37,8 @@ class DefaultFlowProcessor(BaseFlowProcessor):
             if resources_available:
                 # Resources are available: wait processing_delay
                 yield self.env.timeout(processing_delay)
-                self.params.logger.info(
-                    "Flow {} started departing sf {} at node {}. Time {}"
-                    .format(flow.flow_id, sf, current_node_id, self.env.now))
+                if tracer is not None:
+                    tracer.record(EventCode.SF_DEPARTING, self.env.now, flow.flow_id, current_node_id, sf=sf)
                 # Create a simpy process to cleanup used resources after flow duration passed
                 self.env.process(self.finish_processing(flow, current_node_id, sf))
                 return True
@@ -46,5 +46,6 @@ class DefaultFlowProcessor(BaseFlowProcessor):
                 return False
 
         else:
-            self.params.logger.info(f"SF {sf} was not found at {current_node_id}. Dropping flow {flow.flow_id}")
+            if tracer is not None:
+                tracer.record(EventCode.SF_NOT_FOUND, self.env.now, flow.flow_id, current_node_id, sf=sf)
             return False
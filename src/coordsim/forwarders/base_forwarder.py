@@ -7,6 +7,9 @@ class BaseFlowForwarder:
     """ Base Flow Forwarder class
     All flow forwarder classes must inherit this class
     """
+    # Methods timed by the profiler (see coordsim.simulation.profiler)
+    profiled_methods = ('forward_flow',)
+
     def __init__(self, env: Environment, params: SimulatorParams):
         pass
 
@@ -1,5 +1,6 @@
 import logging
 from coordsim.forwarders import BaseFlowForwarder
+from coordsim.simulation.tracer import EventCode
 # log = logging.getLogger(__name__)
 
 
@@ -20,8 +21,10 @@ class DefaultFlowForwarder(BaseFlowForwarder):
         Path delays are calculated using the Shortest path
         The delay is simulated by timing out for the delay amount of duration
         """
+        tracer = self.params.tracer
         if next_node is None:
-            self.params.logger.info(f"No node to forward flow {flow.flow_id} to. Dropping it")
+            if tracer is not None:
+                tracer.record(EventCode.NO_NEXT_NODE, self.env.now, flow.flow_id, flow.current_node_id)
             return False
 
         path_delay = 0
@@ -45,12 +48,11 @@ class DefaultFlowForwarder(BaseFlowForwarder):
             if self.params.writer is not None:
                 self.params.writer.write_flow_action(self.params, self.env.now, flow, flow.current_node_id, next_node)
             assert path_delay == 0, "While Forwarding the flow, the Current and Next node same, yet path_delay != 0"
-            self.params.logger.info(
-                "Flow {} will stay in node {}. Time: {}.".format(flow.flow_id, flow.current_node_id, self.env.now))
+            if tracer is not None:
+                tracer.record(EventCode.FLOW_STAYING, self.env.now, flow.flow_id, flow.current_node_id)
         else:
-            self.params.logger.info(
-                "Flow {} will leave node {} towards node {}. Time {}"
-                .format(flow.flow_id, flow.current_node_id, next_node, self.env.now))
+            if tracer is not None:
+                tracer.record(EventCode.FLOW_LEAVING, self.env.now, flow.flow_id, flow.current_node_id, next_node)
             path_to_next_node = self.params.network.graph['shortest_paths'][(flow.current_node_id, next_node)][0]
             # Get the path starting from next node
             for next_hop in path_to_next_node[1:]:
@@ -89,16 +91,17 @@ class DefaultFlowForwarder(BaseFlowForwarder):
         edge_rem_cap = self.params.network.edges[(flow.current_node_id, dest_node_id)]['remaining_cap']
         # calculate new remaining cap
         new_rem_cap = edge_rem_cap - flow.dr
+        tracer = self.params.tracer
         if new_rem_cap >= 0:
             # There is enoough capacity on the edge: send the flow
-            self.params.logger.info(
-                f"Flow {flow.flow_id} started travelling on edge ({flow.current_node_id}, {dest_node_id})")
+            if tracer is not None:
+                tracer.record(EventCode.LINK_RESERVED, self.env.now, flow.flow_id, flow.current_node_id, dest_node_id)
             self.params.network.edges[(flow.current_node_id, dest_node_id)]['remaining_cap'] -= flow.dr
             return True
         else:
             # Not enough capacity on the edge: drop the flow
-            self.params.logger.info(f"No cap on edge ({flow.current_node_id}, {dest_node_id}) to handle {flow.flow_id}.\
-            Dropping it")
+            if tracer is not None:
+                tracer.record(EventCode.LINK_NO_CAP, self.env.now, flow.flow_id, flow.current_node_id, dest_node_id)
             return False
 
     def return_link_resources(self, flow, source_node_id, dest_node_id):
@@ -0,0 +1,207 @@
+"""
+Pre-generated flow workloads, shareable across processes via mmap
+
+A workload file holds the flows of every ingress node as contiguous columns (see COLUMNS): inter-arrival time, data
+rate, size, SFC, egress node and TTL of each flow. MappedListFlowGenerator (flow_generator_class) replays them, so
+different coordination algorithms see identical flows without generating them, and parallel evaluation processes
+share one physical copy of the memory-mapped file.
+
+File layout: MAGIC, metadata length (uint64), YAML metadata (name tables, flow counts and byte offsets of the
+columns), then the 8-byte aligned columns of each ingress node.
+
+Generate a workload: coord-sim-workload -n network.graphml -sf services.yaml -c config.yaml -d 10000 -s 1234 -o flows.wl
+"""
+
+import argparse
+import logging
+import os
+import numpy as np
+import yaml
+from coordsim.reader import reader
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'CSWORKL1'
+LENGTH_DTYPE = np.dtype('<u8')
+ALIGNMENT = 8
+# Column name --> dtype (ttl is stored as float64 if any TTL choice is not an integer)
+COLUMNS = {
+    'inter_arrival': np.dtype('<f8'),
+    'dr': np.dtype('<f8'),
+    'size': np.dtype('<f8'),
+    # indices into the name tables, egress -1 if the flow has no egress node
+    'sfc': np.dtype('<i4'),
+    'egress': np.dtype('<i4'),
+    'ttl': np.dtype('<i8'),
+}
+
+
+def generate_ingress_flows(params, node_id, duration, rng):
+    """
+    Return the columns of the flows arriving at an ingress node until duration, drawn like
+    SimulatorParams.generate_flow_lists (flows with negative data rate are skipped) and DefaultFlowGenerator
+    (uniformly random SFC, egress node and TTL).
+    """
+    inter_arr_mean = params.inter_arr_mean[node_id]
+    if inter_arr_mean is None:
+        return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    chunks = {'inter_arrival': [], 'dr': [], 'size': []}
+    total_time = 0.0
+    while total_time < duration:
+        num_flows = int((duration - total_time) / inter_arr_mean * 1.1) + 16
+        if params.deterministic_arrival:
+            inter_arrival = np.full(num_flows, float(inter_arr_mean))
+        else:
+            inter_arrival = rng.exponential(inter_arr_mean, num_flows)
+        dr = rng.normal(params.flow_dr_mean, params.flow_dr_stdev, num_flows)
+        if params.deterministic_size:
+            size = np.full(num_flows, float(params.flow_size_shape))
+        else:
+            # heavy-tail flow size
+            size = rng.pareto(params.flow_size_shape, num_flows) + 1
+        valid = (dr >= 0) & (size >= 0)
+        chunks['inter_arrival'].append(inter_arrival[valid])
+        chunks['dr'].append(dr[valid])
+        chunks['size'].append(size[valid])
+        total_time += inter_arrival[valid].sum()
+    columns = {name: np.concatenate(chunk) for name, chunk in chunks.items()}
+    # flow i arrives at the sum of the first i inter-arrival times; keep all flows arriving before duration
+    arrivals = np.cumsum(columns['inter_arrival']) - columns['inter_arrival']
+    num_flows = int(np.searchsorted(arrivals, duration, side='left'))
+    columns = {name: column[:num_flows] for name, column in columns.items()}
+    columns['sfc'] = rng.randint(len(params.sfc_list), size=num_flows)
+    if params.eg_nodes:
+        columns['egress'] = rng.randint(len(params.eg_nodes), size=num_flows)
+    else:
+        columns['egress'] = np.full(num_flows, -1)
+    columns['ttl'] = rng.choice(params.ttl_choices, size=num_flows)
+    return columns
+
+
+def generate_workload(params, duration, seed):
+    """ Return the metadata and the columns per ingress node of a workload. Every ingress node has its own stream. """
+    ttl_dtype = COLUMNS['ttl'] if all(float(ttl).is_integer() for ttl in params.ttl_choices) else np.dtype('<f8')
+    dtypes = dict(COLUMNS, ttl=ttl_dtype)
+    flows = {}
+    for i, (node_id, *_) in enumerate(params.ing_nodes):
+        rng = np.random.RandomState([seed, i])
+        columns = generate_ingress_flows(params, node_id, duration, rng)
+        flows[node_id] = {name: np.ascontiguousarray(columns[name], dtype=dtype) for name, dtype in dtypes.items()}
+    metadata = {
+        'seed': seed,
+        'duration': duration,
+        'sfcs': list(params.sfc_list.keys()),
+        'egress': list(params.eg_nodes),
+        'dtypes': {name: dtype.str for name, dtype in dtypes.items()},
+    }
+    return metadata, flows
+
+
+def aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def write_workload(path, metadata, flows):
+    """ Write a workload (see generate_workload) to path """
+    # Column offsets relative to the start of the data; the metadata (with the offsets) precedes the data
+    offset = 0
+    metadata = dict(metadata, ingress={})
+    for node_id, columns in flows.items():
+        entry = {'count': len(columns['dr']), 'offsets': {}}
+        for name, column in columns.items():
+            entry['offsets'][name] = offset
+            offset = aligned(offset + column.nbytes)
+        metadata['ingress'][node_id] = entry
+    encoded = yaml.dump(metadata, default_flow_style=False, sort_keys=False).encode('utf-8')
+    data_start = aligned(len(MAGIC) + LENGTH_DTYPE.itemsize + len(encoded))
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.array(len(encoded), dtype=LENGTH_DTYPE).tobytes())
+        f.write(encoded)
+        for node_id, columns in flows.items():
+            for name, column in columns.items():
+                f.seek(data_start + metadata['ingress'][node_id]['offsets'][name])
+                f.write(column.tobytes())
+        f.truncate(data_start + offset)
+
+
+class Workload:
+    """
+    Memory-mapped workload file (read-only)
+    flows(node_id): dict column name --> array of the flows arriving at the ingress node
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a workload file")
+            length = int(np.frombuffer(f.read(LENGTH_DTYPE.itemsize), dtype=LENGTH_DTYPE)[0])
+            self.metadata = yaml.safe_load(f.read(length).decode('utf-8'))
+        data_start = aligned(len(MAGIC) + LENGTH_DTYPE.itemsize + length)
+        if os.path.getsize(path) > data_start:
+            self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        else:
+            self.buffer = np.zeros(0, dtype=np.uint8)
+        self.sfcs = self.metadata['sfcs']
+        self.egress = self.metadata['egress']
+        self.columns = {}
+        for node_id, entry in self.metadata['ingress'].items():
+            self.columns[node_id] = {}
+            for name, dtype in self.metadata['dtypes'].items():
+                dtype = np.dtype(dtype)
+                start = data_start + entry['offsets'][name]
+                self.columns[node_id][name] = self.buffer[start:start + entry['count'] * dtype.itemsize].view(dtype)
+
+    def flows(self, node_id):
+        if node_id not in self.columns:
+            raise ValueError(f"Workload {self.path} has no flows for ingress node {node_id}")
+        return self.columns[node_id]
+
+
+# (path, modification time, size) --> Workload opened by this process
+_workloads = {}
+
+
+def open_workload(path):
+    """ Return the memory-mapped workload of a file, cached until the file changes """
+    path = os.path.realpath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    if key not in _workloads:
+        _workloads[key] = Workload(path)
+    return _workloads[key]
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Pre-generate the flows of a simulation as memory-mappable file")
+    parser.add_argument('-n', '--network', required=True, help="GraphML network file (ingress and egress nodes)")
+    parser.add_argument('-sf', '--sf', required=True, help="Service file with the SFCs")
+    parser.add_argument('-sfr', '--sfr', default='', help="Path which contains the SF resource consumption functions")
+    parser.add_argument('-c', '--config', required=True,
+                        help="Simulator config (inter-arrival time, flow data rate and size, TTL choices)")
+    parser.add_argument('-d', '--duration', required=True, type=float, help="Simulated time to generate flows for")
+    parser.add_argument('-s', '--seed', type=int, default=1234, help="Random seed")
+    parser.add_argument('-o', '--output', required=True, help="Workload file")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    # Imported here: the flow generators (imported with the simulation package) use this module
+    from coordsim.metrics.metrics import Metrics
+    from coordsim.simulation.simulatorparams import SimulatorParams
+
+    args = parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    network, ing_nodes, eg_nodes = reader.read_network(args.network)
+    sfc_list = reader.get_sfc(args.sf)
+    sf_list = reader.get_sf(args.sf, args.sfr)
+    config = reader.get_config(args.config)
+    params = SimulatorParams(log, network, ing_nodes, eg_nodes, sfc_list, sf_list, config, Metrics(network, sf_list))
+    metadata, flows = generate_workload(params, args.duration, args.seed)
+    write_workload(args.output, metadata, flows)
+    log.info(f"Wrote {sum(len(columns['dr']) for columns in flows.values())} flows of {len(flows)} ingress nodes "
+             f"to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
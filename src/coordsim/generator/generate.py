@@ -0,0 +1,97 @@
+"""
+coord-sim-generate: write a synthetic topology, matching services and a simulator config targeting a load level
+
+Output directory content:
+- network.graphml: topology (see generator.topology)
+- services.yaml and resource_functions/: SFCs, SFs and their resource functions (see generator.workload)
+- config.yaml: simulator config with the inter-arrival time of the requested load
+"""
+
+import argparse
+import logging
+import os
+from coordsim.generator.topology import TOPOLOGY_MODELS, create_topology, write_topology
+from coordsim.generator.workload import RESOURCE_FUNCTIONS, create_services, load_config, write_config, \
+    write_services
+
+log = logging.getLogger(__name__)
+
+
+def parse_range(value):
+    """ 'x' --> x, 'min-max' --> (min, max) """
+    if '-' in value:
+        low, high = value.split('-', 1)
+        return int(low), int(high)
+    return int(value)
+
+
+def generate(args):
+    """ Write the files for the parsed args. Returns the paths of the network, service and config files. """
+    os.makedirs(args.output, exist_ok=True)
+    model_kwargs = {name: getattr(args, name) for name in ('alpha', 'beta', 'm', 'columns', 'k', 'degree')
+                    if getattr(args, name) is not None}
+    network = create_topology(args.model, args.nodes, args.ingress, seed=args.seed, node_cap=args.node_cap,
+                              link_cap=args.link_cap, delay=args.delay, **model_kwargs)
+    network_file = os.path.join(args.output, 'network.graphml')
+    write_topology(network, network_file)
+
+    services = create_services(num_sfcs=args.sfcs, chain_length=args.chain_length, num_sfs=args.num_sfs,
+                               resource_functions=args.resource_functions,
+                               processing_delay=(args.processing_delay, 0.0))
+    service_file = os.path.join(args.output, 'services.yaml')
+    write_services(services, service_file)
+
+    config = load_config(network, services, load=args.load, flow_dr_mean=args.flow_dr,
+                         flow_size_shape=args.flow_size_shape, deterministic_size=not args.pareto,
+                         run_duration=args.run_duration)
+    config_file = os.path.join(args.output, 'config.yaml')
+    write_config(config, config_file, load=args.load)
+    log.info(f"Generated {args.model} topology with {network.number_of_nodes()} nodes and "
+             f"{network.number_of_edges()} links in {args.output}. "
+             f"Inter-arrival mean for load {args.load}: {config['inter_arrival_mean']}")
+    return network_file, service_file, config_file
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic topology, services and simulator config")
+    parser.add_argument('output', help="Output directory")
+    # topology
+    parser.add_argument('--model', default='waxman', choices=sorted(TOPOLOGY_MODELS), help="Random graph model")
+    parser.add_argument('--nodes', type=int, default=20, help="Number of nodes (fat_tree: minimum)")
+    parser.add_argument('--ingress', type=int, default=3, help="Number of ingress nodes")
+    parser.add_argument('--seed', type=int, default=None, help="Random seed")
+    parser.add_argument('--node-cap', type=parse_range, default=10, help="Node capacity or range, e.g. 5-20")
+    parser.add_argument('--link-cap', type=parse_range, default=1000, help="Link capacity or range")
+    parser.add_argument('--delay', type=parse_range, default=(1, 5),
+                        help="Link delay or range (waxman: derived from node distances)")
+    parser.add_argument('--alpha', type=float, default=None, help="waxman: link probability")
+    parser.add_argument('--beta', type=float, default=None, help="waxman: ratio of long to short links")
+    parser.add_argument('-m', type=int, default=None, help="barabasi_albert: links of every new node")
+    parser.add_argument('--columns', type=int, default=None, help="grid: number of columns")
+    parser.add_argument('-k', type=int, default=None, help="fat_tree: number of ports per switch (even)")
+    parser.add_argument('--degree', type=int, default=None, help="small_world: degree of the ring lattice")
+    # services
+    parser.add_argument('--sfcs', type=int, default=1, help="Number of SFCs")
+    parser.add_argument('--chain-length', type=int, default=3, help="Number of SFs per SFC")
+    parser.add_argument('--num-sfs', type=int, default=None, help="Number of SFs (default: chain length)")
+    parser.add_argument('--resource-functions', nargs='+', default=['linear'], choices=sorted(RESOURCE_FUNCTIONS),
+                        help="Resource functions, assigned to the SFs in turn")
+    parser.add_argument('--processing-delay', type=float, default=5.0, help="Mean processing delay of the SFs")
+    # traffic
+    parser.add_argument('--load', type=float, default=0.5,
+                        help="Target load: expected resource usage relative to the total node capacity")
+    parser.add_argument('--flow-dr', type=float, default=1.0, help="Mean data rate of the flows")
+    parser.add_argument('--flow-size-shape', type=float, default=0.001,
+                        help="Flow size (or Pareto shape of the flow sizes with --pareto)")
+    parser.add_argument('--pareto', action='store_true', help="Pareto-distributed flow sizes")
+    parser.add_argument('--run-duration', type=int, default=100, help="Duration of a run")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    logging.basicConfig(level=logging.INFO)
+    generate(parse_args(args))
+
+
+if __name__ == "__main__":
+    main()
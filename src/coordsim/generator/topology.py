@@ -0,0 +1,158 @@
+"""
+Synthetic network topologies
+
+Topologies are NetworkX graphs with integer node ids and the GraphML attributes read by reader.read_network:
+NodeCap, NodeType ('Ingress' or 'Normal') for nodes and LinkFwdCap, LinkDelay for edges. All models are
+deterministic for a given seed and always return connected graphs.
+"""
+
+import math
+import random
+import networkx as nx
+
+SPEED_OF_LIGHT = 299792458  # meter per second
+PROPAGATION_FACTOR = 0.77
+
+# Model name --> function(num_nodes, seed, **model_kwargs) returning an undirected graph
+TOPOLOGY_MODELS = {}
+
+
+def topology_model(name):
+    def register(function):
+        TOPOLOGY_MODELS[name] = function
+        return function
+    return register
+
+
+@topology_model('waxman')
+def waxman_graph(num_nodes, seed, alpha=0.4, beta=0.1):
+    """ Waxman graph in the unit square; nodes have a 'pos' attribute used for distance-based link delays """
+    graph = nx.waxman_graph(num_nodes, beta=beta, alpha=alpha, seed=seed)
+    return connect_components(graph)
+
+
+@topology_model('barabasi_albert')
+def barabasi_albert_graph(num_nodes, seed, m=2):
+    """ Scale-free graph: every new node attaches to m existing nodes """
+    return nx.barabasi_albert_graph(num_nodes, min(m, num_nodes - 1), seed=seed)
+
+
+@topology_model('grid')
+def grid_graph(num_nodes, seed, columns=None):
+    """ 2D grid with num_nodes nodes (the last row may be incomplete), nearly square unless columns is given """
+    columns = columns or math.ceil(math.sqrt(num_nodes))
+    graph = nx.Graph()
+    graph.add_nodes_from(range(num_nodes))
+    for node in range(num_nodes):
+        if node % columns < columns - 1 and node + 1 < num_nodes:
+            graph.add_edge(node, node + 1)
+        if node + columns < num_nodes:
+            graph.add_edge(node, node + columns)
+    return graph
+
+
+@topology_model('fat_tree')
+def fat_tree_graph(num_nodes, seed, k=None):
+    """
+    Switches of a k-ary fat-tree: (k/2)^2 core switches and k pods of k/2 aggregation and k/2 edge switches
+    (5k^2/4 nodes). Without k, the smallest even k with at least num_nodes switches is used.
+    Nodes have a 'layer' attribute: core, aggregation or edge.
+    """
+    if k is None:
+        k = 2
+        while 5 * k * k // 4 < num_nodes:
+            k += 2
+    if k % 2:
+        raise ValueError(f"Fat-tree k must be even, not {k}")
+    half = k // 2
+    graph = nx.Graph()
+    core = list(range(half * half))
+    graph.add_nodes_from(core, layer='core')
+    next_id = len(core)
+    for pod in range(k):
+        aggregation = list(range(next_id, next_id + half))
+        edge = list(range(next_id + half, next_id + k))
+        next_id += k
+        graph.add_nodes_from(aggregation, layer='aggregation')
+        graph.add_nodes_from(edge, layer='edge')
+        for i, agg in enumerate(aggregation):
+            # aggregation switch i connects to core switches i*k/2 ... (i+1)*k/2-1
+            graph.add_edges_from((agg, core[i * half + j]) for j in range(half))
+            graph.add_edges_from((agg, e) for e in edge)
+    return graph
+
+
+@topology_model('small_world')
+def small_world_graph(num_nodes, seed, degree=4, p=0.1):
+    """ Connected Watts-Strogatz graph (complete graph for very small sizes) """
+    if num_nodes <= degree:
+        return nx.complete_graph(num_nodes)
+    return nx.connected_watts_strogatz_graph(num_nodes, degree, p, seed=seed)
+
+
+def connect_components(graph):
+    """ Connect the components of a graph by linking each component to the closest (by 'pos') node connected so far """
+    components = sorted(nx.connected_components(graph), key=min)
+    positions = nx.get_node_attributes(graph, 'pos')
+    connected = set(components[0]) if components else set()
+    for component in components[1:]:
+        if positions:
+            source, target = min(((s, t) for s in sorted(component) for t in sorted(connected)),
+                                 key=lambda pair: distance(positions[pair[0]], positions[pair[1]]))
+        else:
+            source, target = min(component), min(connected)
+        graph.add_edge(source, target)
+        connected |= component
+    return graph
+
+
+def distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def choose_ingress(graph, num_ingress, rng):
+    """ Random ingress nodes; edge switches of fat-trees first """
+    candidates = [node for node, layer in graph.nodes(data='layer') if layer in (None, 'edge')]
+    if len(candidates) < num_ingress:
+        candidates = list(graph.nodes)
+    return set(rng.sample(sorted(candidates), min(num_ingress, len(candidates))))
+
+
+def create_topology(model, num_nodes, num_ingress, seed=None, node_cap=10, link_cap=1000, delay=(1, 5),
+                    area_km=4000, **model_kwargs):
+    """
+    Return a topology with the attributes of reader.read_network (see module docstring)
+    model: name in TOPOLOGY_MODELS, model_kwargs are passed to the model (e.g. m for barabasi_albert)
+    node_cap, link_cap: capacity of every node/link or (min, max) range of uniformly drawn integer capacities
+    delay: link delay or (min, max) range of uniformly drawn integer delays. Waxman graphs derive the delays from the
+           distance of the nodes, placed in a square of area_km x area_km.
+    """
+    if model not in TOPOLOGY_MODELS:
+        raise ValueError(f"Unknown topology model {model}. Available: {sorted(TOPOLOGY_MODELS)}")
+    rng = random.Random(seed)
+    graph = TOPOLOGY_MODELS[model](num_nodes, seed, **model_kwargs)
+    ingress = choose_ingress(graph, num_ingress, rng)
+    positions = nx.get_node_attributes(graph, 'pos')
+
+    network = nx.Graph()
+    for node in sorted(graph.nodes):
+        network.add_node(node, NodeCap=draw(node_cap, rng), NodeType='Ingress' if node in ingress else 'Normal')
+    for source, target in sorted(tuple(sorted(edge)) for edge in graph.edges):
+        if positions:
+            meters = distance(positions[source], positions[target]) * area_km * 1000
+            link_delay = max(1, round(meters / SPEED_OF_LIGHT * 1000 * PROPAGATION_FACTOR))
+        else:
+            link_delay = draw(delay, rng)
+        network.add_edge(source, target, LinkFwdCap=draw(link_cap, rng), LinkDelay=link_delay)
+    return network
+
+
+def draw(value, rng):
+    """ value itself or a random integer in the (min, max) range """
+    if isinstance(value, (tuple, list)):
+        return rng.randint(value[0], value[1])
+    return value
+
+
+def write_topology(network, path):
+    nx.write_graphml(network, path)
@@ -0,0 +1,111 @@
+"""
+Synthetic services and simulator configs
+
+write_services writes an SFC/SF file (as read by reader.get_sfc and reader.get_sf) and the resource function modules
+it references. load_config returns a simulator config whose arrival rate targets a given load level.
+"""
+
+import os
+import yaml
+
+# Resource function id --> body of resource_function(load)
+RESOURCE_FUNCTIONS = {
+    'linear': "return load",
+    'quadratic': "return load + 0.05 * load ** 2",
+    'sqrt': "return load ** 0.5",
+    'step': "return 2 * math.ceil(load / 2)",
+}
+
+
+def create_services(num_sfcs=1, chain_length=3, num_sfs=None, resource_functions=('linear',),
+                    processing_delay=(5.0, 0.0), startup_delay=0.0):
+    """
+    Return the content of a service file.
+    SFs sf0 ... sf<num_sfs-1> (default: chain_length) are shared by all SFCs: SFC i is the chain of chain_length SFs
+    starting at SF i (modulo num_sfs). SFs use the given resource functions in turn ('linear' is the simulator's
+    default and needs no module).
+    processing_delay: (mean, stdev) of every SF
+    """
+    num_sfs = num_sfs or chain_length
+    if chain_length > num_sfs:
+        raise ValueError(f"Chains of length {chain_length} need at least as many SFs, not {num_sfs}")
+    sfs = [f"sf{i}" for i in range(num_sfs)]
+    sfc_list = {f"sfc_{i + 1}": [sfs[(i + j) % num_sfs] for j in range(chain_length)] for i in range(num_sfcs)}
+    sf_list = {}
+    for i, sf in enumerate(sfs):
+        sf_list[sf] = {'processing_delay_mean': processing_delay[0], 'processing_delay_stdev': processing_delay[1],
+                       'startup_delay': startup_delay}
+        resource_function = resource_functions[i % len(resource_functions)]
+        if resource_function != 'linear':
+            sf_list[sf]['resource_function_id'] = resource_function
+    return {'sfc_list': sfc_list, 'sf_list': sf_list}
+
+
+def write_services(services, path, resource_functions_path=None):
+    """
+    Write a service file and the modules of its resource functions (to resource_functions_path, default: directory
+    'resource_functions' next to the service file). Returns the resource functions path.
+    """
+    with open(path, 'w') as f:
+        yaml.dump(services, f, default_flow_style=False, sort_keys=False)
+    resource_functions_path = resource_functions_path or os.path.join(os.path.dirname(path), 'resource_functions')
+    function_ids = {sf['resource_function_id'] for sf in services['sf_list'].values() if 'resource_function_id' in sf}
+    if function_ids:
+        os.makedirs(resource_functions_path, exist_ok=True)
+    for function_id in function_ids:
+        with open(os.path.join(resource_functions_path, f"{function_id}.py"), 'w') as f:
+            f.write(f"import math\n\n\ndef resource_function(load):\n    {RESOURCE_FUNCTIONS[function_id]}\n")
+    return resource_functions_path
+
+
+def mean_flow_duration(flow_size_shape, deterministic_size, flow_dr_mean):
+    """ Mean flow duration in ms (see Flow): size / dr * 1000, sizes are Pareto(shape) + 1 if not deterministic """
+    if deterministic_size:
+        mean_size = flow_size_shape
+    else:
+        if flow_size_shape <= 1:
+            raise ValueError(f"Pareto flow sizes with shape {flow_size_shape} <= 1 have no mean load")
+        mean_size = flow_size_shape / (flow_size_shape - 1)
+    return mean_size / flow_dr_mean * 1000
+
+
+def load_config(network, services, load=0.5, flow_dr_mean=1.0, flow_size_shape=0.001, deterministic_size=True,
+                run_duration=100, ttl=100, **config):
+    """
+    Return a simulator config whose inter_arrival_mean (per ingress node) offers the given load: the expected
+    resources used by all active flows relative to the total node capacity of the network.
+    Every flow uses flow_dr at every SF of its SFC for processing delay + flow duration (linear resource functions).
+    """
+    ingress = [node for node, node_type in network.nodes(data='NodeType') if node_type == 'Ingress']
+    total_cap = sum(cap for _, cap in network.nodes(data='NodeCap'))
+    sfcs = services['sfc_list']
+    # SFCs are chosen uniformly at random
+    flow_duration = mean_flow_duration(flow_size_shape, deterministic_size, flow_dr_mean)
+    demand_per_flow = 0.0
+    for chain in sfcs.values():
+        for sf in chain:
+            holding_time = services['sf_list'][sf]['processing_delay_mean'] + flow_duration
+            demand_per_flow += flow_dr_mean * holding_time / len(sfcs)
+    # Little's law: load * total_cap = num_ingress / inter_arrival_mean * demand_per_flow
+    inter_arrival_mean = len(ingress) * demand_per_flow / (load * total_cap)
+
+    sim_config = {
+        'inter_arrival_mean': round(inter_arrival_mean, 6),
+        'deterministic_arrival': False,
+        'flow_dr_mean': flow_dr_mean,
+        'flow_dr_stdev': 0.0,
+        'flow_size_shape': flow_size_shape,
+        'deterministic_size': deterministic_size,
+        'run_duration': run_duration,
+        'ttl_choices': [ttl],
+        'use_states': False,
+    }
+    sim_config.update(config)
+    return sim_config
+
+
+def write_config(config, path, load=None):
+    with open(path, 'w') as f:
+        if load is not None:
+            f.write(f"# Generated simulator config targeting a load of {load}\n")
+        yaml.dump(config, f, default_flow_style=False, sort_keys=False)
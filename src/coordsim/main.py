@@ -8,6 +8,8 @@ from coordsim.metrics.metrics import Metrics
 from coordsim.simulation.simulatorparams import SimulatorParams
 import coordsim.network.dummy_data as dummy_data
 from coordsim.trace_processor.trace_processor import TraceProcessor
+from coordsim.trace_processor.compiled_trace import load_trace
+from coordsim.simulation.tracer import create_tracer
 import logging
 import time
 import os
@@ -47,12 +49,14 @@ def main():
     params = SimulatorParams(log, network, ing_nodes, eg_nodes, sfc_list, sf_list, config, metrics,
                              sf_placement=sf_placement, schedule=schedule)
     log.info(params)
+    # Log the flow events (None if INFO is not enabled)
+    params.tracer = create_tracer(params)
 
     # Create a FlowSimulator object, pass the SimPy environment and params objects
     simulator = FlowSimulator(env, params)
     if 'trace_path' in config:
         trace_path = os.path.join(os.getcwd(), config['trace_path'])
-        trace = reader.get_trace(trace_path)
+        trace = load_trace(trace_path)
         TraceProcessor(params, env, trace, simulator)
         log.info("Using trace " + config['trace_path'])
 
@@ -61,6 +65,8 @@ def main():
 
     # Run the simpy environment for the specified duration
     env.run(until=args.duration)
+    if params.tracer is not None:
+        params.tracer.close()
 
     # Record endtime and running_time metrics
     end_time = time.time()
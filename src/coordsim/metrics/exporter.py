@@ -0,0 +1,178 @@
+"""
+Live metrics of a running simulation in the Prometheus text exposition format
+
+The MetricsExporter serves http://<host>:<port>/metrics from a daemon thread. The values are not collected per event:
+a SimPy process takes a snapshot every `interval` simulated time units and the server only renders the last snapshot.
+The number of processed events is derived from SimPy's event id counter, so the hot path is not instrumented at all
+(the event metrics are left out if the counter is not available, see coordsim.simulation.profiler.next_event_id).
+Per-run drop rates are taken from the run_flows rows published by the ResultWriter at the end of every run.
+"""
+
+import logging
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from coordsim.simulation.profiler import next_event_id
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Metric name --> (type, help)
+METRICS = {
+    'coordsim_episode': ('gauge', "Current episode"),
+    'coordsim_sim_time': ('gauge', "Simulated time of the current episode"),
+    'coordsim_sim_time_ratio': ('gauge', "Simulated time per wall-clock second since the previous sample"),
+    'coordsim_events_total': ('counter', "SimPy events scheduled in the current episode"),
+    'coordsim_events_per_second': ('gauge', "SimPy events scheduled per wall-clock second since the previous sample"),
+    'coordsim_event_queue_length': ('gauge', "Events in SimPy's event queue (heap)"),
+    'coordsim_flows_in_flight': ('gauge', "Active flows in the network"),
+    'coordsim_generated_flows_total': ('counter', "Generated flows in the current episode"),
+    'coordsim_processed_flows_total': ('counter', "Successfully processed flows in the current episode"),
+    'coordsim_dropped_flows_total': ('counter', "Dropped flows in the current episode"),
+    'coordsim_run_drop_rate': ('gauge', "Dropped flows / finished flows of the last completed run"),
+    'coordsim_resident_memory_bytes': ('gauge', "Resident set size of the simulator process"),
+    'coordsim_sample_timestamp_seconds': ('gauge', "Wall-clock time of the last sample"),
+}
+
+
+def resident_memory():
+    """ Current RSS in bytes (from /proc, elsewhere the maximum RSS) """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsExporter:
+    """
+    Collects snapshots of the simulation (see module docstring) and serves them over HTTP.
+    interval: simulated time between snapshots (default: run_duration of the attached simulation)
+    """
+    def __init__(self, port=9100, host='127.0.0.1', interval=None):
+        self.host = host
+        self.port = port
+        self.interval = interval
+        self.values = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.env = None
+        self.params = None
+        self.last_sample = None
+        # SimPy event ids consumed by reading the event counter
+        self.counter_reads = 0
+
+    def start(self):
+        """ Start serving in a daemon thread. port 0 picks a free port (see self.port afterwards). """
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format, *args)
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-exporter', daemon=True)
+        self.thread.start()
+        log.info(f"Serving live metrics on http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+            self.thread = None
+
+    def attach(self, env, params):
+        """ Start sampling the simulation of a new episode """
+        self.env = env
+        self.params = params
+        self.last_sample = None
+        self.counter_reads = 0
+        env.process(self.sample_process(env))
+
+    def sample_process(self, env):
+        interval = self.interval or self.params.run_duration
+        while True:
+            self.sample()
+            yield env.timeout(interval)
+
+    def count_events(self):
+        """ Number of events scheduled in the episode, None if SimPy's event id counter is not available """
+        event_id = next_event_id(self.env)
+        if event_id is None:
+            return None
+        # Reading the counter consumes an id, which is harmless (ids only need to be increasing)
+        self.counter_reads += 1
+        return event_id - self.counter_reads + 1
+
+    def sample(self):
+        """ Take a snapshot of the attached simulation """
+        metrics = self.params.metrics.metrics
+        wall_time = time.time()
+        sim_time = self.env.now
+        events = self.count_events()
+        values = {
+            'coordsim_episode': self.params.episode,
+            'coordsim_sim_time': sim_time,
+            'coordsim_flows_in_flight': metrics['total_active_flows'],
+            'coordsim_generated_flows_total': metrics['generated_flows'],
+            'coordsim_processed_flows_total': metrics['processed_flows'],
+            'coordsim_dropped_flows_total': metrics['dropped_flows'],
+            'coordsim_resident_memory_bytes': resident_memory(),
+            'coordsim_sample_timestamp_seconds': wall_time,
+        }
+        if events is not None:
+            values['coordsim_events_total'] = events
+        # SimPy's event queue is private as well
+        queue = getattr(self.env, '_queue', None)
+        if queue is not None:
+            values['coordsim_event_queue_length'] = len(queue)
+        if self.last_sample is not None:
+            last_wall_time, last_sim_time, last_events = self.last_sample
+            elapsed = wall_time - last_wall_time
+            if elapsed > 0:
+                values['coordsim_sim_time_ratio'] = (sim_time - last_sim_time) / elapsed
+                if events is not None and last_events is not None:
+                    values['coordsim_events_per_second'] = (events - last_events) / elapsed
+        self.last_sample = (wall_time, sim_time, events)
+        with self.lock:
+            # Keep values that are not part of this sample (rates, run drop rate)
+            self.values.update(values)
+
+    def update_run_flows(self, table, rows):
+        """ Subscriber of the run_flows table (episode, time, successful_flows, dropped_flows, total_flows) """
+        _, _, successful, dropped, _ = rows[-1]
+        finished = successful + dropped
+        with self.lock:
+            self.values['coordsim_run_drop_rate'] = dropped / finished if finished > 0 else 0.0
+
+    def render(self):
+        """ Return the last snapshot in the Prometheus text format """
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for name, (metric_type, description) in METRICS.items():
+            if name not in values:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {float(values[name])!r}")
+        return '\n'.join(lines) + '\n'
@@ -13,10 +13,17 @@ logger = logging.getLogger(__name__)
 
 
 class Metrics:
+    # Methods timed by the profiler (see coordsim.simulation.profiler)
+    profiled_methods = ('add_requesting_flow', 'add_active_flow', 'remove_active_flow', 'generated_flow',
+                        'completed_flow', 'dropped_flow', 'add_processing_delay', 'add_path_delay',
+                        'add_end2end_delay', 'calc_max_node_usage')
+
     def __init__(self, network, sfs):
         self.metrics = {}
         self.network = network
         self.sfs = sfs
+        # callables listener(flow, reason), called for every dropped flow
+        self.drop_listeners = []
         self.reset_metrics()
 
     def reset_metrics(self):
@@ -162,6 +169,8 @@ class Metrics:
         if flow.ttl <= 0:
             reason = "TTL"
         self.metrics['dropped_flow_reasons'][reason] += 1
+        for listener in self.drop_listeners:
+            listener(flow, reason)
 
     def add_processing_delay(self, delay):
         self.metrics['num_processing_delays'] += 1
@@ -46,3 +46,6 @@ class Flow:
         self.success = False
         self.dropped = False
         self.processing_index = 0
+        # Sampling weight of the flow's actions in the results: None if not decided yet, 0 if not sampled
+        # (see coordsim.writer.flow_sampling)
+        self.trace_weight = None
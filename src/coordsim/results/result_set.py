@@ -0,0 +1,187 @@
+"""
+Cached loader for the results of one test directory
+
+ResultSet loads each result file of a test directory (as written by the ResultWriter, compressed or not) at most
+once into a pandas DataFrame sorted by time. Parsed frames are cached in a binary sidecar file next to the result
+file (.<file>.cache.npz), keyed by the size and modification time of the result file, so later ResultSets of the
+same directory skip the CSV parsing until the result file changes. The sidecar files only contain plain arrays and
+are loaded without pickle, so reading a shared results directory does not execute code from it. They are written to
+a temporary file first and then renamed, so concurrent readers never see a partially written cache.
+"""
+
+import logging
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+from coordsim.writer.compression import find_result_file, read_result_csv
+
+log = logging.getLogger(__name__)
+
+# Table name --> default file name in the test directory
+RESULT_FILES = {
+    'placements': 'placements.csv',
+    'node_metrics': 'node_metrics.csv',
+    'resources': 'resources.csv',
+    'rl_state': 'rl_state.csv',
+    'run_flows': 'run_flows.csv',
+    'metrics': 'metrics.csv',
+    'drop_reasons': 'drop_reasons.csv',
+    'scheduling': 'scheduling.csv',
+    'flow_actions': 'flow_actions.csv',
+    'runtimes': 'runtimes.csv',
+}
+# Tables without a header row
+HEADERLESS_TABLES = {'rl_state'}
+# Increase when the format of the cached frames changes
+CACHE_VERSION = 2
+
+
+def frame_arrays(df):
+    """
+    Return the columns of a frame as arrays for np.savez (column<i>, names in 'columns'), or None if a column cannot
+    be stored without pickle. String columns are stored as str arrays with a mask of the missing values (missing<i>).
+    """
+    arrays = {'columns': np.array([str(column) for column in df.columns], dtype=str)}
+    for i, column in enumerate(df.columns):
+        values = df[column].to_numpy()
+        if values.dtype.kind == 'O':
+            missing = df[column].isna().to_numpy()
+            if not all(isinstance(value, str) for value in values[~missing]):
+                return None
+            values = np.where(missing, '', values).astype(str)
+            arrays[f"missing{i}"] = missing
+        arrays[f"column{i}"] = values
+    return arrays
+
+
+def arrays_frame(data):
+    """ Return the frame of the arrays written by frame_arrays (NpzFile of the cache) """
+    columns = {}
+    for i, name in enumerate(data['columns'].tolist()):
+        values = data[f"column{i}"]
+        if f"missing{i}" in data.files:
+            values = values.astype(object)
+            values[data[f"missing{i}"]] = np.nan
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+class ResultSet:
+    """
+    Results of one test directory.
+    Tables are loaded on first access: result_set['placements'] or result_set.table('placements').
+    Frames have a RangeIndex and are sorted by time (stable, so rows of the same time keep the order of the file).
+    They are shared between all callers and must not be modified.
+    test_dir: directory with the result files
+    files: optional dict table --> file name, overriding the file names of RESULT_FILES
+    cache: read and write the binary sidecar files
+    """
+    def __init__(self, test_dir, files=None, cache=True):
+        self.test_dir = test_dir
+        self.files = dict(RESULT_FILES)
+        if files is not None:
+            self.files.update(files)
+        self.cache = cache
+        self._frames = {}
+        # table --> sorted np.ndarray of the time column
+        self._times = {}
+        # table --> dict node --> np.ndarray of row positions
+        self._node_rows = {}
+
+    def path(self, table):
+        """ Return the path of the file of a table (with compression extension) or None if it does not exist """
+        return find_result_file(os.path.join(self.test_dir, self.files[table]))
+
+    def has(self, table):
+        return self.path(table) is not None
+
+    def __getitem__(self, table):
+        return self.table(table)
+
+    def table(self, table):
+        """ Return the full frame of a table """
+        if table not in self._frames:
+            self._frames[table] = self._load(table)
+            if 'time' in self._frames[table].columns:
+                self._times[table] = self._frames[table]['time'].to_numpy()
+        return self._frames[table]
+
+    def times(self, table):
+        """ Return the distinct times of a table in ascending order """
+        self.table(table)
+        return np.unique(self._times[table])
+
+    def at(self, table, time, episode=None):
+        """ Return all rows of a table at the given time (optionally only of one episode) """
+        df = self.table(table)
+        times = self._times[table]
+        start, end = np.searchsorted(times, time, side='left'), np.searchsorted(times, time, side='right')
+        rows = df.iloc[start:end]
+        if episode is not None:
+            rows = rows[rows['episode'] == episode]
+        return rows
+
+    def between(self, table, start_time, end_time):
+        """ Return all rows of a table with start_time <= time <= end_time """
+        df = self.table(table)
+        times = self._times[table]
+        return df.iloc[np.searchsorted(times, start_time, side='left'):np.searchsorted(times, end_time, side='right')]
+
+    def node(self, table, node, column='node'):
+        """ Return all rows of a table that belong to a node (column: name of the node column), sorted by time """
+        if table not in self._node_rows:
+            self._node_rows[table] = {}
+        node_rows = self._node_rows[table]
+        if column not in node_rows:
+            node_rows[column] = self.table(table).groupby(column, sort=False).indices
+        positions = node_rows[column].get(node)
+        if positions is None:
+            return self.table(table).iloc[0:0]
+        return self.table(table).iloc[positions]
+
+    def _cache_path(self, path):
+        directory, file_name = os.path.split(path)
+        return os.path.join(directory, f".{file_name}.cache.npz")
+
+    def _load(self, table):
+        path = self.path(table)
+        if path is None:
+            raise FileNotFoundError(f"No {self.files[table]} in {self.test_dir}")
+        stat = os.stat(path)
+        key = np.array([CACHE_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        cache_path = self._cache_path(path)
+
+        if self.cache and os.path.exists(cache_path):
+            try:
+                with np.load(cache_path, allow_pickle=False) as data:
+                    if np.array_equal(data['key'], key):
+                        return arrays_frame(data)
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+                # Broken or incompatible cache: parse again
+                log.debug(f"Ignoring cache {cache_path}: {e}")
+
+        df = self._parse(table, path)
+        arrays = frame_arrays(df) if self.cache else None
+        if arrays is not None:
+            # write to a temporary file first: other processes may read the same cache
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, key=key, **arrays)
+                os.replace(tmp_path, cache_path)
+            except OSError as e:
+                log.warning(f"Could not write cache {cache_path}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return df
+
+    def _parse(self, table, path):
+        if table in HEADERLESS_TABLES:
+            df = read_result_csv(path, header=None)
+            df.columns = ['episode', 'time'] + [f"col{i}" for i in range(len(df.columns) - 2)]
+        else:
+            df = read_result_csv(path)
+        if 'time' in df.columns:
+            df = df.sort_values('time', kind='mergesort').reset_index(drop=True)
+        return df
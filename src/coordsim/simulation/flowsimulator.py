@@ -5,6 +5,7 @@ from coordsim.forwarders import *
 from coordsim.flow_generators import *
 from coordsim.flow_processors import *
 from coordsim.decision_maker import *
+from coordsim.simulation.tracer import EventCode
 # from coordsim.metrics import metrics
 
 log = logging.getLogger(__name__)
@@ -38,6 +39,11 @@ class FlowSimulator:
         flow_processor_cls = eval(self.params.flow_processor_class)
         self.FlowProcessor = flow_processor_cls(self.env, self.params)
         assert isinstance(self.FlowProcessor, BaseFlowProcessor)
+        if self.params.profiler is not None:
+            self.params.profiler.instrument(self.FlowGenerator, 'flow_generator')
+            self.params.profiler.instrument(self.DecisionMaker, 'decision_maker')
+            self.params.profiler.instrument(self.FlowForwarder, 'forwarder')
+            self.params.profiler.instrument(self.FlowProcessor, 'processor')
 
     def start(self):
         """
@@ -49,6 +55,9 @@ class FlowSimulator:
         log.info("Total of {} ingress nodes available\n".format(len(self.params.ing_nodes)))
         if self.params.eg_nodes:
             log.info("Total of {} egress nodes available\n".format(len(self.params.eg_nodes)))
+        if self.FlowGenerator.streaming:
+            self.env.process(self.stream_arrivals())
+            return
         for node in self.params.ing_nodes:
             node_id = node[0]
             self.env.process(self.init_arrival(node_id))
@@ -66,14 +75,28 @@ class FlowSimulator:
             self.env.process(self.handle_flow(flow))
             yield self.env.timeout(inter_arr_time)
 
+    def stream_arrivals(self):
+        """
+        Controls flow arrivals at all ingress nodes for streaming flow generators
+        """
+        arrival = self.FlowGenerator.next_arrival()
+        while arrival is not None:
+            arrival_time, node_id = arrival
+            if arrival_time > self.env.now:
+                yield self.env.timeout(arrival_time - self.env.now)
+            self.total_flow_count += 1
+            _, flow = self.FlowGenerator.generate_flow(self.total_flow_count, node_id)
+            self.env.process(self.handle_flow(flow))
+            arrival = self.FlowGenerator.next_arrival()
+
     def handle_flow(self, flow: Flow, decision=False):
         """
         Handles the flow operations
         """
-        self.params.logger.info(
-            "Flow {} generated. arrived at node {} Requesting {} - flow duration: {}ms, "
-            "flow dr: {}. Time: {}".format(flow.flow_id, flow.current_node_id, flow.sfc, flow.duration, flow.dr,
-                                           self.env.now))
+        tracer = self.params.tracer
+        if tracer is not None:
+            tracer.record(EventCode.FLOW_GENERATED, self.env.now, flow.flow_id, flow.current_node_id, sfc=flow.sfc,
+                          value=flow.duration, dr=flow.dr)
         while not flow.departed:
             if decision is False:
                 next_node = yield self.env.process(self.DecisionMaker.decide_next_node(flow))
@@ -107,9 +130,8 @@ class FlowSimulator:
                     self.params.metrics.dropped_flow(flow, "LINK_CAP")
                     return
                 if not flow.forward_to_eg:
-                    self.params.logger.info(
-                        "Flow {} STARTED ARRIVING at node {} for processing. Time: {}"
-                        .format(flow.flow_id, flow.current_node_id, self.env.now))
+                    if tracer is not None:
+                        tracer.record(EventCode.FLOW_ARRIVING, self.env.now, flow.flow_id, flow.current_node_id)
                     if process:
                         flow_processed = yield self.env.process(self.FlowProcessor.process_flow(flow))
                         if not flow_processed:
@@ -131,6 +153,6 @@ class FlowSimulator:
         # Update metrics for the processed flow
         self.params.metrics.completed_flow()
         self.params.metrics.add_end2end_delay(flow.end2end_delay)
-        self.params.logger.info(
-            "Flow {} was processed and departed the network from {}. Time {}"
-            .format(flow.flow_id, flow.current_node_id, self.env.now))
+        tracer = self.params.tracer
+        if tracer is not None:
+            tracer.record(EventCode.FLOW_DEPARTED, self.env.now, flow.flow_id, flow.current_node_id)
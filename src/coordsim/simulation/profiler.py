@@ -0,0 +1,208 @@
+"""
+Per-component profiling of the simulation hot path
+
+The Profiler replaces the methods listed in the `profiled_methods` attribute of a component (flow generator, decision
+maker, forwarder, processor, result writer, metrics) by wrappers that count calls, the wall time spent in the method
+and the SimPy events it schedules, per component, method and node. Nothing is wrapped if profiling is disabled, so
+the instrumentation has no cost then.
+
+Generator methods (SimPy processes, e.g. decide_next_node) are timed while they run, i.e., without the simulated time
+they wait for events; their counters are added when they finish. Times are inclusive: the time of a decision maker
+call contains the writer calls it makes.
+To reduce the overhead, only every sample_interval-th call of a method is timed; the total time is extrapolated from
+the timed calls.
+"""
+
+import functools
+import inspect
+import logging
+from time import perf_counter_ns
+
+log = logging.getLogger(__name__)
+
+PROFILE_COLUMNS = ['component', 'method', 'node', 'calls', 'timed_calls', 'time_ns', 'events']
+
+
+class MethodStats:
+    """ Counters of one component, method and node """
+    __slots__ = ('calls', 'timed_calls', 'time_ns', 'events')
+
+    def __init__(self):
+        self.calls = 0
+        self.timed_calls = 0
+        self.time_ns = 0
+        self.events = 0
+
+    def add(self, time_ns, events):
+        self.timed_calls += 1
+        self.time_ns += time_ns
+        self.events += events
+
+    def estimate(self, value):
+        """ Extrapolate a counter of the timed calls to all calls """
+        if self.timed_calls == 0:
+            return 0
+        return round(value * self.calls / self.timed_calls)
+
+
+def next_event_id(env):
+    """
+    Return the next id of SimPy's event id counter, i.e., the number of events scheduled so far plus the ids consumed
+    by earlier reads, or None if the environment has no such counter. The counter is the private attribute _eid of the
+    SimPy Environment, which other SimPy versions may not have. Reading the counter consumes an id, which does not
+    change the order of events (ids only need to be increasing).
+    """
+    counter = getattr(env, '_eid', None)
+    if counter is None:
+        return None
+    return next(counter)
+
+
+def node_of_call(args):
+    """ Default node of a call: the current node of the flow passed as first argument """
+    if args:
+        return getattr(args[0], 'current_node_id', None)
+    return None
+
+
+class Profiler:
+    """
+    Collects the counters of instrumented components (see module docstring). Counters are per episode.
+    sample_interval: time every n-th call of each method
+    """
+    def __init__(self, sample_interval=1):
+        if sample_interval < 1:
+            raise ValueError(f"Profile sample interval must be >= 1, not {sample_interval}")
+        self.sample_interval = sample_interval
+        # (component, method, node) --> MethodStats
+        self.stats = {}
+        self.episode = None
+        self.env = None
+        # SimPy event ids consumed by counting events
+        self.counter_reads = 0
+        # False if the SimPy environment has no event id counter: events are reported as None
+        self.events_available = True
+
+    def begin_episode(self, episode, env):
+        self.stats = {}
+        self.episode = episode
+        self.env = env
+        self.counter_reads = 0
+        self.events_available = getattr(env, '_eid', None) is not None
+        if not self.events_available:
+            log.warning("SimPy's event id counter is not available, scheduled events are not profiled")
+
+    def count_events(self):
+        """
+        Number of events scheduled so far in the episode, read from SimPy's event id counter (see next_event_id).
+        0 if the counter is not available.
+        """
+        if self.env is None or not self.events_available:
+            return 0
+        count = next_event_id(self.env) - self.counter_reads
+        self.counter_reads += 1
+        return count
+
+    def method_stats(self, component, method, node):
+        key = (component, method, node)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = MethodStats()
+        return stats
+
+    def instrument(self, obj, component, node_of=None):
+        """
+        Wrap the methods obj.profiled_methods of the object (not its class) and return it.
+        node_of(args) returns the node of a call (default: current node of the flow passed as first argument),
+        profiled_nodes (optional attribute of obj) maps method names to their node_of function.
+        """
+        node_functions = getattr(obj, 'profiled_nodes', {})
+        for name in getattr(obj, 'profiled_methods', ()):
+            method = getattr(obj, name)
+            get_node = node_functions.get(name, node_of or node_of_call)
+            if inspect.isgeneratorfunction(method):
+                wrapper = self.wrap_generator(method, component, name, get_node)
+            else:
+                wrapper = self.wrap_function(method, component, name, get_node)
+            setattr(obj, name, wrapper)
+        return obj
+
+    def wrap_function(self, method, component, name, get_node):
+        profiler = self
+        counter = [0]
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            stats = profiler.method_stats(component, name, get_node(args))
+            stats.calls += 1
+            counter[0] += 1
+            if counter[0] % profiler.sample_interval:
+                return method(*args, **kwargs)
+            events = profiler.count_events()
+            start = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats.add(perf_counter_ns() - start, profiler.count_events() - events)
+        return wrapper
+
+    def wrap_generator(self, method, component, name, get_node):
+        profiler = self
+        counter = [0]
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            stats = profiler.method_stats(component, name, get_node(args))
+            stats.calls += 1
+            counter[0] += 1
+            generator = method(*args, **kwargs)
+            if counter[0] % profiler.sample_interval:
+                return generator
+            return profiler.timed(generator, stats)
+        return wrapper
+
+    def timed(self, generator, stats):
+        """ Drive the generator (SimPy process) and time its steps """
+        time_ns = 0
+        events = 0
+        value = None
+        error = None
+        try:
+            while True:
+                start_events = self.count_events()
+                start = perf_counter_ns()
+                try:
+                    if error is None:
+                        event = generator.send(value)
+                    else:
+                        event = generator.throw(error)
+                except StopIteration as stop:
+                    return stop.value
+                finally:
+                    time_ns += perf_counter_ns() - start
+                    events += self.count_events() - start_events
+                try:
+                    value = yield event
+                    error = None
+                except BaseException as e:
+                    value = None
+                    error = e
+        finally:
+            stats.add(time_ns, events)
+
+    def get_profile(self):
+        """
+        Return the counters as a list of dicts with the keys PROFILE_COLUMNS. time_ns and events are extrapolated to
+        all calls. Sorted by time, most expensive first.
+        """
+        profile = []
+        for (component, method, node), stats in self.stats.items():
+            profile.append({'component': component, 'method': method, 'node': node, 'calls': stats.calls,
+                            'timed_calls': stats.timed_calls, 'time_ns': stats.estimate(stats.time_ns),
+                            'events': stats.estimate(stats.events) if self.events_available else None})
+        profile.sort(key=lambda entry: entry['time_ns'], reverse=True)
+        return profile
+
+    def rows(self):
+        """ Profile rows for the result writer: episode followed by PROFILE_COLUMNS """
+        return [[self.episode] + [entry[column] for column in PROFILE_COLUMNS] for entry in self.get_profile()]
@@ -51,6 +51,10 @@ class SimulatorParams:
             self.use_trace = True
 
         self.writer = None
+        # Profiler of the components (see coordsim.simulation.profiler), None if profiling is disabled
+        self.profiler = None
+        # Tracer of flow events (see coordsim.simulation.tracer), None if events are neither logged nor traced
+        self.tracer = None
         self.prediction = prediction  # bool
         self.predicted_inter_arr_mean = {node_id[0]: config['inter_arrival_mean'] for node_id in self.ing_nodes}
 
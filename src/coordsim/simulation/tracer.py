@@ -0,0 +1,234 @@
+"""
+Structured tracing of flow events
+
+The simulation reports flow events to an EventTracer as typed events (an EventCode and numeric fields):
+- If the tracer has a logger that is enabled for its level (checked per event), the event is logged right away with
+  the log message the simulator used to write (see MESSAGES).
+- If the tracer is buffered, the event is recorded into preallocated columns. Node, SFC and SF names are stored as
+  indices into the name tables of the tracer. When the buffer is full (and on flush), the records are passed to the
+  sinks, e.g., BinaryTraceSink appends them to a binary file that can be memory-mapped with read_trace. Without
+  sinks, the buffer is a ring buffer of the most recent events (see snapshot).
+
+create_tracer returns None if the events are neither logged (logger not enabled for INFO when the simulation is set
+up) nor recorded. Hot-path call sites guard the record with `if tracer is not None`, so such a simulation only pays
+one attribute lookup per event.
+"""
+
+import logging
+import os
+from enum import IntEnum
+import numpy as np
+import yaml
+
+MAGIC = b'CSTRACE1'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('record_size', '<u4'), ('reserved', '<u4')])
+TRACE_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('code', 'u1'),
+    ('flow', '<i8'),
+    # indices into the name tables, -1 if not set
+    ('node', '<i4'),
+    ('target', '<i4'),
+    ('sfc', '<i2'),
+    ('sf', '<i2'),
+    ('value', '<f8'),
+])
+
+
+class EventCode(IntEnum):
+    FLOW_GENERATED = 1
+    FLOW_ARRIVING = 2
+    FLOW_DEPARTED = 3
+    FLOW_STAYING = 4
+    FLOW_LEAVING = 5
+    NO_NEXT_NODE = 6
+    LINK_RESERVED = 7
+    LINK_NO_CAP = 8
+    PROCESSING_STARTED = 9
+    SF_STARTED = 10
+    NODE_NO_CAP = 11
+    SF_DEPARTING = 12
+    SF_NOT_FOUND = 13
+
+
+# Log messages of the events. Fields: time, flow, node, target, sfc, sf, value, dr (only logged, not recorded)
+MESSAGES = {
+    EventCode.FLOW_GENERATED: "Flow {flow} generated. arrived at node {node} Requesting {sfc} - flow duration: "
+                              "{value}ms, flow dr: {dr}. Time: {time}",
+    EventCode.FLOW_ARRIVING: "Flow {flow} STARTED ARRIVING at node {node} for processing. Time: {time}",
+    EventCode.FLOW_DEPARTED: "Flow {flow} was processed and departed the network from {node}. Time {time}",
+    EventCode.FLOW_STAYING: "Flow {flow} will stay in node {node}. Time: {time}.",
+    EventCode.FLOW_LEAVING: "Flow {flow} will leave node {node} towards node {target}. Time {time}",
+    EventCode.NO_NEXT_NODE: "No node to forward flow {flow} to. Dropping it",
+    EventCode.LINK_RESERVED: "Flow {flow} started travelling on edge ({node}, {target})",
+    EventCode.LINK_NO_CAP: "No cap on edge ({node}, {target}) to handle {flow}.            Dropping it",
+    EventCode.PROCESSING_STARTED: "Flow {flow} STARTED PROCESSING at node {node} for processing. Time: {time}",
+    EventCode.SF_STARTED: "Flow {flow} started processing at sf {sf} at node {node}. Time: {time}",
+    EventCode.NODE_NO_CAP: "Not enough capacity for flow {flow} at node {node}. Dropping flow.",
+    EventCode.SF_DEPARTING: "Flow {flow} started departing sf {sf} at node {node}. Time {time}",
+    EventCode.SF_NOT_FOUND: "SF {sf} was not found at {node}. Dropping flow {flow}",
+}
+
+
+class EventTracer:
+    """
+    Logs flow events and records them into preallocated column buffers (see module docstring).
+    nodes, sfcs, sfs: name tables; names are stored as their index
+    logger, level: log the events to logger at level (if enabled)
+    buffered: record the events into the buffer (and pass them to the sinks)
+    """
+    def __init__(self, nodes, sfcs, sfs, capacity=65536, sinks=(), logger=None, level=logging.INFO, buffered=True):
+        self.names = {'node': list(nodes), 'sfc': list(sfcs), 'sf': list(sfs) + ['EG']}
+        self.node_index = {node: i for i, node in enumerate(self.names['node'])}
+        self.sfc_index = {sfc: i for i, sfc in enumerate(self.names['sfc'])}
+        self.sf_index = {sf: i for i, sf in enumerate(self.names['sf'])}
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=TRACE_DTYPE[name]) for name in TRACE_DTYPE.names}
+        self.time = self.columns['time']
+        self.code = self.columns['code']
+        self.flow = self.columns['flow']
+        self.node = self.columns['node']
+        self.target = self.columns['target']
+        self.sfc = self.columns['sfc']
+        self.sf = self.columns['sf']
+        self.value = self.columns['value']
+        self.logger = logger
+        self.level = level
+        self.buffered = buffered
+        self.sinks = list(sinks)
+        for sink in self.sinks:
+            sink.open(self.names)
+        # next position in the buffer; total number of recorded events
+        self.position = 0
+        self.num_events = 0
+
+    def add_sink(self, sink):
+        """ Pass all events recorded from now on (and the buffered ones on the next flush) to sink as well """
+        sink.open(self.names)
+        self.sinks.append(sink)
+
+    def record(self, code, time, flow_id, node, target=None, sfc=None, sf=None, value=0.0, dr=None):
+        """ Log and record an event. flow_id must be an integer or a string of an integer. """
+        if self.logger is not None and self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, MESSAGES[code].format(time=time, flow=flow_id, node=node, target=target,
+                                                              sfc=sfc, sf=sf, value=value, dr=dr))
+        if not self.buffered:
+            return
+        i = self.position
+        self.time[i] = time
+        self.code[i] = code
+        self.flow[i] = int(flow_id)
+        self.node[i] = self.node_index.get(node, -1)
+        self.target[i] = self.node_index.get(target, -1)
+        self.sfc[i] = self.sfc_index.get(sfc, -1)
+        self.sf[i] = self.sf_index.get(sf, -1)
+        self.value[i] = value
+        self.num_events += 1
+        self.position = i + 1
+        if self.position == self.capacity:
+            if self.sinks:
+                self.flush()
+            else:
+                self.position = 0
+
+    def records(self, start, end):
+        records = np.empty(end - start, dtype=TRACE_DTYPE)
+        for name, column in self.columns.items():
+            records[name] = column[start:end]
+        return records
+
+    def snapshot(self):
+        """ Return the buffered events as a structured array with TRACE_DTYPE, oldest first """
+        if self.num_events <= self.position or self.sinks:
+            return self.records(0, self.position)
+        return np.concatenate([self.records(self.position, self.capacity), self.records(0, self.position)])
+
+    def flush(self):
+        """ Pass the buffered events to the sinks """
+        if self.sinks and self.position > 0:
+            records = self.records(0, self.position)
+            for sink in self.sinks:
+                sink.write(records)
+            self.position = 0
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+
+def names_path(path):
+    return f"{path}.names"
+
+
+class BinaryTraceSink:
+    """ Append the events to a binary file of TRACE_DTYPE records. The name tables are written to <path>.names. """
+    def __init__(self, path):
+        self.path = path
+        self.stream = None
+
+    def open(self, names):
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self.stream = open(self.path, 'ab')
+        if is_new:
+            header = np.array([(MAGIC, TRACE_DTYPE.itemsize, 0)], dtype=HEADER_DTYPE)
+            self.stream.write(header.tobytes())
+        else:
+            check_header(self.path)
+        with open(names_path(self.path), 'w') as f:
+            yaml.dump(dict(names, codes={code.value: code.name for code in EventCode}), f, default_flow_style=False)
+
+    def write(self, records):
+        self.stream.write(records.tobytes())
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        if self.stream is not None and not self.stream.closed:
+            self.stream.close()
+
+
+def check_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]['magic'] != MAGIC:
+        raise ValueError(f"{path} is not an event trace")
+    if header[0]['record_size'] != TRACE_DTYPE.itemsize:
+        raise ValueError(f"{path} has records of {header[0]['record_size']} bytes, expected {TRACE_DTYPE.itemsize}")
+
+
+def read_trace(path):
+    """
+    Memory-map an event trace.
+    Returns (records, names): read-only structured array with TRACE_DTYPE and the name tables (dict with the lists
+    'node', 'sfc', 'sf' and the dict 'codes': code --> event name)
+    """
+    check_header(path)
+    with open(names_path(path)) as f:
+        names = yaml.safe_load(f)
+    num_records = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // TRACE_DTYPE.itemsize
+    if num_records > 0:
+        records = np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(num_records,))
+    else:
+        records = np.zeros(0, dtype=TRACE_DTYPE)
+    return records, names
+
+
+def create_tracer(params, trace_events=False, path=None, capacity=65536):
+    """
+    Return an EventTracer for the simulation of params, or None if the events are neither logged nor recorded.
+    The events are logged whenever params.logger is enabled for INFO, like the log messages they replace. The level
+    is checked here once: a logger that is not enabled for INFO yet never logs the events of this simulation.
+    trace_events: also record the events: to the binary file path if given, otherwise only to the ring buffer of the
+                  tracer
+    """
+    if not trace_events and not (params.logger is not None and params.logger.isEnabledFor(logging.INFO)):
+        return None
+    sinks = []
+    if trace_events and path is not None:
+        sinks.append(BinaryTraceSink(path))
+    return EventTracer(params.network.nodes, params.sfc_list.keys(), params.sf_list.keys(), capacity=capacity,
+                       sinks=sinks, logger=params.logger, buffered=trace_events)
@@ -0,0 +1,109 @@
+"""
+Compiled traffic traces
+
+A trace CSV (columns time, inter_arrival_mean and optionally node and cap, see TraceProcessor) is compiled once into
+NumPy columns, stably sorted by time:
+- time: float64
+- node: index into the node names, -1 for rows without node (changing all ingress nodes)
+- inter_arrival_mean: float64, NaN for 'None' (node stops generating flows)
+- cap: float64, NaN if not set
+The compiled trace is cached next to the CSV (<trace>.npz) and recompiled when the CSV changes.
+"""
+
+import csv
+import logging
+import os
+import zipfile
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# Bump to invalidate existing caches when the compiled format changes
+FORMAT_VERSION = 1
+
+
+class CompiledTrace:
+    def __init__(self, time, node, inter_arrival_mean, cap, nodes):
+        self.time = time
+        self.node = node
+        self.inter_arrival_mean = inter_arrival_mean
+        self.cap = cap
+        # node names
+        self.nodes = list(nodes)
+
+    def __len__(self):
+        return len(self.time)
+
+    def groups(self):
+        """ Yield (time, start, end) for every timestamp: rows start ... end-1 have this time """
+        if len(self.time) == 0:
+            return
+        starts = np.flatnonzero(np.diff(self.time)) + 1
+        bounds = np.concatenate([[0], starts, [len(self.time)]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            yield self.time[start], int(start), int(end)
+
+
+def parse_value(value):
+    """ Float value of a trace field; NaN for 'None' and empty fields """
+    if value is None or value == '' or value == 'None':
+        return np.nan
+    return float(value)
+
+
+def compile_trace(rows):
+    """ Compile the rows of a trace (dicts of strings, as read by reader.get_trace) """
+    nodes = {}
+    node = np.full(len(rows), -1, dtype=np.int32)
+    time = np.empty(len(rows))
+    inter_arrival_mean = np.empty(len(rows))
+    cap = np.full(len(rows), np.nan)
+    for i, row in enumerate(rows):
+        time[i] = float(row['time'])
+        inter_arrival_mean[i] = parse_value(row['inter_arrival_mean'])
+        if 'node' in row:
+            node[i] = nodes.setdefault(row['node'], len(nodes))
+            if 'cap' in row:
+                cap[i] = parse_value(row['cap'])
+    # stable: rows with the same time keep their order
+    order = np.argsort(time, kind='mergesort')
+    return CompiledTrace(time[order], node[order], inter_arrival_mean[order], cap[order], nodes.keys())
+
+
+def cache_path(trace_file):
+    return f"{trace_file}.npz"
+
+
+def load_trace(trace_file, cache=True):
+    """
+    Return the compiled trace of a trace CSV, from the cache next to it if it is up to date.
+    The cache is written if possible (a read-only trace directory only disables caching).
+    """
+    stat = os.stat(trace_file)
+    # The cache is valid for this version of the CSV
+    key = np.array([FORMAT_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    path = cache_path(trace_file)
+    if cache and os.path.exists(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if np.array_equal(data['key'], key):
+                    return CompiledTrace(data['time'], data['node'], data['inter_arrival_mean'], data['cap'],
+                                         data['nodes'].tolist())
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            log.warning(f"Ignoring invalid trace cache {path}: {e}")
+
+    with open(trace_file) as f:
+        trace = compile_trace(list(csv.DictReader(f)))
+    if cache:
+        # write to a temporary file first: other processes may read the same cache
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, key=key, time=trace.time, node=trace.node, inter_arrival_mean=trace.inter_arrival_mean,
+                         cap=trace.cap, nodes=np.array(trace.nodes, dtype=str))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning(f"Cannot cache the compiled trace at {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return trace
@@ -0,0 +1,163 @@
+"""
+Per-flow traces, e.g., derived from packet captures
+
+A flow trace lists the flows to replay in order of their arrival time. Every record has:
+- time: arrival time (in trace time units, see TraceFlowGenerator)
+- ingress: ingress node of the flow
+- size, dr: flow size and data rate
+- optional sfc, egress, ttl: requested SFC, egress node and TTL. If not set, they are chosen at random like the default
+  flow generator does.
+
+Formats:
+- CSV with a header and the columns above (empty optional fields are not set)
+- binary: a header (MAGIC, record size) and FLOW_RECORD_DTYPE records. Nodes and SFCs are stored as indices into the
+  name tables in <path>.names. Convert a CSV trace with: coord-sim-flow-trace trace.csv trace.bin
+
+Both formats are read in chunks (iter_flow_trace), so traces of any length are replayed with bounded memory.
+"""
+
+import argparse
+import logging
+import os
+import numpy as np
+import yaml
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'CSFLOWS1'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('record_size', '<u4'), ('reserved', '<u4')])
+FLOW_RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('size', '<f8'),
+    ('dr', '<f8'),
+    # -1 if not set
+    ('ttl', '<f8'),
+    # indices into the name tables, -1 if not set
+    ('ingress', '<i4'),
+    ('egress', '<i4'),
+    ('sfc', '<i4'),
+    ('reserved', '<i4'),
+])
+
+
+def names_path(path):
+    return f"{path}.names"
+
+
+def is_binary_trace(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def iter_csv_chunks(path, chunk_size):
+    """ Yield the records of a CSV trace as dicts column name --> array (nodes and SFCs as names, None if not set) """
+    import pandas as pd
+
+    dtypes = {'ingress': str, 'sfc': str, 'egress': str}
+    for chunk in pd.read_csv(path, chunksize=chunk_size, dtype=dtypes):
+        columns = {}
+        for column in ('time', 'size', 'dr'):
+            columns[column] = chunk[column].to_numpy(dtype=float)
+        columns['ingress'] = chunk['ingress'].to_numpy(dtype=object)
+        for column in ('sfc', 'egress'):
+            if column in chunk:
+                columns[column] = chunk[column].astype(object).where(chunk[column].notna(), None).to_numpy()
+            else:
+                columns[column] = np.full(len(chunk), None, dtype=object)
+        if 'ttl' in chunk:
+            columns['ttl'] = chunk['ttl'].fillna(-1).to_numpy(dtype=float)
+        else:
+            columns['ttl'] = np.full(len(chunk), -1.0)
+        yield columns
+
+
+def check_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]['magic'] != MAGIC:
+        raise ValueError(f"{path} is not a binary flow trace")
+    if header[0]['record_size'] != FLOW_RECORD_DTYPE.itemsize:
+        raise ValueError(f"{path} has records of {header[0]['record_size']} bytes, "
+                         f"expected {FLOW_RECORD_DTYPE.itemsize}")
+
+
+def iter_binary_chunks(path, chunk_size):
+    """ Yield the records of a binary trace like iter_csv_chunks """
+    check_header(path)
+    with open(names_path(path)) as f:
+        names = yaml.safe_load(f)
+    nodes = np.array(names['node'] + [None], dtype=object)
+    sfcs = np.array(names['sfc'] + [None], dtype=object)
+    with open(path, 'rb') as f:
+        f.seek(HEADER_DTYPE.itemsize)
+        while True:
+            records = np.fromfile(f, dtype=FLOW_RECORD_DTYPE, count=chunk_size)
+            if len(records) == 0:
+                return
+            # index -1 selects the trailing None
+            yield {
+                'time': records['time'],
+                'size': records['size'],
+                'dr': records['dr'],
+                'ttl': records['ttl'],
+                'ingress': nodes[records['ingress']],
+                'egress': nodes[records['egress']],
+                'sfc': sfcs[records['sfc']],
+            }
+
+
+def iter_flow_trace(path, chunk_size=65536):
+    """ Yield the records of a flow trace (CSV or binary) in chunks of at most chunk_size records """
+    if is_binary_trace(path):
+        return iter_binary_chunks(path, chunk_size)
+    return iter_csv_chunks(path, chunk_size)
+
+
+def index_of(values, index):
+    """ Indices of the values (-1 for None); new names are added to the index (dict name --> index) """
+    indices = np.empty(len(values), dtype='<i4')
+    for i, value in enumerate(values):
+        if value is None:
+            indices[i] = -1
+        else:
+            indices[i] = index.setdefault(value, len(index))
+    return indices
+
+
+def convert_to_binary(csv_path, path, chunk_size=65536):
+    """ Convert a CSV flow trace to a binary one (and its name tables). Returns the number of records. """
+    node_index, sfc_index = {}, {}
+    num_records = 0
+    with open(path, 'wb') as f:
+        f.write(np.array([(MAGIC, FLOW_RECORD_DTYPE.itemsize, 0)], dtype=HEADER_DTYPE).tobytes())
+        for chunk in iter_csv_chunks(csv_path, chunk_size):
+            records = np.zeros(len(chunk['time']), dtype=FLOW_RECORD_DTYPE)
+            for column in ('time', 'size', 'dr', 'ttl'):
+                records[column] = chunk[column]
+            records['ingress'] = index_of(chunk['ingress'], node_index)
+            records['egress'] = index_of(chunk['egress'], node_index)
+            records['sfc'] = index_of(chunk['sfc'], sfc_index)
+            f.write(records.tobytes())
+            num_records += len(records)
+    with open(names_path(path), 'w') as f:
+        yaml.dump({'node': list(node_index), 'sfc': list(sfc_index)}, f, default_flow_style=False)
+    return num_records
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Convert a CSV flow trace to the binary flow trace format")
+    parser.add_argument('csv', help="CSV flow trace (columns: time, ingress, size, dr and optionally sfc, egress, ttl)")
+    parser.add_argument('output', help="Binary flow trace (name tables are written to <output>.names)")
+    parser.add_argument('--chunk-size', type=int, default=65536, help="Records per chunk")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    num_records = convert_to_binary(args.csv, args.output, args.chunk_size)
+    log.info(f"Converted {num_records} flows from {args.csv} to {args.output} "
+             f"({os.path.getsize(args.output)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
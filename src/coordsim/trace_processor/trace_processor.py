@@ -1,6 +1,7 @@
 from coordsim.simulation.simulatorparams import SimulatorParams
 from coordsim.simulation.flowsimulator import FlowSimulator
 from simpy import Environment
+from coordsim.trace_processor.compiled_trace import CompiledTrace, compile_trace
 import numpy as np
 import logging
 log = logging.getLogger(__name__)
@@ -11,11 +12,12 @@ class TraceProcessor():
     Trace processor class
     """
 
-    def __init__(self, params: SimulatorParams, env: Environment, trace: list, simulator: FlowSimulator):
+    def __init__(self, params: SimulatorParams, env: Environment, trace, simulator: FlowSimulator):
+        """ trace: CompiledTrace (see load_trace) or list of trace rows as read by reader.get_trace """
         self.params = params
         self.env = env
-        self.trace_index = 0
-        self.prediction_trace_index = 0
+        if not isinstance(trace, CompiledTrace):
+            trace = compile_trace(trace)
         self.trace = trace
         self.simulator = simulator
         self.env.process(self.process_trace())
@@ -25,30 +27,25 @@ class TraceProcessor():
         Changes the inter arrival mean during simulation
         The initial time is read from the the config file, so if the inter_arrival_time set in the trace CSV
         file does not start from 0, then the simulator will use the value set in sim_config
-
+        All changes with the same time are applied together, one time unit before their time.
         """
-        self.timeout = float(self.trace[self.trace_index]['time']) - self.env.now - 1
-        self.timeout = np.clip(self.timeout, 0, None)
-        inter_arrival_mean = self.trace[self.trace_index]['inter_arrival_mean']
-        yield self.env.timeout(self.timeout)
+        trace = self.trace
+        for time, start, end in trace.groups():
+            timeout = np.clip(float(time) - self.env.now - 1, 0, None)
+            yield self.env.timeout(timeout)
+            for i in range(start, end):
+                self.apply_row(i)
+
+    def apply_row(self, i):
+        trace = self.trace
+        inter_arrival_mean = trace.inter_arrival_mean[i]
+        inter_arrival_mean = None if np.isnan(inter_arrival_mean) else float(inter_arrival_mean)
         log.debug(f"Inter arrival mean changed to {inter_arrival_mean} at {self.env.now}")
-        if 'node' in self.trace[self.trace_index]:
-            node_id = self.trace[self.trace_index]['node']
-            if inter_arrival_mean == 'None':
-                self.params.inter_arr_mean[node_id] = None
-            else:
-                inter_arrival_mean = float(inter_arrival_mean)
-                # old_mean = self.params.inter_arr_mean.get(node_id, None)
-                self.params.inter_arr_mean[node_id] = inter_arrival_mean
-                # Check for changing capacities in the trace file. Currently limited to only increasing capacites.
-                if 'cap' in self.trace[self.trace_index]:
-                    cap = self.trace[self.trace_index]["cap"]
-                    self.params.network.nodes[node_id]["cap"] = float(cap)
-                # if old_mean is None:
-                #     self.env.process(self.simulator.init_arrival(node_id))
+        if trace.node[i] >= 0:
+            node_id = trace.nodes[trace.node[i]]
+            self.params.inter_arr_mean[node_id] = inter_arrival_mean
+            # Check for changing capacities in the trace file. Currently limited to only increasing capacites.
+            if inter_arrival_mean is not None and not np.isnan(trace.cap[i]):
+                self.params.network.nodes[node_id]["cap"] = float(trace.cap[i])
         else:
-            inter_arrival_mean = float(inter_arrival_mean)
             self.params.update_single_inter_arr_mean(inter_arrival_mean)
-        if self.trace_index < len(self.trace) - 1:
-            self.trace_index += 1
-            self.env.process(self.process_trace())
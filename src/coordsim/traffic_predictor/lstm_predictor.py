@@ -4,9 +4,11 @@ from keras.models import Sequential, load_model
 from keras.layers import Dense
 from keras.layers import LSTM
 from coordsim.reader import reader
+from coordsim.trace_processor.compiled_trace import CompiledTrace
 import numpy as np
 import random
 from pickle import load, dump
+import hashlib
 import os
 import argparse
 import matplotlib
@@ -21,7 +23,7 @@ class LSTM_Predictor:
     https://machinelearningmastery.com/time-series-forecasting-long-short-term-memory-network-python/
     """
     def __init__(self, trace, params, training_repeats=10, nb_epochs=3000,
-                 weights_dir=False, poisson_data=False):
+                 weights_dir=False, poisson_data=False, data_seed=None, cache_dir=None, replay=False):
         """
         Initiate the class
         PARAMETERS:
@@ -33,6 +35,13 @@ class LSTM_Predictor:
         run_duration: the simulator interface's run duration.
         weights_dir: path to weights dir. Set to false when training
         poisson: set to True to generate training data randomly based on Poisson process, not the arrival mean
+        data_seed: int: if set, the training data is generated vectorized with its own random generator seeded with
+            data_seed (instead of run by run with the global one) and cached in cache_dir. Ignored with poisson_data.
+        cache_dir: path to the cache dir for generated training data. Defaults to weights_dir
+        replay: set to True to predict the traffic of the trace (requested_traffic) in order: the whole prediction
+            series is computed in one pass and cached in weights_dir, predict_traffic looks it up and ignores its input.
+            Requires weights_dir and data_seed (without poisson_data), so the requested traffic, which the cached
+            predictions are keyed by, is the same in every run
         """
         # Store arguments
         self.trace = trace
@@ -46,6 +55,17 @@ class LSTM_Predictor:
             self.training_mode = False
             self.weights_dir = os.path.join(os.getcwd(), weights_dir)
         self.gen_poisson_data = poisson_data
+        self.data_seed = data_seed
+        self.cache_dir = cache_dir if cache_dir is not None else weights_dir
+        if self.cache_dir:
+            self.cache_dir = os.path.join(os.getcwd(), self.cache_dir)
+        self.replay = replay
+        if replay and not weights_dir:
+            raise ValueError("Replaying predictions requires the weights_dir of a trained model")
+        if replay and (data_seed is None or poisson_data):
+            raise ValueError("Replaying predictions requires data_seed and no poisson_data: otherwise the requested "
+                             "traffic is random and the cached predictions never match")
+        self.prediction_series = None
 
         # array initialized with 0 that will hold training data for the LSTM NN
         # zero is the traffic for the init run of the simulator.
@@ -59,6 +79,10 @@ class LSTM_Predictor:
         self.prepare_model()
 
     def gen_training_data(self):
+        if self.data_seed is not None and not self.gen_poisson_data:
+            self.requested_traffic = self.load_training_data()
+            self.training_data = pd.DataFrame(self.requested_traffic, columns=['requested_data_rate'])
+            return
         self.reset_flow_lists()
         for i in range(len(self.trace)):
             cur_time = float(self.trace[i]['time'])
@@ -74,6 +98,51 @@ class LSTM_Predictor:
                 self.gen_run_data(cur_time, inter_arr_mean)
         self.training_data = pd.DataFrame(self.requested_traffic, columns=['requested_data_rate'])
 
+    def trace_columns(self):
+        """ Returns the times and inter-arrival means of the trace as arrays """
+        if isinstance(self.trace, CompiledTrace):
+            return self.trace.time, self.trace.inter_arrival_mean
+        time = np.array([float(entry['time']) for entry in self.trace])
+        inter_arr_mean = np.array([float(entry['inter_arrival_mean']) for entry in self.trace])
+        return time, inter_arr_mean
+
+    def gen_training_data_vectorized(self, time, inter_arr_mean):
+        """
+        Generate the requested traffic of all runs at once like gen_run_data (without Poisson data), drawing the flow
+        data rates from a random generator seeded with self.data_seed
+        """
+        # runs per trace entry: until the time of the next entry, one run for the last entry
+        num_runs = np.ones(len(time), dtype=int)
+        num_runs[:-1] = np.maximum(np.ceil((time[1:] - time[:-1]) / self.run_duration), 0)
+        inter_arr_mean = np.repeat(inter_arr_mean, num_runs)
+        rng = np.random.RandomState(self.data_seed)
+        flow_drs = rng.normal(self.params.flow_dr_mean, self.params.flow_dr_stdev,
+                              size=(len(inter_arr_mean), self.run_duration))
+        requested_traffic = (self.run_duration / inter_arr_mean) * flow_drs.mean(axis=1)
+        return np.concatenate([[0], requested_traffic]).tolist()
+
+    def load_training_data(self):
+        """
+        Returns the vectorized training data (see gen_training_data_vectorized), from the cache in self.cache_dir if it
+        was generated for the same trace, parameters and seed before
+        """
+        time, inter_arr_mean = self.trace_columns()
+        key = hashlib.sha1()
+        key.update(np.ascontiguousarray(time, dtype=float).tobytes())
+        key.update(np.ascontiguousarray(inter_arr_mean, dtype=float).tobytes())
+        key.update(repr((self.run_duration, self.params.flow_dr_mean, self.params.flow_dr_stdev,
+                         self.data_seed)).encode())
+        cache_file = None
+        if self.cache_dir:
+            cache_file = os.path.join(self.cache_dir, f"training_data_{key.hexdigest()}.npy")
+            if os.path.exists(cache_file):
+                return np.load(cache_file, allow_pickle=False).tolist()
+        requested_traffic = self.gen_training_data_vectorized(time, inter_arr_mean)
+        if cache_file:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            save_cache(cache_file, np.save, np.array(requested_traffic))
+        return requested_traffic
+
     def prepare_prediction_model(self):
         """
         Builds the state of the LSTM to allow for one-step predictions
@@ -102,8 +171,41 @@ class LSTM_Predictor:
         self.scaler, self.train_scaled = self.scale_training_data(self.train)
 
         if self.weights_dir:
-            self.model = load_model(f"{self.weights_dir}/lstm_model.mdl")
-            self.prepare_prediction_model()
+            if self.replay:
+                self.prediction_series = self.load_predictions()
+            else:
+                self.model = load_model(f"{self.weights_dir}/lstm_model.mdl")
+                self.prepare_prediction_model()
+
+    def load_predictions(self):
+        """
+        Returns the predictions for the requested traffic of the trace, from predictions.npz in self.weights_dir if
+        they were computed with the same model, scaler and data before. Otherwise, loads the model and computes them.
+        """
+        key = hashlib.sha1(np.array(self.requested_traffic, dtype=float).tobytes())
+        for file in (f"{self.weights_dir}/lstm_model.mdl", f"{self.weights_dir}/scaler.pkl"):
+            key.update(file_digest(file))
+        key = key.hexdigest()
+        predictions_file = os.path.join(self.weights_dir, "predictions.npz")
+        if os.path.exists(predictions_file):
+            with np.load(predictions_file, allow_pickle=False) as data:
+                if str(data['key']) == key:
+                    return data['predictions']
+        self.model = load_model(f"{self.weights_dir}/lstm_model.mdl")
+        self.prepare_prediction_model()
+        predictions = self.predict_series(self.requested_traffic)
+        save_cache(predictions_file, np.savez, key=np.array(key), predictions=predictions)
+        return predictions
+
+    def predict_series(self, values):
+        """
+        Returns the one-step predictions for a series of traffic values in one forward pass. The stateful model keeps
+        its state between the samples, so this equals calling predict_traffic for every value in order.
+        """
+        values = np.asarray(values, dtype=float)
+        scaled = self.scaler.transform(np.column_stack([values, np.zeros(len(values))]))[:, 0]
+        yhat = self.model.predict(scaled.reshape(len(scaled), 1, 1), batch_size=1)[:, 0]
+        return self.scaler.inverse_transform(np.column_stack([yhat, np.zeros(len(yhat))]))[:, 0]
 
     def train_model(self):
         """
@@ -115,7 +217,15 @@ class LSTM_Predictor:
     def predict_traffic(self, value):
         """
         Returns the predicted traffic rate for the next run based on input traffic
+        In replay mode, returns the next precomputed prediction for the requested traffic of the trace instead.
         """
+        if self.replay:
+            if self.last_prediction_index >= len(self.prediction_series):
+                raise ValueError(f"All {len(self.prediction_series)} precomputed predictions were used")
+            yhat = self.prediction_series[self.last_prediction_index]
+            self.predictions.append(yhat)
+            self.last_prediction_index += 1
+            return yhat
         scaled_value = self.scale_value(self.scaler, value)
         yhat = self.forecast_lstm(self.model, 1, scaled_value)
         # invert scaling
@@ -251,6 +361,30 @@ class LSTM_Predictor:
         dump(self.scaler, open(os.path.join(dest_dir, "scaler.pkl"), "wb"))
 
 
+def save_cache(path, save, *args, **kwargs):
+    """
+    Write a cache file with save(file, *args, **kwargs), e.g. np.save or np.savez, to a temporary file first and
+    rename it then: other processes sharing the directory (e.g. parallel evaluations) may read the same cache file
+    """
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        save(f, *args, **kwargs)
+    os.replace(tmp_file, path)
+
+
+def file_digest(path):
+    """ SHA-1 digest of a file or of all files in a directory """
+    digest = hashlib.sha1()
+    paths = [path]
+    if os.path.isdir(path):
+        paths = sorted(os.path.join(root, file) for root, _, files in os.walk(path) for file in files)
+    for file in paths:
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.digest()
+
+
 class SimConfig:
     """
     Class to hold simulator config parameters similar to SimulatorParams class but more tailored for LSTM use.
@@ -280,7 +414,8 @@ def main():
     params = SimConfig(sim_config)
     print(f"Loaded trace with {len(trace)} entries")
 
-    predictor = LSTM_Predictor(trace, params)
+    data_seed = sim_config.get('lstm_data_seed', None)
+    predictor = LSTM_Predictor(trace, params, data_seed=data_seed, cache_dir=dest_dir)
 
     print("Training LSTM model")
     predictor.train_model()
@@ -290,7 +425,8 @@ def main():
     del predictor
 
     print("Load weights to test prediction")
-    predictor = LSTM_Predictor(trace, params=params, weights_dir=dest_dir)
+    predictor = LSTM_Predictor(trace, params=params, weights_dir=dest_dir, data_seed=data_seed,
+                               replay=sim_config.get('lstm_replay', False))
 
     predictions = []
     for test in predictor.requested_traffic:
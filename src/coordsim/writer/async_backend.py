@@ -0,0 +1,102 @@
+"""
+Asynchronous result writer backend
+
+Decouples result I/O from the simulation: all calls of the wrapped backend run in a dedicated writer thread.
+"""
+
+import logging
+import queue
+import threading
+from coordsim.writer.backends import BaseWriterBackend
+
+log = logging.getLogger(__name__)
+
+
+class AsyncWriterBackend(BaseWriterBackend):
+    """
+    Wraps another backend and runs all of its I/O in a dedicated writer thread.
+    Rows are collected into batches in the simulation thread and handed to the writer thread over a bounded queue.
+    If the queue is full, the simulation blocks until the writer thread caught up (back-pressure).
+    Rows must not be modified after they were passed to write_row or write_rows.
+    """
+    def __init__(self, backend: BaseWriterBackend, queue_size=64, batch_size=1024):
+        super().__init__(backend.test_dir)
+        self.backend = backend
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        # current batch: list of (backend method name, args...) tuples, executed in order by the writer thread
+        self.batch = []
+        self.batch_rows = 0
+        # first exception raised in the writer thread; re-raised in the simulation thread
+        self.error = None
+        self.closed = False
+        # Daemon thread: it must not block interpreter shutdown before the atexit handlers that close it have run
+        self.thread = threading.Thread(target=self.run, name="ResultWriterThread", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """ Writer thread: execute batches until the sentinel (None) arrives """
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    return
+                for method, *args in batch:
+                    getattr(self.backend, method)(*args)
+            except Exception as e:
+                log.exception("Result writer thread failed")
+                if self.error is None:
+                    self.error = e
+            finally:
+                self.queue.task_done()
+
+    def hand_off(self):
+        """ Put the current batch into the queue. Blocks while the queue is full. """
+        if self.error is not None:
+            raise RuntimeError("Result writer thread failed") from self.error
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+            self.batch_rows = 0
+
+    def open_table(self, table, header=None):
+        self.batch.append(('open_table', table, header))
+
+    def write_rows(self, table, rows):
+        batch = self.batch
+        # Coalesce consecutive writes to the same table into one call of the wrapped backend
+        if batch and batch[-1][0] == 'write_rows' and batch[-1][1] == table:
+            batch[-1][2].extend(rows)
+        else:
+            batch.append(('write_rows', table, list(rows)))
+        self.batch_rows += len(rows)
+        if self.batch_rows >= self.batch_size:
+            self.hand_off()
+
+    def begin_episode(self, episode):
+        self.batch.append(('begin_episode', episode))
+
+    def output_path(self, name):
+        return self.backend.output_path(name)
+
+    def flush(self):
+        """ Hand off all pending rows and wait until the writer thread persisted them """
+        self.batch.append(('flush',))
+        self.hand_off()
+        self.queue.join()
+        if self.error is not None:
+            raise RuntimeError("Result writer thread failed") from self.error
+
+    def close(self):
+        """ Write all pending rows, close the wrapped backend and stop the writer thread """
+        if self.closed:
+            return
+        self.closed = True
+        self.batch.append(('close',))
+        try:
+            self.hand_off()
+        finally:
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("Result writer thread failed") from self.error
@@ -0,0 +1,414 @@
+"""
+Result writer backends
+
+The ResultWriter prepares result rows and hands them to a backend, which decides how and where rows are stored.
+Each output is a named table (e.g. 'metrics', 'placements') with an optional header.
+"""
+
+import csv
+import glob
+import logging
+import os
+import socket
+import sqlite3
+import time
+import numpy as np
+from coordsim.writer.compression import COMPRESSION_EXTENSIONS, resolve_compression, open_compressed_writer
+
+log = logging.getLogger(__name__)
+
+# Directory of the shards of the ShardedCSVWriterBackend within the test_dir
+SHARD_DIR = "shards"
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class BaseWriterBackend:
+    """
+    Base Writer Backend class
+    All writer backends must inherit this class
+    """
+    def __init__(self, test_dir, **kwargs):
+        self.test_dir = test_dir
+        # Create the results directory if not exists
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def open_table(self, table, header=None):
+        """ Register a table and write its header (if any) """
+        raise NotImplementedError
+
+    def write_row(self, table, row):
+        """ Write a single row to a table """
+        self.write_rows(table, [row])
+
+    def write_rows(self, table, rows):
+        """ Write a list of rows to a table """
+        raise NotImplementedError
+
+    def begin_episode(self, episode):
+        """ Called before the rows of a new episode are written """
+        pass
+
+    def flush(self):
+        """ Persist all buffered rows """
+        pass
+
+    def close(self):
+        """ Flush and release all resources. Must be safe to call more than once. """
+        raise NotImplementedError
+
+    def output_path(self, name):
+        """ Return the path of an output file that is written next to the tables, e.g. dropped_flows.yaml """
+        return os.path.join(self.test_dir, name)
+
+
+class CSVWriterBackend(BaseWriterBackend):
+    """
+    Default backend: one CSV file per table, written row by row with csv.writer
+    compression: None, 'auto' or a compression of coordsim.writer.compression ('gzip', 'zstd', 'lz4').
+    Compressed tables are written to <table>.csv.<extension>, in blocks of compression_block_size bytes.
+    """
+    def __init__(self, test_dir, compression=None, compression_level=None, compression_block_size=1 << 20,
+                 **kwargs):
+        super().__init__(test_dir)
+        self.compression = resolve_compression(compression)
+        self.compression_level = compression_level
+        self.compression_block_size = compression_block_size
+        self.streams = {}
+        self.writers = {}
+
+    def open_stream(self, path):
+        """ Open a CSV file for appending, adding the extension of the compression to the path """
+        if self.compression is not None:
+            path += COMPRESSION_EXTENSIONS[self.compression]
+        return open_compressed_writer(path, self.compression, self.compression_level, self.compression_block_size)
+
+    def open_table(self, table, header=None):
+        stream = self.open_stream(os.path.join(self.test_dir, f"{table}.csv"))
+        self.streams[table] = stream
+        self.writers[table] = csv.writer(stream)
+        if header is not None:
+            self.writers[table].writerow(header)
+
+    def write_row(self, table, row):
+        self.writers[table].writerow(row)
+
+    def write_rows(self, table, rows):
+        self.writers[table].writerows(rows)
+
+    def flush(self):
+        for stream in self.streams.values():
+            stream.flush()
+
+    def close(self):
+        for stream in self.streams.values():
+            stream.close()
+        self.streams = {}
+        self.writers = {}
+
+
+class ShardedCSVWriterBackend(CSVWriterBackend):
+    """
+    Writes every episode of every table to its own CSV file (shard), so multiple workers can share one test_dir:
+    <test_dir>/shards/<table>/<episode>-<worker>.csv. The header of the table is in <test_dir>/shards/<table>/header.csv
+    Shards have no header, so a table is the header followed by the concatenation of its shards
+    (see coordsim.writer.merge_shards). Rows written before the first episode go to episode 0.
+    Output files other than tables (dropped_flows.yaml, flow_actions.bin, events.bin) are written once per worker:
+    <test_dir>/shards/<file name>/<worker><extension>, e.g. shards/events.bin/<worker>.bin
+    worker: name of this writer, unique among all writers of the test_dir. Default: <host name>-<process id>
+    """
+    def __init__(self, test_dir, worker=None, **kwargs):
+        super().__init__(test_dir, **kwargs)
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.episode = 0
+
+    def open_table(self, table, header=None):
+        table_dir = os.path.join(self.test_dir, SHARD_DIR, table)
+        os.makedirs(table_dir, exist_ok=True)
+        if header is not None:
+            header_path = os.path.join(table_dir, "header.csv")
+            if self.compression is not None:
+                header_path += COMPRESSION_EXTENSIONS[self.compression]
+            # All workers write the same header: only the first one creates the file
+            try:
+                with open(header_path, 'xb'):
+                    pass
+            except FileExistsError:
+                return
+            with self.open_stream(os.path.join(table_dir, "header.csv")) as stream:
+                csv.writer(stream).writerow(header)
+
+    def shard_writer(self, table):
+        """ Return the csv writer of the shard of the current episode, opening the shard if necessary """
+        writer = self.writers.get(table)
+        if writer is None:
+            stream = self.open_stream(os.path.join(self.test_dir, SHARD_DIR, table,
+                                                   f"{self.episode:06d}-{self.worker}.csv"))
+            self.streams[table] = stream
+            writer = self.writers[table] = csv.writer(stream)
+        return writer
+
+    def write_row(self, table, row):
+        self.shard_writer(table).writerow(row)
+
+    def write_rows(self, table, rows):
+        self.shard_writer(table).writerows(rows)
+
+    def begin_episode(self, episode):
+        self.close()
+        self.episode = episode
+
+    def output_path(self, name):
+        file_dir = os.path.join(self.test_dir, SHARD_DIR, name)
+        os.makedirs(file_dir, exist_ok=True)
+        return os.path.join(file_dir, self.worker + os.path.splitext(name)[1])
+
+
+def column_array(values):
+    """
+    Return the values of a column as a typed numpy array. Columns with None (or other objects) become float columns
+    with None as NaN or, if they are not numeric, string columns with None as '' (like in the CSV files).
+    Object arrays would be pickled by np.savez and could not be read with allow_pickle=False.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind != 'O':
+        return array
+    try:
+        return np.array([np.nan if value is None else value for value in values], dtype=float)
+    except (TypeError, ValueError):
+        return np.array(['' if value is None else str(value) for value in values])
+
+
+class ColumnarWriterBackend(BaseWriterBackend):
+    """
+    Buffers rows in typed column arrays and writes them in large chunks to a columnar format.
+    Chunks of table <table> are written to <test_dir>/<table>/part-<n>.<format>.
+    Supported formats: 'npz' (always available), 'parquet' and 'feather' (require pyarrow).
+    'auto' selects parquet if pyarrow is installed and npz otherwise.
+    """
+    # Number of buffered rows that are converted into typed column arrays at once
+    block_size = 4096
+
+    def __init__(self, test_dir, chunk_size=100000, columnar_format='auto', **kwargs):
+        super().__init__(test_dir)
+        if columnar_format == 'auto':
+            columnar_format = 'parquet' if pyarrow is not None else 'npz'
+        if columnar_format not in ('npz', 'parquet', 'feather'):
+            raise ValueError(f"Unknown columnar format {columnar_format}")
+        if columnar_format != 'npz' and pyarrow is None:
+            raise ImportError(f"Writing {columnar_format} chunks requires pyarrow")
+        self.format = columnar_format
+        self.chunk_size = chunk_size
+        self.headers = {}
+        # number of columns of the rows of each table
+        self.widths = {}
+        # rows not yet converted to column arrays: table --> list of rows
+        self.pending_rows = {}
+        # typed column blocks: table --> list of dicts (column name --> np.ndarray)
+        self.blocks = {}
+        self.num_rows = {}
+        self.next_part = {}
+
+    def open_table(self, table, header=None):
+        os.makedirs(os.path.join(self.test_dir, table), exist_ok=True)
+        self.headers[table] = header
+        if header is not None:
+            self.widths[table] = len(header)
+        self.pending_rows[table] = []
+        self.blocks[table] = []
+        self.num_rows[table] = 0
+        # Continue numbering if the directory already contains chunks (same append semantics as the CSV backend)
+        self.next_part[table] = len(glob.glob(os.path.join(self.test_dir, table, "part-*")))
+
+    def write_rows(self, table, rows):
+        pending = self.pending_rows[table]
+        pending.extend(rows)
+        self.num_rows[table] += len(rows)
+        if len(pending) >= self.block_size:
+            self._convert_pending(table)
+        if self.num_rows[table] >= self.chunk_size:
+            self._write_chunk(table)
+
+    def _column_names(self, table, num_columns):
+        header = self.headers[table]
+        if header is None:
+            return [f"col{i}" for i in range(num_columns)]
+        return list(header)
+
+    def _convert_pending(self, table):
+        """ Transpose the pending rows into one block of typed numpy columns """
+        pending = self.pending_rows[table]
+        if not pending:
+            return
+        # All rows of a table must have the same width: the header's or, without header, the first row's
+        width = self.widths.setdefault(table, len(pending[0]))
+        for row in pending:
+            if len(row) != width:
+                raise ValueError(f"Row of table {table} has {len(row)} columns, expected {width}: {row}")
+        columns = list(zip(*pending))
+        names = self._column_names(table, len(columns))
+        self.blocks[table].append({name: column_array(col) for name, col in zip(names, columns)})
+        self.pending_rows[table] = []
+
+    def _write_chunk(self, table):
+        self._convert_pending(table)
+        blocks = self.blocks[table]
+        if not blocks:
+            return
+        columns = {}
+        for name in blocks[0].keys():
+            arrays = [block[name] for block in blocks]
+            kinds = {array.dtype.kind for array in arrays}
+            # Mixed numeric and string blocks cannot be promoted safely: store the column as strings
+            if len(kinds) > 1 and 'U' in kinds:
+                arrays = [array.astype(str) for array in arrays]
+            columns[name] = np.concatenate(arrays)
+
+        part = self.next_part[table]
+        path = os.path.join(self.test_dir, table, f"part-{part:05d}.{self.format}")
+        if self.format == 'npz':
+            np.savez(path, **columns)
+        else:
+            arrow_table = pyarrow.table({name: pyarrow.array(col) for name, col in columns.items()})
+            if self.format == 'parquet':
+                pyarrow.parquet.write_table(arrow_table, path)
+            else:
+                pyarrow.feather.write_feather(arrow_table, path)
+        log.debug(f"Wrote {self.num_rows[table]} rows of table {table} to {path}")
+
+        self.next_part[table] += 1
+        self.blocks[table] = []
+        self.num_rows[table] = 0
+
+    def flush(self):
+        for table in self.blocks.keys():
+            self._write_chunk(table)
+
+    def close(self):
+        self.flush()
+
+
+def read_columnar_table(test_dir, table):
+    """
+    Read all chunks of a table written by the ColumnarWriterBackend and return them as one pandas DataFrame
+    """
+    import pandas as pd
+
+    frames = []
+    for path in sorted(glob.glob(os.path.join(test_dir, table, "part-*"))):
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                frames.append(pd.DataFrame({name: data[name] for name in data.files}))
+        elif path.endswith(".parquet"):
+            frames.append(pd.read_parquet(path))
+        elif path.endswith(".feather"):
+            frames.append(pd.read_feather(path))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+class SQLiteWriterBackend(BaseWriterBackend):
+    """
+    Stores all tables in one SQLite database that can be shared by many experiments (also running in parallel).
+    Each backend instance registers a new experiment in the 'experiments' table; every row of the result tables is
+    stored with its experiment_id. Tables with episode and time columns are indexed by (experiment_id, episode, time).
+    Metadata of an experiment (e.g. network and config file) is stored in 'experiment_meta' as key/value pairs.
+    Rows are buffered per table and inserted with executemany in one transaction every batch_size rows and on flush.
+
+    Example: drop rates of all runs of all experiments on one topology
+        SELECT r.dropped_flows * 1.0 / r.total_flows FROM run_flows r
+        JOIN experiment_meta m ON m.experiment_id = r.experiment_id
+        WHERE m.key = 'network' AND m.value = 'abilene.graphml' AND r.total_flows > 0
+
+    database: path of the database file, default: <test_dir>/results.sqlite
+    experiment: dict of metadata of the experiment
+    """
+    def __init__(self, test_dir, database=None, experiment=None, batch_size=10000, **kwargs):
+        super().__init__(test_dir)
+        self.database = database or os.path.join(test_dir, "results.sqlite")
+        self.batch_size = batch_size
+        # Accessed only by one thread at a time, but possibly not the creating one (see AsyncWriterBackend)
+        self.connection = sqlite3.connect(self.database, timeout=60, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.insert_statements = {}
+        # tables without header
+        self.headerless = set()
+        self.pending_rows = {}
+        self.num_pending = 0
+
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS experiments (experiment_id INTEGER PRIMARY KEY, "
+                                    "name TEXT, created REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS experiment_meta (experiment_id INTEGER, key TEXT, "
+                                    "value TEXT)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS experiment_meta_key "
+                                    "ON experiment_meta (key, value, experiment_id)")
+            cursor = self.connection.execute("INSERT INTO experiments (name, created) VALUES (?, ?)",
+                                             (test_dir, time.time()))
+            self.experiment_id = cursor.lastrowid
+            self.connection.executemany("INSERT INTO experiment_meta VALUES (?, ?, ?)",
+                                        [(self.experiment_id, key, str(value))
+                                         for key, value in (experiment or {}).items()])
+
+    def open_table(self, table, header=None):
+        # Rows of tables without header (rl_state) have no fixed length: store them as comma separated text
+        columns = list(header) if header is not None else ['row']
+        with self.connection:
+            quoted = ', '.join(f'"{column}"' for column in columns)
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (experiment_id INTEGER, {quoted})')
+            # Add columns that were added to the output after the database was created
+            existing = {row[1] for row in self.connection.execute(f'PRAGMA table_info("{table}")')}
+            for column in columns:
+                if column not in existing:
+                    self.connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+            if 'episode' in columns and 'time' in columns:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_experiment_episode_time" '
+                                        f'ON "{table}" (experiment_id, episode, time)')
+        placeholders = ', '.join('?' * (len(columns) + 1))
+        self.insert_statements[table] = f'INSERT INTO "{table}" (experiment_id, {quoted}) VALUES ({placeholders})'
+        self.pending_rows[table] = []
+        if header is None:
+            self.headerless.add(table)
+        else:
+            self.headerless.discard(table)
+
+    def write_rows(self, table, rows):
+        experiment_id = self.experiment_id
+        if table in self.headerless:
+            rows = [[','.join(str(value) for value in row)] for row in rows]
+        self.pending_rows[table].extend((experiment_id, *row) for row in rows)
+        self.num_pending += len(rows)
+        if self.num_pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.num_pending == 0:
+            return
+        with self.connection:
+            for table, rows in self.pending_rows.items():
+                if rows:
+                    self.connection.executemany(self.insert_statements[table], rows)
+                    self.pending_rows[table] = []
+        self.num_pending = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+
+
+# Writer backends selectable with the 'writer_backend' option of the simulator config
+WRITER_BACKENDS = {
+    'csv': CSVWriterBackend,
+    'columnar': ColumnarWriterBackend,
+    'sqlite': SQLiteWriterBackend,
+    'sharded': ShardedCSVWriterBackend,
+}
@@ -0,0 +1,130 @@
+"""
+Streaming compression of result files
+
+Result files can be written through a compressing stream: gzip is always available, zstd and lz4 if the
+zstandard and lz4 packages are installed. The compression is visible in the file extension (e.g. metrics.csv.zst).
+Files are opened in append mode, which adds a new gzip member / zstd or lz4 frame; readers handle these
+concatenated streams transparently.
+Loaders should open result files with open_result_file or read_result_csv, which find and decompress the file
+no matter which compression (if any) was used to write it.
+"""
+
+import gzip
+import io
+import os
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# Compression name --> file extension
+COMPRESSION_EXTENSIONS = {
+    'gzip': '.gz',
+    'zstd': '.zst',
+    'lz4': '.lz4',
+}
+
+
+def available_compressions():
+    """ Return the names of all compressions that can be used in this environment, best first """
+    compressions = []
+    if zstandard is not None:
+        compressions.append('zstd')
+    if lz4 is not None:
+        compressions.append('lz4')
+    compressions.append('gzip')
+    return compressions
+
+
+def resolve_compression(compression):
+    """
+    Return the compression name for the 'compression' option: None/'none' for uncompressed output,
+    'auto' for the best available compression or the name of a compression
+    """
+    if compression in (None, 'none', False):
+        return None
+    if compression == 'auto':
+        return available_compressions()[0]
+    if compression not in COMPRESSION_EXTENSIONS:
+        raise ValueError(f"Unknown compression {compression}")
+    if compression not in available_compressions():
+        raise ImportError(f"Compression {compression} requires the "
+                          f"{'zstandard' if compression == 'zstd' else compression} package")
+    return compression
+
+
+def compression_of(path):
+    """ Return the compression name of a file based on its extension or None if it is not compressed """
+    for compression, extension in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def open_compressed_binary(path, mode, compression, level=None):
+    """ Open a binary (de)compressing stream. mode: 'rb', 'wb' or 'ab'. level None uses the library default. """
+    if compression is None:
+        return open(path, mode)
+    if compression == 'gzip':
+        if level is None:
+            return gzip.open(path, mode)
+        return gzip.open(path, mode, compresslevel=level)
+    if compression == 'zstd':
+        if mode == 'rb':
+            return zstandard.open(path, mode)
+        cctx = zstandard.ZstdCompressor() if level is None else zstandard.ZstdCompressor(level=level)
+        return zstandard.open(path, mode, cctx=cctx)
+    if compression == 'lz4':
+        if mode == 'rb' or level is None:
+            return lz4.frame.open(path, mode)
+        return lz4.frame.open(path, mode, compression_level=level)
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def open_compressed_writer(path, compression, level=None, block_size=1 << 20):
+    """
+    Open a text stream that appends to a (compressed) file.
+    Text is collected in blocks of block_size bytes before it is passed to the compressor.
+    """
+    if compression is None:
+        return open(path, 'a+', newline='')
+    raw = open_compressed_binary(path, 'ab', compression, level)
+    return io.TextIOWrapper(io.BufferedWriter(raw, buffer_size=block_size), newline='')
+
+
+def find_result_file(path):
+    """
+    Return the path of an existing result file, which may have been written compressed:
+    path itself if it exists, otherwise path with the extension of a compression. None if there is no such file.
+    """
+    if os.path.exists(path):
+        return path
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if os.path.exists(path + extension):
+            return path + extension
+    return None
+
+
+def open_result_file(path, newline=None):
+    """ Open a result file for reading as text, decompressing it if necessary. See find_result_file. """
+    found = find_result_file(path)
+    if found is None:
+        raise FileNotFoundError(f"No result file {path}")
+    compression = compression_of(found)
+    if compression is None:
+        return open(found, 'r', newline=newline)
+    return io.TextIOWrapper(open_compressed_binary(found, 'rb', compression), newline=newline)
+
+
+def read_result_csv(path, **kwargs):
+    """ pandas.read_csv for (possibly compressed) result files. See find_result_file. """
+    import pandas as pd
+
+    with open_result_file(path) as f:
+        return pd.read_csv(f, **kwargs)
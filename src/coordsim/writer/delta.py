@@ -0,0 +1,129 @@
+"""
+Delta encoding for the schedule and placement outputs
+
+Instead of writing the full schedule and placement every time, only changed entries are written. Every row has an
+'op' column:
+- 'k': entry of a keyframe. A keyframe contains the full state and is written every keyframe_interval writes.
+- 'u': entry added or value changed since the last write
+- 'd': entry removed since the last write
+DeltaTable rebuilds the full table at any point in time from such rows.
+"""
+
+import pandas as pd
+from coordsim.writer.compression import read_result_csv
+
+_MISSING = object()
+
+
+class DeltaEncoder:
+    """
+    Keeps the last written state of one output and computes the changes to a new state.
+    A state is a dict: key (tuple) --> value. The encoder is reset at the beginning of each episode.
+    """
+    def __init__(self, keyframe_interval=100):
+        self.keyframe_interval = keyframe_interval
+        self.episode = None
+        self.state = {}
+        self.num_encoded = 0
+
+    def encode(self, episode, state: dict) -> list:
+        """
+        Return the changes from the last state to the given state as list of (op, key, value) tuples
+        """
+        if episode != self.episode:
+            self.episode = episode
+            self.state = {}
+            self.num_encoded = 0
+        # An empty state is written as deltas: a keyframe without any entries would not be visible in the output
+        if self.num_encoded % self.keyframe_interval == 0 and state:
+            changes = [('k', key, value) for key, value in state.items()]
+        else:
+            changes = [('u', key, value) for key, value in state.items() if self.state.get(key, _MISSING) != value]
+            changes.extend(('d', key, value) for key, value in self.state.items() if key not in state)
+        self.state = state
+        self.num_encoded += 1
+        return changes
+
+
+class DeltaTable:
+    """
+    Rebuilds full tables from a delta-encoded output.
+    df: DataFrame of a delta-encoded output (columns: episode, time, op, key columns, value columns)
+    """
+    def __init__(self, df: pd.DataFrame, key_columns: list, value_columns: list = ()):
+        self.key_columns = list(key_columns)
+        self.value_columns = list(value_columns)
+        self.episodes = {episode: group.reset_index(drop=True) for episode, group in df.groupby('episode')}
+
+    def at(self, time, episode=None) -> pd.DataFrame:
+        """
+        Return the full table (columns: episode, time, key columns, value columns) as it was at the given time.
+        If no episode is given, the last episode is used.
+        """
+        if episode is None:
+            episode = max(self.episodes.keys())
+        df = self.episodes[episode]
+        df = df[df['time'] <= time]
+        keyframe_times = df.loc[df['op'] == 'k', 'time']
+        if len(keyframe_times) > 0:
+            df = df[df['time'] >= keyframe_times.max()]
+        state = {}
+        self._apply(state, df)
+        return self._to_frame(state, episode, time)
+
+    def expand(self, times, episode=None) -> pd.DataFrame:
+        """
+        Return the full tables at all given times concatenated in one DataFrame, i.e., the output of the non-delta mode
+        """
+        if episode is None:
+            episode = max(self.episodes.keys())
+        df = self.episodes[episode]
+        frames = []
+        state = {}
+        last_time = None
+        for time in sorted(times):
+            if last_time is None:
+                rows = df[df['time'] <= time]
+            else:
+                rows = df[(df['time'] > last_time) & (df['time'] <= time)]
+            self._apply(state, rows)
+            frames.append(self._to_frame(state, episode, time))
+            last_time = time
+        if not frames:
+            return self._to_frame({}, episode, None)
+        return pd.concat(frames, ignore_index=True)
+
+    def _apply(self, state, rows):
+        """ Apply delta rows (in order) to the state dict """
+        columns = ['time', 'op'] + self.key_columns + self.value_columns
+        num_keys = len(self.key_columns)
+        last_keyframe = None
+        for row in rows[columns].itertuples(index=False):
+            time, op = row[0], row[1]
+            key = tuple(row[2:2 + num_keys])
+            if op == 'k':
+                # the first entry of a new keyframe replaces the complete state
+                if time != last_keyframe:
+                    state.clear()
+                    last_keyframe = time
+                state[key] = tuple(row[2 + num_keys:])
+            elif op == 'u':
+                state[key] = tuple(row[2 + num_keys:])
+            elif op == 'd':
+                state.pop(key, None)
+            else:
+                raise ValueError(f"Unknown delta operation {op}")
+
+    def _to_frame(self, state, episode, time):
+        rows = [[episode, time, *key, *value] for key, value in state.items()]
+        return pd.DataFrame(rows, columns=['episode', 'time'] + self.key_columns + self.value_columns)
+
+
+def load_scheduling_deltas(path) -> DeltaTable:
+    """ Load scheduling_delta.csv (compressed or not) """
+    return DeltaTable(read_result_csv(path), ['origin_node', 'sfc', 'sf', 'schedule_node'], ['schedule_prob'])
+
+
+def load_placement_deltas(path) -> DeltaTable:
+    """ Load placements_delta.csv (compressed or not) """
+    return DeltaTable(read_result_csv(path), ['node', 'sf'])
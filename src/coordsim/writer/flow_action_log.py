@@ -0,0 +1,134 @@
+"""
+Binary per-flow action log
+
+Append-only log of fixed-width records, one per flow action (as written by ResultWriter.write_flow_action).
+Node ids are interned: records store an index into a node table that is kept in a text file next to the log
+(one node id per line, '<log>.nodes'). Time is stored as float64 to stay exact in long episodes; all other
+measurements are float32. The log can be memory-mapped into a NumPy structured array without parsing.
+"""
+
+import os
+import numpy as np
+
+MAGIC = b'CSFLOWA1'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('record_size', '<u4'), ('reserved', '<u4')])
+FLOW_ACTION_DTYPE = np.dtype([
+    ('episode', '<u4'),
+    ('time', '<f8'),
+    ('flow_id', '<i8'),
+    ('flow_rem_ttl', '<f4'),
+    ('flow_ttl', '<f4'),
+    # node table indices, -1 if there is no (destination) node
+    ('curr_node_id', '<i4'),
+    ('dest_node', '<i4'),
+    ('cur_node_rem_cap', '<f4'),
+    ('next_node_rem_cap', '<f4'),
+    ('link_cap', '<f4'),
+    ('link_rem_cap', '<f4'),
+    # number of flows the flow represents if flow actions are sampled, otherwise 1
+    ('sample_weight', '<f4'),
+])
+
+
+def node_table_path(path):
+    return f"{path}.nodes"
+
+
+def read_node_table(path):
+    """ Return the list of interned node ids of a log. Index in the list == id stored in the records. """
+    if not os.path.exists(node_table_path(path)):
+        return []
+    with open(node_table_path(path)) as f:
+        return f.read().splitlines()
+
+
+class FlowActionLog:
+    """
+    Writer for the binary per-flow action log.
+    Records are collected in a preallocated structured array and appended to the file in blocks.
+    """
+    def __init__(self, path, block_size=8192):
+        self.path = path
+        self.nodes = read_node_table(path)
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.buffer = np.zeros(block_size, dtype=FLOW_ACTION_DTYPE)
+        self.num_buffered = 0
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.stream = open(path, 'ab')
+        if is_new:
+            header = np.array([(MAGIC, FLOW_ACTION_DTYPE.itemsize, 0)], dtype=HEADER_DTYPE)
+            self.stream.write(header.tobytes())
+        else:
+            check_header(path)
+        self.node_stream = open(node_table_path(path), 'a')
+
+    def intern(self, node_id):
+        """ Return the index of a node id in the node table, adding it if necessary """
+        if node_id is None:
+            return -1
+        index = self.node_index.get(node_id)
+        if index is None:
+            index = len(self.nodes)
+            self.nodes.append(node_id)
+            self.node_index[node_id] = index
+            self.node_stream.write(f"{node_id}\n")
+        return index
+
+    def write(self, episode, time, flow_id, flow_rem_ttl, flow_ttl, curr_node_id, dest_node, cur_node_rem_cap,
+              next_node_rem_cap, link_cap, link_rem_cap, sample_weight=1):
+        """ Append one flow action. Flow ids must be integers or strings of integers. """
+        self.buffer[self.num_buffered] = (episode, time, int(flow_id), flow_rem_ttl, flow_ttl,
+                                          self.intern(curr_node_id), self.intern(dest_node), cur_node_rem_cap,
+                                          next_node_rem_cap, link_cap, link_rem_cap, sample_weight)
+        self.num_buffered += 1
+        if self.num_buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        # The node table has to be on disk before any record referencing it
+        self.node_stream.flush()
+        if self.num_buffered > 0:
+            self.stream.write(self.buffer[:self.num_buffered].tobytes())
+            self.num_buffered = 0
+        self.stream.flush()
+
+    def close(self):
+        if not self.stream.closed:
+            self.flush()
+            self.stream.close()
+            self.node_stream.close()
+
+
+def check_header(path):
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]['magic'] != MAGIC:
+        raise ValueError(f"{path} is not a flow action log")
+    if header[0]['record_size'] != FLOW_ACTION_DTYPE.itemsize:
+        raise ValueError(f"{path} has records of {header[0]['record_size']} bytes, "
+                         f"expected {FLOW_ACTION_DTYPE.itemsize}")
+
+
+def read_flow_action_log(path, as_frame=False):
+    """
+    Memory-map a flow action log.
+    Returns:
+        - (records, nodes): read-only structured array with FLOW_ACTION_DTYPE and the node table (list of node ids)
+        - or, if as_frame: a pandas DataFrame with the node columns as categoricals of node ids
+    """
+    check_header(path)
+    nodes = read_node_table(path)
+    num_records = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // FLOW_ACTION_DTYPE.itemsize
+    if num_records > 0:
+        records = np.memmap(path, dtype=FLOW_ACTION_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize,
+                            shape=(num_records,))
+    else:
+        records = np.zeros(0, dtype=FLOW_ACTION_DTYPE)
+    if not as_frame:
+        return records, nodes
+
+    import pandas as pd
+    df = pd.DataFrame(records)
+    for column in ('curr_node_id', 'dest_node'):
+        df[column] = pd.Categorical.from_codes(records[column], categories=nodes)
+    return df
@@ -0,0 +1,96 @@
+"""
+Per-flow sampling of flow actions
+
+Samplers decide once per flow whether all of its actions are written, based on a hash of the flow id, so the
+decision is deterministic and the same for every hop of the flow. The decision is stored in flow.trace_weight:
+None if not decided yet, 0 if the flow is not sampled, otherwise the sampling weight of the flow (the number of
+flows it represents). Weighting the sampled flows with their trace_weight gives unbiased estimates of totals.
+"""
+
+import heapq
+import zlib
+
+
+def flow_hash(flow_id):
+    """ Deterministic 32 bit hash of a flow id (independent of PYTHONHASHSEED) """
+    return zlib.crc32(str(flow_id).encode())
+
+
+class HashFlowSampler:
+    """
+    Traces 1 in rate flows: all flows whose hash is divisible by rate. Sampled flows have weight rate.
+    """
+    def __init__(self, rate):
+        if rate < 1:
+            raise ValueError(f"Flow sample rate must be >= 1, not {rate}")
+        self.rate = rate
+
+    def offer(self, flow, record):
+        """ Return the list of (record, weight) tuples to write now """
+        if flow.trace_weight is None:
+            flow.trace_weight = self.rate if flow_hash(flow.flow_id) % self.rate == 0 else 0
+        if flow.trace_weight:
+            return [(record, flow.trace_weight)]
+        return []
+
+    def end_run(self):
+        return []
+
+
+class ReservoirFlowSampler:
+    """
+    Traces up to size flows of each run: of all flows with their first action in a run, the size flows with the
+    smallest hashes (bottom-k sample). The sample of a run is only known at its end, so actions of candidate flows are
+    buffered until end_run. Sampled flows have weight <number of flows of the run> / size (at least 1).
+    Actions of sampled flows in later runs are written immediately, so the output is only ordered by time per run.
+    """
+    def __init__(self, size):
+        if size < 1:
+            raise ValueError(f"Flow sample size must be >= 1, not {size}")
+        self.size = size
+        # max-heap of candidate flows of the current run: (-hash, flow id)
+        self.heap = []
+        # flow id --> (flow, list of buffered (sequence number, record))
+        self.candidates = {}
+        self.num_flows = 0
+        self.num_offered = 0
+
+    def offer(self, flow, record):
+        if flow.trace_weight is not None:
+            return [(record, flow.trace_weight)] if flow.trace_weight else []
+        self.num_offered += 1
+        candidate = self.candidates.get(flow.flow_id)
+        if candidate is not None:
+            candidate[1].append((self.num_offered, record))
+            return []
+
+        # First action of the flow in this run
+        self.num_flows += 1
+        key = (-flow_hash(flow.flow_id), flow.flow_id)
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, key)
+        elif key > self.heap[0]:
+            # Smaller hash than the largest candidate: replace it
+            _, evicted_id = heapq.heapreplace(self.heap, key)
+            evicted_flow, _ = self.candidates.pop(evicted_id)
+            evicted_flow.trace_weight = 0
+        else:
+            flow.trace_weight = 0
+            return []
+        self.candidates[flow.flow_id] = (flow, [(self.num_offered, record)])
+        return []
+
+    def end_run(self):
+        """ Decide the sample of the run and return the buffered (record, weight) tuples of the sampled flows """
+        weight = max(self.num_flows / self.size, 1)
+        buffered = []
+        for flow, records in self.candidates.values():
+            flow.trace_weight = weight
+            buffered.extend(records)
+        # Write the actions in the order they happened
+        buffered.sort(key=lambda item: item[0])
+        output = [(record, weight) for _, record in buffered]
+        self.heap = []
+        self.candidates = {}
+        self.num_flows = 0
+        return output
@@ -0,0 +1,238 @@
+"""
+Merge the shards of the ShardedCSVWriterBackend into one file per table
+
+A merged table is the header of the table followed by its shards in episode order (shards of the same episode in
+worker order). Merged tables are written to <test_dir>/<table>.csv, like tables of the CSV backend, so all loaders
+work with them. Shards are concatenated byte-wise: compressed shards (gzip members, zstd or lz4 frames) are
+concatenated without decompression. All shards of all tables are copied in parallel to their offsets in the
+merged files.
+
+The output files that every worker writes once (see FILE_MERGERS) are merged into <test_dir>/<file name>:
+- dropped_flows.yaml: the counters of all workers are summed up
+- flow_actions.bin, events.bin: the records of all workers (in worker order; flow actions sorted by episode) with
+  their node, SFC and SF indices translated to one merged name table
+"""
+
+import argparse
+import glob
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import yaml
+from coordsim.simulation import tracer
+from coordsim.writer import flow_action_log
+from coordsim.writer.backends import SHARD_DIR
+from coordsim.writer.compression import COMPRESSION_EXTENSIONS, compression_of
+
+log = logging.getLogger(__name__)
+
+
+def list_shards(test_dir, table):
+    """
+    Return the header file (or None) and the shards of a table as (episode, worker, path) tuples in merge order
+    """
+    header = None
+    shards = []
+    for path in glob.glob(os.path.join(test_dir, SHARD_DIR, table, "*.csv*")):
+        name = os.path.basename(path)
+        if name.startswith("header.csv"):
+            header = path
+            continue
+        episode, worker = name.split(".csv")[0].split("-", 1)
+        shards.append((int(episode), worker, path))
+    return header, sorted(shards)
+
+
+def list_tables(test_dir):
+    shard_dir = os.path.join(test_dir, SHARD_DIR)
+    if not os.path.isdir(shard_dir):
+        return []
+    return sorted(table for table in os.listdir(shard_dir)
+                  if table not in FILE_MERGERS and os.path.isdir(os.path.join(shard_dir, table)))
+
+
+def list_file_shards(test_dir, name):
+    """ Return the shards of an output file (one per worker) in worker order """
+    extension = os.path.splitext(name)[1]
+    return sorted(glob.glob(os.path.join(test_dir, SHARD_DIR, name, f"*{extension}")))
+
+
+def intern_names(names, merged, index):
+    """
+    Add names to the merged name table (list merged, name --> position in index).
+    Returns the array that maps the indices of names to indices in merged; index -1 (no name) is mapped to -1.
+    """
+    mapping = np.empty(len(names) + 1, dtype=np.int64)
+    mapping[-1] = -1
+    for i, name in enumerate(names):
+        if name not in index:
+            index[name] = len(merged)
+            merged.append(name)
+        mapping[i] = index[name]
+    return mapping
+
+
+def merge_dropped_flows(parts, target):
+    """ Sum up the dropped flow counters (node --> SF --> count) of all workers """
+    merged = {}
+    for part in parts:
+        with open(part) as f:
+            counters = yaml.safe_load(f) or {}
+        for node, sfs in counters.items():
+            node_counters = merged.setdefault(node, {})
+            for sf, count in sfs.items():
+                node_counters[sf] = node_counters.get(sf, 0) + count
+    with open(target, 'w') as f:
+        yaml.dump(merged, f, default_flow_style=False)
+
+
+def merge_flow_action_logs(parts, target):
+    """ Merge binary flow action logs into one log with one node table, sorted by episode """
+    nodes, index = [], {}
+    merged = []
+    for part in parts:
+        records, part_nodes = flow_action_log.read_flow_action_log(part)
+        records = np.array(records)
+        mapping = intern_names(part_nodes, nodes, index)
+        for column in ('curr_node_id', 'dest_node'):
+            records[column] = mapping[records[column]]
+        merged.append(records)
+    records = np.concatenate(merged) if merged else np.zeros(0, dtype=flow_action_log.FLOW_ACTION_DTYPE)
+    records = records[np.argsort(records['episode'], kind='stable')]
+    header = np.array([(flow_action_log.MAGIC, flow_action_log.FLOW_ACTION_DTYPE.itemsize, 0)],
+                      dtype=flow_action_log.HEADER_DTYPE)
+    with open(target, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+    with open(flow_action_log.node_table_path(target), 'w') as f:
+        f.writelines(f"{node}\n" for node in nodes)
+
+
+def merge_event_traces(parts, target):
+    """ Merge binary event traces into one trace with one set of name tables """
+    # name table --> columns with indices into it
+    columns = {'node': ('node', 'target'), 'sfc': ('sfc',), 'sf': ('sf',)}
+    names = {table: [] for table in columns}
+    indices = {table: {} for table in columns}
+    codes = {}
+    merged = []
+    for part in parts:
+        records, part_names = tracer.read_trace(part)
+        records = np.array(records)
+        for table, table_columns in columns.items():
+            mapping = intern_names(part_names[table], names[table], indices[table])
+            for column in table_columns:
+                records[column] = mapping[records[column]]
+        codes.update(part_names['codes'])
+        merged.append(records)
+    records = np.concatenate(merged) if merged else np.zeros(0, dtype=tracer.TRACE_DTYPE)
+    header = np.array([(tracer.MAGIC, tracer.TRACE_DTYPE.itemsize, 0)], dtype=tracer.HEADER_DTYPE)
+    with open(target, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(records.tobytes())
+    with open(tracer.names_path(target), 'w') as f:
+        yaml.dump(dict(names, codes=codes), f, default_flow_style=False)
+
+
+# Output file --> function(shards, target) that merges the shards of the file (one per worker)
+FILE_MERGERS = {
+    'dropped_flows.yaml': merge_dropped_flows,
+    'flow_actions.bin': merge_flow_action_logs,
+    'events.bin': merge_event_traces,
+}
+
+
+def copy_part(source, target, offset):
+    """ Copy the file source into the (preallocated) file target at offset """
+    with open(source, 'rb') as src, open(target, 'r+b') as dst:
+        dst.seek(offset)
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
+def merge_shards(test_dir, tables=None, files=None, workers=None, overwrite=False, remove=False):
+    """
+    Merge the shards of the given tables (default: all tables) and output files (default: all files of FILE_MERGERS
+    that have shards) of a test_dir.
+    workers: number of parallel copies (default: ThreadPoolExecutor default)
+    overwrite: replace existing merged tables, otherwise they raise FileExistsError
+    remove: delete the shards after merging
+    Returns the paths of the merged tables and files.
+    """
+    if tables is None:
+        tables = list_tables(test_dir)
+    if files is None:
+        files = [name for name in FILE_MERGERS if list_file_shards(test_dir, name)]
+
+    merged = []
+    copies = []
+    for table in tables:
+        header, shards = list_shards(test_dir, table)
+        parts = ([header] if header is not None else []) + [path for _, _, path in shards]
+        if not parts:
+            log.warning(f"No shards of table {table} in {test_dir}")
+            continue
+        compressions = {compression_of(part) for part in parts}
+        if len(compressions) > 1:
+            raise ValueError(f"Shards of table {table} are written with different compressions: {compressions}")
+        compression = compressions.pop()
+        target = os.path.join(test_dir, f"{table}.csv")
+        if compression is not None:
+            target += COMPRESSION_EXTENSIONS[compression]
+        if os.path.exists(target) and not overwrite:
+            raise FileExistsError(f"{target} exists")
+
+        # Preallocate the merged file, then copy every part to its offset
+        offset = 0
+        for part in parts:
+            copies.append((part, target, offset))
+            offset += os.path.getsize(part)
+        with open(target, 'wb') as f:
+            f.truncate(offset)
+        merged.append(target)
+        log.info(f"Merging {len(shards)} shards of table {table} into {target}")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # list() re-raises exceptions of the copies
+        list(executor.map(lambda copy: copy_part(*copy), copies))
+
+    for name in files:
+        parts = list_file_shards(test_dir, name)
+        if not parts:
+            log.warning(f"No shards of {name} in {test_dir}")
+            continue
+        target = os.path.join(test_dir, name)
+        if os.path.exists(target) and not overwrite:
+            raise FileExistsError(f"{target} exists")
+        log.info(f"Merging {len(parts)} shards of {name} into {target}")
+        FILE_MERGERS[name](parts, target)
+        merged.append(target)
+
+    if remove:
+        for name in list(tables) + list(files):
+            shutil.rmtree(os.path.join(test_dir, SHARD_DIR, name), ignore_errors=True)
+    return merged
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Merge the result shards of a test directory")
+    parser.add_argument('test_dir', help="Test directory containing the 'shards' directory")
+    parser.add_argument('-t', '--tables', nargs='+', default=None, help="Tables to merge (default: all)")
+    parser.add_argument('-f', '--files', nargs='+', default=None, choices=sorted(FILE_MERGERS),
+                        help="Output files to merge (default: all)")
+    parser.add_argument('-w', '--workers', type=int, default=None, help="Number of parallel copies")
+    parser.add_argument('--overwrite', action='store_true', help="Replace existing merged tables")
+    parser.add_argument('--remove', action='store_true', help="Delete the shards after merging")
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    args = parse_args(args)
+    logging.basicConfig(level=logging.INFO)
+    merge_shards(args.test_dir, tables=args.tables, files=args.files, workers=args.workers,
+                 overwrite=args.overwrite, remove=args.remove)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+In-process consumers of the simulation results
+
+The ResultWriter publishes every output row to the subscribers of its table (see ResultWriter.subscribe).
+Subscribers are callables subscriber(table, rows), called synchronously in the simulation with a list of rows
+(lists of values in the order of the table's header). Rows are shared by all subscribers and must not be modified.
+Writing the result files is one subscriber among others.
+
+RingBuffer is a subscriber that keeps the most recent rows of one table as NumPy records.
+"""
+
+import threading
+import numpy as np
+
+# Maximum length of strings (e.g. node ids) in ring buffer records
+MAX_STRING_LENGTH = 64
+
+
+def infer_dtype(header, row):
+    """
+    Structured dtype for rows of a table, derived from the header and the values of one row.
+    All numbers are stored as float64: integer columns may also receive floats (e.g. avg_end2end_delay is 0 until the
+    first flow finished).
+    """
+    fields = []
+    for name, value in zip(header, row):
+        if isinstance(value, (bool, int, float, np.number, np.bool_)):
+            fields.append((name, '<f8'))
+        else:
+            fields.append((name, f'<U{MAX_STRING_LENGTH}'))
+    return np.dtype(fields)
+
+
+class RingBuffer:
+    """
+    Keeps the last capacity rows of a table in a preallocated NumPy structured array.
+    The dtype is derived from the first row (see infer_dtype) unless given.
+    Can be read from other threads (e.g. dashboards) while the simulation runs.
+    """
+    def __init__(self, header, capacity=1024, dtype=None):
+        self.header = list(header)
+        self.capacity = capacity
+        self.dtype = dtype
+        self.records = None if dtype is None else np.zeros(capacity, dtype=dtype)
+        # total number of rows pushed; the next row is stored at num_rows % capacity
+        self.num_rows = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, table, rows):
+        self.push(rows)
+
+    def push(self, rows):
+        if not rows:
+            return
+        if self.records is None:
+            self.dtype = infer_dtype(self.header, rows[0])
+            self.records = np.zeros(self.capacity, dtype=self.dtype)
+        with self.lock:
+            # rows that do not fit into the buffer are skipped
+            skipped = max(len(rows) - self.capacity, 0)
+            self.num_rows += skipped
+            for row in rows[skipped:]:
+                self.records[self.num_rows % self.capacity] = tuple(row)
+                self.num_rows += 1
+
+    def __len__(self):
+        return min(self.num_rows, self.capacity)
+
+    def snapshot(self):
+        """ Return a copy of the buffered records, oldest first """
+        with self.lock:
+            if self.records is None:
+                return np.zeros(0, dtype=infer_dtype(self.header, [0] * len(self.header)))
+            if self.num_rows <= self.capacity:
+                return self.records[:self.num_rows].copy()
+            start = self.num_rows % self.capacity
+            return np.concatenate([self.records[start:], self.records[:start]])
+
+    def latest(self, n=1):
+        """ Return a copy of the last n records, oldest first """
+        return self.snapshot()[-n:]
+
+    def clear(self):
+        with self.lock:
+            self.num_rows = 0
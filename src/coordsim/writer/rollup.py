@@ -0,0 +1,197 @@
+"""
+Multi-resolution output of the periodic metric tables
+
+For long simulations, the tables written every run_duration (metrics, run_flows, drop_reasons, node_metrics) grow
+linearly with the simulated time. The RollupWriterBackend keeps only the rows of the most recent `window` runs of
+every episode of these tables in full detail and rolls all rows up into min/mean/max aggregates over intervals of
+factor runs (default 10, 100 and 1000 runs).
+
+All rows are written through the wrapped backend (so its compression, sharding or database apply), each row once:
+- <table>: the rows of the last `window` runs of every episode in full detail (same format as without rollup),
+  written at the end of the episode (when the next one begins or on close), so they end up in the episode's shard
+  with the sharded backend
+- <table>_<factor>x: aggregates with columns episode, time (start of the interval), time_end, samples (number of runs
+  in the interval; lower at the end of an episode), key columns (e.g. node) and <column>_min, <column>_mean,
+  <column>_max for every value column. Each aggregate is appended once its interval is finished (at the latest at the
+  end of the episode or on close).
+"""
+
+from collections import deque
+from coordsim.writer.backends import BaseWriterBackend
+
+# Table --> key columns of the rows, e.g., node_metrics has one row per node and time.
+# Columns other than episode, time and the key columns are aggregated.
+ROLLUP_TABLES = {
+    'metrics': [],
+    'run_flows': [],
+    'drop_reasons': [],
+    'node_metrics': ['node'],
+}
+
+
+class Aggregate:
+    """ min/sum/max of the value columns of the rows of one interval """
+    def __init__(self, episode, time, values):
+        self.episode = episode
+        self.time = time
+        self.time_end = time
+        self.samples = 1
+        self.min = list(values)
+        self.sum = list(values)
+        self.max = list(values)
+
+    def add(self, time, values):
+        self.time_end = time
+        self.samples += 1
+        for i, value in enumerate(values):
+            if value < self.min[i]:
+                self.min[i] = value
+            if value > self.max[i]:
+                self.max[i] = value
+            self.sum[i] += value
+
+    def row(self, key):
+        output = [self.episode, self.time, self.time_end, self.samples, *key]
+        for minimum, total, maximum in zip(self.min, self.sum, self.max):
+            output.extend([minimum, total / self.samples, maximum])
+        return output
+
+
+class TableRollup:
+    """
+    Full detail window and aggregation levels of one table
+    window: number of runs (times) in full detail
+    """
+    def __init__(self, header, key_columns, factors, window):
+        self.header = list(header)
+        key_index = [self.header.index(column) for column in key_columns]
+        self.key_index = key_index
+        self.value_index = [i for i, column in enumerate(self.header)
+                            if column not in ('episode', 'time') and i not in key_index]
+        self.factors = factors
+        # rows of the last window runs, one list of rows per run
+        self.detail = deque(maxlen=window)
+        # factor --> key --> Aggregate of the current interval
+        self.current = {factor: {} for factor in factors}
+        # factor --> finished aggregate rows that were not written yet
+        self.finished = {factor: [] for factor in factors}
+        self.episode = None
+        self.last_time = None
+        # index of the current time within the episode (tables with keys have several rows per time)
+        self.time_index = -1
+
+    def add(self, row):
+        episode, time = row[0], row[1]
+        if episode != self.episode:
+            self.finish_intervals()
+            self.episode = episode
+            self.last_time = None
+            self.time_index = -1
+        if time != self.last_time:
+            self.last_time = time
+            self.time_index += 1
+            self.detail.append([])
+            for factor in self.factors:
+                if self.time_index % factor == 0 and self.current[factor]:
+                    self.finish_interval(factor)
+        self.detail[-1].append(row)
+
+        key = tuple(row[i] for i in self.key_index)
+        values = [row[i] for i in self.value_index]
+        for factor in self.factors:
+            aggregate = self.current[factor].get(key)
+            if aggregate is None:
+                self.current[factor][key] = Aggregate(episode, time, values)
+            else:
+                aggregate.add(time, values)
+
+    def finish_interval(self, factor):
+        for key, aggregate in self.current[factor].items():
+            self.finished[factor].append(aggregate.row(key))
+        self.current[factor] = {}
+
+    def finish_intervals(self):
+        for factor in self.factors:
+            if self.current[factor]:
+                self.finish_interval(factor)
+
+    def aggregate_header(self):
+        header = ['episode', 'time', 'time_end', 'samples'] + [self.header[i] for i in self.key_index]
+        for i in self.value_index:
+            header.extend([f"{self.header[i]}_min", f"{self.header[i]}_mean", f"{self.header[i]}_max"])
+        return header
+
+    def pop_finished(self, factor):
+        """ Return and forget the finished aggregate rows of a level """
+        rows = self.finished[factor]
+        self.finished[factor] = []
+        return rows
+
+    def pop_detail(self):
+        """ Return and forget the rows of the detail window """
+        rows = [row for rows in self.detail for row in rows]
+        self.detail.clear()
+        return rows
+
+
+class RollupWriterBackend(BaseWriterBackend):
+    """
+    Wraps another backend: the tables of ROLLUP_TABLES are rolled up (see module docstring), all other tables are
+    passed to the wrapped backend unchanged.
+    window: number of runs per table and episode kept in full detail
+    """
+    def __init__(self, backend: BaseWriterBackend, factors=(10, 100, 1000), window=1000):
+        super().__init__(backend.test_dir)
+        self.backend = backend
+        self.factors = sorted(factors)
+        self.window = window
+        self.rollups = {}
+
+    def open_table(self, table, header=None):
+        self.backend.open_table(table, header)
+        if table in ROLLUP_TABLES and header is not None:
+            rollup = TableRollup(header, ROLLUP_TABLES[table], self.factors, self.window)
+            self.rollups[table] = rollup
+            for factor in self.factors:
+                self.backend.open_table(f"{table}_{factor}x", rollup.aggregate_header())
+
+    def write_rows(self, table, rows):
+        rollup = self.rollups.get(table)
+        if rollup is None:
+            self.backend.write_rows(table, rows)
+            return
+        for row in rows:
+            rollup.add(row)
+        self.write_aggregates(table, rollup)
+
+    def write_aggregates(self, table, rollup):
+        """ Append the finished aggregates of a table to the wrapped backend """
+        for factor in self.factors:
+            rows = rollup.pop_finished(factor)
+            if rows:
+                self.backend.write_rows(f"{table}_{factor}x", rows)
+
+    def finish_episode(self):
+        """ Write the last aggregates and the detail window of the current episode """
+        for table, rollup in self.rollups.items():
+            rollup.finish_intervals()
+            self.write_aggregates(table, rollup)
+            rows = rollup.pop_detail()
+            if rows:
+                self.backend.write_rows(table, rows)
+
+    def begin_episode(self, episode):
+        self.finish_episode()
+        self.backend.begin_episode(episode)
+
+    def flush(self):
+        self.backend.flush()
+
+    def output_path(self, name):
+        return self.backend.output_path(name)
+
+    def close(self):
+        if self.rollups:
+            self.finish_episode()
+            self.rollups = {}
+        self.backend.close()
@@ -2,152 +2,289 @@
 Simulator file writer module
 """
 
-import csv
-import os
+import weakref
+import numpy as np
 import yaml
 from spinterface import SimulatorAction, SimulatorState
+from coordsim.writer.backends import WRITER_BACKENDS, BaseWriterBackend
+from coordsim.writer.async_backend import AsyncWriterBackend
+from coordsim.writer.flow_action_log import FlowActionLog
+from coordsim.writer.delta import DeltaEncoder
+from coordsim.writer.flow_sampling import HashFlowSampler, ReservoirFlowSampler
+from coordsim.writer.rollup import RollupWriterBackend
+from coordsim.writer.observers import RingBuffer
+
+
+def close_outputs(backend, flow_action_log):
+    backend.close()
+    if flow_action_log is not None:
+        flow_action_log.close()
 
 
 class ResultWriter():
     """
     Result Writer
-    Helper class to write results to CSV files.
+    Helper class to write results to CSV files (or to another backend, see coordsim.writer.backends).
+    All output rows are published to the subscribers of their table (see subscribe and coordsim.writer.observers).
+    In test mode, the backend is subscribed to all tables that are written to files. Rows of tables without
+    subscribers are not computed.
     """
-    def __init__(self, test_mode: bool, test_dir, write_schedule=False, write_flow_actions=False):
+    # Methods timed by the profiler (see coordsim.simulation.profiler)
+    profiled_methods = ('write_flow_action', 'write_schedule_table', 'write_network_state', 'write_flow_drop')
+    # write_flow_action(params, time, flow, ...) is profiled per node of the flow
+    profiled_nodes = {'write_flow_action': lambda args: args[2].current_node_id}
+
+    def __init__(self, test_mode: bool, test_dir, write_schedule=False, write_flow_actions=False, backend='csv',
+                 asynchronous=False, queue_size=64, batch_size=1024, flow_actions_format='csv', write_deltas=False,
+                 keyframe_interval=100, flow_sample_rate=None, flow_sample_size=None, rollup=False,
+                 rollup_factors=(10, 100, 1000), rollup_window=1000, write_profile=False, **backend_kwargs):
         """
-        If the simulator is in test mode, create result folder and CSV files
+        If the simulator is in test mode, create result folder and output tables
+        backend: name of a backend in WRITER_BACKENDS or a BaseWriterBackend subclass
+        asynchronous: run all I/O of the backend in a background thread (see AsyncWriterBackend). queue_size and
+                      batch_size control the number of batches in flight and the number of rows per batch.
+        flow_actions_format: 'csv' writes flow actions to the backend like all other outputs, 'binary' writes them
+                             to the binary log flow_actions.bin (see coordsim.writer.flow_action_log)
+        write_deltas: write only changed schedule and placement entries to scheduling_delta and placements_delta,
+                      with a full keyframe every keyframe_interval writes (see coordsim.writer.delta)
+        flow_sample_rate: only write the actions of 1 in flow_sample_rate flows
+        flow_sample_size: only write the actions of (up to) flow_sample_size flows per run
+                          Sampled flow actions have an additional column sample_weight
+                          (see coordsim.writer.flow_sampling)
+        rollup: keep only the last rollup_window runs per episode of metrics, run_flows, drop_reasons and node_metrics
+                in full detail and aggregate them over rollup_factors runs (see coordsim.writer.rollup)
+        write_profile: write the profile of every episode to the table profile (see coordsim.simulation.profiler)
+        backend_kwargs: passed to the backend, e.g., chunk_size and columnar_format for the columnar backend
         """
         self.write_schedule = write_schedule
         self.write_per_flow_actions = write_flow_actions
+        self.write_deltas = write_deltas
+        self.write_profile = write_profile
+        if flow_sample_rate is not None and flow_sample_size is not None:
+            raise ValueError("Use either flow_sample_rate or flow_sample_size, not both")
+        self.flow_sampler = None
+        if flow_sample_rate is not None:
+            self.flow_sampler = HashFlowSampler(flow_sample_rate)
+        elif flow_sample_size is not None:
+            self.flow_sampler = ReservoirFlowSampler(flow_sample_size)
+        self.scheduling_encoder = DeltaEncoder(keyframe_interval)
+        self.placement_encoder = DeltaEncoder(keyframe_interval)
         self.test_mode = test_mode
+        self.backend = None
+        self.flow_action_log = None
+        self._finalizer = None
+        self._network = None
+        self.action_number = 0
+        # table --> list of subscribers
+        self.subscribers = {}
+        self.headers = self.create_headers()
         if self.test_mode:
-            if self.write_schedule:
-                self.scheduling_file_name = f"{test_dir}/scheduling.csv"
-            self.placement_file_name = f"{test_dir}/placements.csv"
-            self.resources_file_name = f"{test_dir}/node_metrics.csv"
-            self.metrics_file_name = f"{test_dir}/metrics.csv"
-            self.drop_reasons_file_name = f"{test_dir}/drop_reasons.csv"
-            self.dropped_flows_file_name = f"{test_dir}/dropped_flows.yaml"
-            self.rl_state_file_name = f"{test_dir}/rl_state.csv"
-            self.run_flows_file_name = f"{test_dir}/run_flows.csv"
-            self.runtimes_file_name = f"{test_dir}/runtimes.csv"
-            self.flow_action_file_name = f"{test_dir}/flow_actions.csv"
-
-            # Create the results directory if not exists
-            os.makedirs(os.path.dirname(self.placement_file_name), exist_ok=True)
-
-            self.placement_stream = open(self.placement_file_name, 'a+', newline='')
-            self.resources_stream = open(self.resources_file_name, 'a+', newline='')
-            self.metrics_stream = open(self.metrics_file_name, 'a+', newline='')
-            self.rl_state_stream = open(self.rl_state_file_name, 'a+', newline='')
-            self.run_flows_stream = open(self.run_flows_file_name, 'a+', newline='')
-            self.runtimes_stream = open(self.runtimes_file_name, 'a+', newline='')
-            self.drop_reasons_stream = open(self.drop_reasons_file_name, 'a+', newline='')
-
-            if self.write_schedule:
-                self.scheduleing_stream = open(self.scheduling_file_name, 'a+', newline='')
-                self.scheduling_writer = csv.writer(self.scheduleing_stream)
-            if self.write_per_flow_actions:
-                self.flow_action_stream = open(self.flow_action_file_name, 'a+', newline='')
-                self.flow_action_writer = csv.writer(self.flow_action_stream)
-            # Create CSV writers
-            self.placement_writer = csv.writer(self.placement_stream)
-            self.resources_writer = csv.writer(self.resources_stream)
-            self.metrics_writer = csv.writer(self.metrics_stream)
-            self.rl_state_writer = csv.writer(self.rl_state_stream)
-            self.run_flows_writer = csv.writer(self.run_flows_stream)
-            self.runtimes_writer = csv.writer(self.runtimes_stream)
-            self.drop_reasons_writer = csv.writer(self.drop_reasons_stream)
-            self.action_number = 0
+            backend_cls = WRITER_BACKENDS[backend] if isinstance(backend, str) else backend
+            self.backend = backend_cls(test_dir, **backend_kwargs)
+            if rollup:
+                self.backend = RollupWriterBackend(self.backend, factors=rollup_factors, window=rollup_window)
+            if asynchronous:
+                self.backend = AsyncWriterBackend(self.backend, queue_size=queue_size, batch_size=batch_size)
+            assert isinstance(self.backend, BaseWriterBackend)
+            self.dropped_flows_file_name = self.output_path("dropped_flows.yaml")
+            if self.write_per_flow_actions and flow_actions_format == 'binary':
+                self.flow_action_log = FlowActionLog(self.output_path("flow_actions.bin"))
+            # Close all outputs when the writer is garbage collected or, at the latest, at interpreter exit.
+            # The finalizer only references the outputs, so it does not keep the writer alive.
+            self._finalizer = weakref.finalize(self, close_outputs, self.backend, self.flow_action_log)
 
             # Write the headers to the files
             self.create_csv_headers()
 
-    def __del__(self):
-        # Close all writer streams
-        if self.test_mode:
-            self.placement_stream.close()
-            if self.write_schedule:
-                self.scheduleing_stream.close()
-            self.resources_stream.close()
-            self.metrics_stream.close()
-            self.rl_state_stream.close()
-            if self.write_per_flow_actions:
-                self.flow_action_stream.close()
-            self.run_flows_stream.close()
-            self.runtimes_stream.close()
-            self.drop_reasons_stream.close()
+    def close(self):
+        """
+        Flush and close all outputs. Safe to call more than once.
+        """
+        if self._finalizer is not None and self._finalizer.alive:
+            self.end_sample_run()
+            self._finalizer()
+
+    def output_path(self, name):
+        """
+        Return the path of an output file other than a table, e.g. events.bin (see BaseWriterBackend.output_path)
+        """
+        return self.backend.output_path(name)
+
+    def create_headers(self):
+        """
+        Return the headers of all tables: table name --> list of column names (None for rl_state)
+        """
+        headers = {}
+        if self.write_deltas:
+            headers['scheduling_delta'] = ['episode', 'time', 'op', 'origin_node', 'sfc', 'sf', 'schedule_node',
+                                           'schedule_prob']
+            headers['placements_delta'] = ['episode', 'time', 'op', 'node', 'sf']
+        else:
+            headers['scheduling'] = ['episode', 'time', 'origin_node', 'sfc', 'sf', 'schedule_node', 'schedule_prob']
+            headers['placements'] = ['episode', 'time', 'node', 'sf']
+        headers['node_metrics'] = ['episode', 'time', 'node', 'node_capacity', 'used_resources', 'ingress_traffic']
+        headers['metrics'] = ['episode', 'time', 'total_flows', 'successful_flows', 'dropped_flows',
+                              'in_network_flows', 'avg_end2end_delay']
+        headers['run_flows'] = ['episode', 'time', 'successful_flows', 'dropped_flows', 'total_flows']
+        headers['runtimes'] = ['run', 'runtime']
+        headers['flow_actions'] = ['episode', 'time', 'flow_id', 'flow_rem_ttl', 'flow_ttl', 'curr_node_id',
+                                   'dest_node', 'cur_node_rem_cap', 'next_node_rem_cap', 'link_cap', 'link_rem_cap']
+        if self.flow_sampler is not None:
+            headers['flow_actions'].append('sample_weight')
+        headers['drop_reasons'] = ['episode', 'time', 'TTL', 'DECISION', 'LINK_CAP', 'NODE_CAP']
+        # One row per dropped flow. Only published to subscribers, the files contain the aggregates (drop_reasons,
+        # dropped_flows.yaml)
+        headers['drops'] = ['episode', 'time', 'flow_id', 'node', 'sf', 'reason']
+        # Profile of the components per episode (columns: coordsim.simulation.profiler.PROFILE_COLUMNS)
+        headers['profile'] = ['episode', 'component', 'method', 'node', 'calls', 'timed_calls', 'time_ns', 'events']
+        # rl_state rows are defined by the coordination algorithm and have no header
+        headers['rl_state'] = None
+        return headers
 
     def create_csv_headers(self):
         """
         Creates statistics CSV headers and writes them to their files
         """
-
-        # Create CSV headers
+        tables = []
         if self.write_schedule:
-            scheduling_output_header = ['episode', 'time', 'origin_node', 'sfc', 'sf', 'schedule_node', 'schedule_prob']
-            self.scheduling_writer.writerow(scheduling_output_header)
-        placement_output_header = ['episode', 'time', 'node', 'sf']
-        resources_output_header = ['episode', 'time', 'node', 'node_capacity', 'used_resources', 'ingress_traffic']
-        metrics_output_header = ['episode', 'time', 'total_flows', 'successful_flows', 'dropped_flows',
-                                 'in_network_flows', 'avg_end2end_delay']
-        run_flows_output_header = ['episode', 'time', 'successful_flows', 'dropped_flows', 'total_flows']
-        runtimes_output_header = ['run', 'runtime']
-        if self.write_per_flow_actions:
-            flow_action_output_header = ['episode', 'time', 'flow_id', 'flow_rem_ttl', 'flow_ttl',
-                                         'curr_node_id', 'dest_node', 'cur_node_rem_cap', 'next_node_rem_cap',
-                                         'link_cap', 'link_rem_cap']
-            self.flow_action_writer.writerow(flow_action_output_header)
-        drop_reasons_output_header = ['episode', 'time', 'TTL', 'DECISION', 'LINK_CAP', 'NODE_CAP']
-
-        # Write headers to CSV files
-        self.placement_writer.writerow(placement_output_header)
-        self.resources_writer.writerow(resources_output_header)
-        self.metrics_writer.writerow(metrics_output_header)
-        self.run_flows_writer.writerow(run_flows_output_header)
-        self.runtimes_writer.writerow(runtimes_output_header)
-        self.drop_reasons_writer.writerow(drop_reasons_output_header)
+            tables.append('scheduling_delta' if self.write_deltas else 'scheduling')
+        if self.write_per_flow_actions and self.flow_action_log is None:
+            tables.append('flow_actions')
+        tables.extend(['placements_delta' if self.write_deltas else 'placements', 'node_metrics', 'metrics',
+                       'run_flows', 'runtimes', 'drop_reasons', 'rl_state'])
+        if self.write_profile:
+            tables.append('profile')
+        for table in tables:
+            self.backend.open_table(table, self.headers[table])
+        # Writing files is just another subscriber
+        self.subscribe(self.backend.write_rows, tables)
+
+    def subscribe(self, subscriber, tables=None):
+        """
+        Call subscriber(table, rows) with all rows of the given tables (default: all tables, see create_headers)
+        Returns the subscriber.
+        """
+        for table in (tables if tables is not None else self.headers.keys()):
+            if table not in self.headers:
+                raise ValueError(f"Unknown table {table}")
+            self.subscribers.setdefault(table, []).append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        for table, subscribers in self.subscribers.items():
+            self.subscribers[table] = [s for s in subscribers if s is not subscriber]
+
+    def ring_buffer(self, table, capacity=1024, dtype=None) -> RingBuffer:
+        """
+        Subscribe and return a RingBuffer that keeps the last capacity rows of a table as NumPy records.
+        Tables without header (rl_state) require a structured dtype, which defines the columns.
+        """
+        if table not in self.headers:
+            raise ValueError(f"Unknown table {table}")
+        header = self.headers[table]
+        if header is None:
+            if dtype is None or np.dtype(dtype).names is None:
+                raise ValueError(f"Table {table} has no header, ring_buffer requires a structured dtype for its rows")
+            header = np.dtype(dtype).names
+        return self.subscribe(RingBuffer(header, capacity, dtype), [table])
+
+    def observed(self, table):
+        """ True if the table has subscribers, i.e., its rows have to be computed """
+        return bool(self.subscribers.get(table))
+
+    def publish(self, table, rows):
+        """ Pass rows of a table to all its subscribers """
+        for subscriber in self.subscribers.get(table, ()):
+            subscriber(table, rows)
 
     def write_runtime(self, time):
         """
         Write runtime results to output file
         """
-        if self.test_mode:
-            self.action_number += 1
-            self.runtimes_writer.writerow([self.action_number, time])
+        self.action_number += 1
+        if self.observed('runtimes'):
+            self.publish('runtimes', [[self.action_number, time]])
+
+    def network_attrs(self, network):
+        """
+        Return node and edge attribute dicts of the network, cached to avoid NetworkX view lookups per flow action.
+        The dicts are the network's own (live) attribute dicts, so they always contain the current values.
+        """
+        if self._network is not network:
+            self._network = network
+            self._node_attrs = dict(network.nodes(data=True))
+            self._edge_attrs = {node: dict(neighbors) for node, neighbors in network.adjacency()}
+        return self._node_attrs, self._edge_attrs
 
     def write_flow_action(self, params, time, flow, current_node_id, destination_node_id):
-        if self.test_mode and self.write_per_flow_actions:
-            cur_node_rem_cap = params.network.nodes[flow.current_node_id]['remaining_cap']
+        if self.flow_action_log is not None or self.observed('flow_actions'):
+            node_attrs, edge_attrs = self.network_attrs(params.network)
+            cur_node_rem_cap = node_attrs[flow.current_node_id]['remaining_cap']
             if destination_node_id is None:
                 dest_node = 'None'
                 next_node_rem_cap = -1
-                # link_cap = -1
-                # rem_cap = -1
+                link_cap = -1
+                rem_cap = -1
             else:
                 dest_node = destination_node_id
-                next_node_rem_cap = params.network.nodes[dest_node]['remaining_cap']
+                next_node_rem_cap = node_attrs[dest_node]['remaining_cap']
                 if dest_node == flow.current_node_id:
-                    link_cap = 'inf'
-                    rem_cap = 'inf'
+                    link_cap = float('inf')
+                    rem_cap = float('inf')
                 else:
-                    link_cap = params.network.edges[(flow.current_node_id, dest_node)]['cap']
-                    rem_cap = params.network.edges[(flow.current_node_id, dest_node)]['remaining_cap']
+                    edge = edge_attrs[flow.current_node_id][dest_node]
+                    link_cap = edge['cap']
+                    rem_cap = edge['remaining_cap']
 
             flow_action_output = [params.episode, time, flow.flow_id, flow.ttl, flow.original_ttl,
                                   flow.current_node_id, dest_node, cur_node_rem_cap, next_node_rem_cap,
                                   link_cap, rem_cap]
-            self.flow_action_writer.writerow(flow_action_output)
+            if self.flow_sampler is None:
+                self.emit_flow_action(flow_action_output)
+            else:
+                for sampled_output, weight in self.flow_sampler.offer(flow, flow_action_output):
+                    self.emit_flow_action(sampled_output, weight)
+
+    def emit_flow_action(self, flow_action_output, sample_weight=None):
+        """
+        Write a flow action row to the binary flow action log (if enabled) and publish it
+        """
+        if sample_weight is not None:
+            flow_action_output = flow_action_output + [sample_weight]
+        self.publish('flow_actions', [flow_action_output])
+        if self.flow_action_log is not None:
+            # The binary log has no string for 'no destination'
+            if flow_action_output[6] == 'None':
+                flow_action_output = flow_action_output[:6] + [None] + flow_action_output[7:]
+            self.flow_action_log.write(*flow_action_output[:11],
+                                       sample_weight=1 if sample_weight is None else sample_weight)
+
+    def end_sample_run(self):
+        """
+        Write the flow actions sampled in the current run (if the sampler decides at the end of a run)
+        """
+        if self.flow_sampler is not None:
+            for flow_action_output, weight in self.flow_sampler.end_run():
+                self.emit_flow_action(flow_action_output, weight)
 
     def write_schedule_table(self, params, time, action: SimulatorAction):
         """
         Write schedule to CSV files for statistics purposes
         """
         episode = params.episode
-        if self.test_mode:
+        if self.observed('scheduling_delta') or self.observed('scheduling'):
             scheduling_output = []
 
-            if self.write_schedule:
+            if self.write_deltas:
+                schedule = {(node, sfc, sf, schedule_node): schedule_prob
+                            for node, sfcs in action.scheduling.items()
+                            for sfc, sfs in sfcs.items()
+                            for sf, scheduling in sfs.items()
+                            for schedule_node, schedule_prob in scheduling.items()}
+                for op, key, schedule_prob in self.scheduling_encoder.encode(episode, schedule):
+                    scheduling_output.append([episode, time, op, *key, schedule_prob])
+                self.publish('scheduling_delta', scheduling_output)
+            else:
                 scheduling = action.scheduling
                 for node, sfcs in scheduling.items():
                     for sfc, sfs in sfcs.items():
@@ -155,7 +292,15 @@ class ResultWriter():
                             for schedule_node, schedule_prob in scheduling.items():
                                 scheduling_output_row = [episode, time, node, sfc, sf, schedule_node, schedule_prob]
                                 scheduling_output.append(scheduling_output_row)
-                self.scheduling_writer.writerows(scheduling_output)
+                self.publish('scheduling', scheduling_output)
+
+    def begin_episode(self, episode):
+        """
+        Start the outputs of a new episode (used by backends writing one file per episode)
+        """
+        self.end_sample_run()
+        if self.test_mode:
+            self.backend.begin_episode(episode)
 
     def begin_writing(self, env, params):
         """
@@ -168,14 +313,17 @@ class ResultWriter():
     def write_network_state(self):
         # TODO: Reset run metrics here, rather than in the decision maker
         time = self.env.now
-        if self.test_mode:
+        self.end_sample_run()
+        metrics = self.params.metrics.get_metrics()
+        network = self.params.network
 
-            metrics = self.params.metrics.get_metrics()
-            network = self.params.network
+        if self.observed('metrics'):
 
             metrics_output = [self.params.episode, time, metrics['generated_flows'], metrics['processed_flows'],
                               metrics['dropped_flows'], metrics['total_active_flows'], metrics['avg_end2end_delay']]
+            self.publish('metrics', [metrics_output])
 
+        if self.observed('node_metrics'):
             resource_output = []
             for node in network.nodes(data=True):
                 node_id = node[0]
@@ -193,30 +341,37 @@ class ResultWriter():
                                 ingress_sf, 0)
                 resource_output_row = [self.params.episode, time, node_id, node_cap, used_resources, ingress_traffic]
                 resource_output.append(resource_output_row)
+            self.publish('node_metrics', resource_output)
 
+        if self.observed('run_flows'):
             run_flows_output = [self.params.episode, time, metrics['run_processed_flows'], metrics['run_dropped_flows'],
                                 metrics['run_generated_flows']]
+            self.publish('run_flows', [run_flows_output])
 
+        if self.observed('drop_reasons'):
             drop_reasons = metrics['dropped_flow_reasons']
             drop_reasons_output = [
                 self.params.episode, time, drop_reasons['TTL'], drop_reasons['DECISION'], drop_reasons['LINK_CAP'],
                 drop_reasons['NODE_CAP']
             ]
+            self.publish('drop_reasons', [drop_reasons_output])
 
-            self.drop_reasons_writer.writerow(drop_reasons_output)
-            self.run_flows_writer.writerow(run_flows_output)
-            self.metrics_writer.writerow(metrics_output)
-            self.resources_writer.writerows(resource_output)
-
-            # Writing placement
-            placement_output = []
+        # Writing placement
+        placement_output = []
+        if self.write_deltas and self.observed('placements_delta'):
+            placement = {(node_id, sf): None for node_id, node_data in network.nodes(data=True)
+                         for sf in node_data['available_sf'].keys()}
+            for op, (node_id, sf), _ in self.placement_encoder.encode(self.params.episode, placement):
+                placement_output.append([self.params.episode, time, op, node_id, sf])
+            self.publish('placements_delta', placement_output)
+        elif self.observed('placements'):
             for node in network.nodes(data=True):
                 node_id = node[0]
                 sfs = list(node[1]['available_sf'].keys())
                 for sf in sfs:
                     placement_output_row = [self.params.episode, time, node_id, sf]
                     placement_output.append(placement_output_row)
-            self.placement_writer.writerows(placement_output)
+            self.publish('placements', placement_output)
 
         # reset metrics for run
         self.params.metrics.reset_run_metrics()
@@ -230,6 +385,20 @@ class ResultWriter():
             with open(self.dropped_flows_file_name, 'w') as f:
                 yaml.dump(dropped_flow_locs, f, default_flow_style=False)
 
+    def write_flow_drop(self, flow, reason):
+        """
+        Publish a dropped flow. Called by Metrics.dropped_flow (see Metrics.drop_listeners).
+        """
+        if self.observed('drops'):
+            current_sf = 'EG' if flow.current_sf is None else flow.current_sf
+            self.publish('drops', [[self.params.episode, self.env.now, flow.flow_id, flow.current_node_id, current_sf,
+                                    reason]])
+
+    def write_profile_rows(self, profile_rows):
+        """Write the profile of an episode (see Profiler.rows). Called at the end of every episode."""
+        if self.observed('profile'):
+            self.publish('profile', profile_rows)
+
     def write_rl_state(self, rl_state):
-        if self.test_mode:
-            self.rl_state_writer.writerow(rl_state)
+        if self.observed('rl_state'):
+            self.publish('rl_state', [rl_state])
@@ -2,16 +2,21 @@ import logging
 import random
 import time
 import os
+import weakref
 from shutil import copyfile
 from coordsim.metrics.metrics import Metrics
+from coordsim.metrics.exporter import MetricsExporter
 import coordsim.reader.reader as reader
 from coordsim.simulation.flowsimulator import FlowSimulator
 from coordsim.simulation.simulatorparams import SimulatorParams
+from coordsim.simulation.profiler import Profiler
+from coordsim.simulation.tracer import create_tracer
 import numpy
 import simpy
 from spinterface import SimulatorAction, SimulatorInterface, SimulatorState
 from coordsim.writer.writer import ResultWriter
 from coordsim.trace_processor.trace_processor import TraceProcessor
+from coordsim.trace_processor.compiled_trace import load_trace
 from coordsim.traffic_predictor.traffic_predictor import TrafficPredictor
 # from coordsim.traffic_predictor.lstm_predictor import LSTM_Predictor
 from coordsim.controller import *
@@ -19,6 +24,16 @@ from coordsim.controller import *
 logger = logging.getLogger(__name__)
 
 
+def close_results(writer: ResultWriter, metrics: Metrics, profiler=None, tracer=None):
+    """Write dropped flow locs (and the profile of the last episode) and flush and close all other outputs"""
+    if profiler is not None:
+        writer.write_profile_rows(profiler.rows())
+    if tracer is not None:
+        tracer.close()
+    writer.write_dropped_flow_locs(metrics.metrics['dropped_flows_locs'])
+    writer.close()
+
+
 class Simulator(SimulatorInterface):
     def __init__(self, network_file, service_functions_file, config_file, resource_functions_path="", test_mode=False,
                  test_dir=None):
@@ -51,33 +66,121 @@ class Simulator(SimulatorInterface):
         write_flow_actions = False
         if 'write_flow_actions' in self.config and self.config['write_flow_actions']:
             write_flow_actions = True
-        # Create CSV writer
-        self.writer = ResultWriter(self.test_mode, self.test_dir, write_schedule, write_flow_actions)
+        # Create CSV writer (or another writer backend if configured)
+        writer_backend = self.config.get('writer_backend', 'csv')
+        writer_backend_kwargs = {}
+        if writer_backend == 'columnar':
+            writer_backend_kwargs['chunk_size'] = self.config.get('writer_chunk_size', 100000)
+            writer_backend_kwargs['columnar_format'] = self.config.get('writer_columnar_format', 'auto')
+        if writer_backend == 'sharded':
+            writer_backend_kwargs['worker'] = self.config.get('writer_shard_worker', None)
+        if writer_backend in ('csv', 'sharded'):
+            writer_backend_kwargs['compression'] = self.config.get('writer_compression', None)
+            writer_backend_kwargs['compression_level'] = self.config.get('writer_compression_level', None)
+            writer_backend_kwargs['compression_block_size'] = self.config.get('writer_compression_block_size',
+                                                                              1 << 20)
+        elif writer_backend == 'sqlite':
+            writer_backend_kwargs['database'] = self.config.get('writer_database', None)
+            writer_backend_kwargs['experiment'] = {'network': os.path.basename(network_file),
+                                                   'services': os.path.basename(service_functions_file),
+                                                   'config': os.path.basename(config_file)}
+        self.writer = ResultWriter(self.test_mode, self.test_dir, write_schedule, write_flow_actions,
+                                   backend=writer_backend, asynchronous=self.config.get('writer_async', False),
+                                   queue_size=self.config.get('writer_queue_size', 64),
+                                   batch_size=self.config.get('writer_batch_size', 1024),
+                                   flow_actions_format=self.config.get('flow_actions_format', 'csv'),
+                                   write_deltas=self.config.get('write_deltas', False),
+                                   keyframe_interval=self.config.get('delta_keyframe_interval', 100),
+                                   flow_sample_rate=self.config.get('flow_sample_rate', None),
+                                   flow_sample_size=self.config.get('flow_sample_size', None),
+                                   rollup=self.config.get('writer_rollup', False),
+                                   rollup_factors=self.config.get('writer_rollup_factors', (10, 100, 1000)),
+                                   rollup_window=self.config.get('writer_rollup_window', 1000),
+                                   write_profile=self.config.get('profile', False),
+                                   **writer_backend_kwargs)
         self.params.writer = self.writer
+        # Optional profiling of the components. Instrument the writer and metrics before their methods are stored
+        # anywhere (e.g. as drop listener)
+        self.profiler = None
+        if self.config.get('profile', False):
+            self.profiler = Profiler(sample_interval=self.config.get('profile_sample_interval', 1))
+            self.profiler.instrument(self.writer, 'writer')
+            self.profiler.instrument(self.metrics, 'metrics')
+        self.params.profiler = self.profiler
+        # Flow events are recorded by a tracer if they are logged (INFO) or traced (to events.bin in test mode),
+        # otherwise there is no tracer (None)
+        trace_events = self.config.get('trace_events', False)
+        trace_path = self.writer.output_path('events.bin') if self.test_mode and trace_events else None
+        self.tracer = create_tracer(self.params, trace_events=trace_events, path=trace_path,
+                                    capacity=self.config.get('trace_buffer_size', 65536))
+        self.params.tracer = self.tracer
+        self.metrics.drop_listeners.append(self.writer.write_flow_drop)
+        # Write the dropped flow locations and flush all results on close(), on garbage collection or, at the latest,
+        # at interpreter exit. Does not rely on the order in which the simulator and its writer are collected.
+        self._finalizer = weakref.finalize(self, close_results, self.writer, self.metrics, self.profiler,
+                                           self.tracer)
+        # Optional live metrics endpoint
+        self.exporter = None
+        if self.config.get('metrics_port', None) is not None:
+            self.exporter = MetricsExporter(port=self.config['metrics_port'],
+                                            host=self.config.get('metrics_host', '127.0.0.1'),
+                                            interval=self.config.get('metrics_interval', None))
+            self.writer.subscribe(self.exporter.update_run_flows, ['run_flows'])
+            self.exporter.start()
+            self._exporter_finalizer = weakref.finalize(self, self.exporter.stop)
         self.episode = 0
         self.params.episode = 0
         self.last_apply_time = None
         # Load trace file
         if 'trace_path' in self.config:
             trace_path = os.path.join(os.getcwd(), self.config['trace_path'])
-            self.trace = reader.get_trace(trace_path)
+            self.trace = load_trace(trace_path)
 
         self.lstm_predictor = None
         # if 'lstm_prediction' in self.config and self.config['lstm_prediction']:
         #     self.lstm_predictor = LSTM_Predictor(self.trace, params=self.params,
         #                                          weights_dir=self.config['lstm_weights'])
 
-    def __del__(self):
-        # write dropped flow locs to yaml
-        self.writer.write_dropped_flow_locs(self.metrics.metrics['dropped_flows_locs'])
+    def close(self):
+        """Write the remaining results and close the result writer. Safe to call more than once."""
+        self._finalizer()
+        if self.exporter is not None:
+            self._exporter_finalizer()
+
+    def subscribe(self, subscriber, tables=None):
+        """
+        Call subscriber(table, rows) with the result rows of the given tables (default: all), e.g., per-run metrics,
+        node metrics, dropped flows and placements. Works without test mode. See ResultWriter.subscribe.
+        """
+        return self.writer.subscribe(subscriber, tables)
+
+    def unsubscribe(self, subscriber):
+        self.writer.unsubscribe(subscriber)
+
+    def ring_buffer(self, table, capacity=1024, dtype=None):
+        """Return a RingBuffer with the last capacity rows of a table as NumPy records. See ResultWriter.ring_buffer."""
+        return self.writer.ring_buffer(table, capacity, dtype)
+
+    def get_profile(self):
+        """
+        Return the profile of the current episode: calls, wall time (ns) and scheduled SimPy events per component,
+        method and node (see coordsim.simulation.profiler). Requires profile: True in the config.
+        """
+        if self.profiler is None:
+            raise ValueError("Profiling is disabled. Set profile: True in the simulator config.")
+        return self.profiler.get_profile()
 
     def init(self, seed):
         # Reset predictor class at beginning of every init
         if self.prediction:
             self.predictor = TrafficPredictor(self.params, self.lstm_predictor)
         # increment episode count
+        if self.profiler is not None and self.profiler.episode is not None:
+            # Write the profile of the previous episode
+            self.writer.write_profile_rows(self.profiler.rows())
         self.episode += 1
         self.params.episode += 1
+        self.writer.begin_episode(self.params.episode)
         # reset network caps and available SFs:
         reader.reset_cap(self.network)
         # Initialize metrics, record start time
@@ -86,7 +189,11 @@ class Simulator(SimulatorInterface):
 
         # Generate SimPy simulation environment
         self.env = simpy.Environment()
+        if self.profiler is not None:
+            self.profiler.begin_episode(self.params.episode, self.env)
         self.env.process(self.writer.begin_writing(self.env, self.params))
+        if self.exporter is not None:
+            self.exporter.attach(self.env, self.params)
 
         self.params.metrics.reset_metrics()
 
@@ -145,6 +252,8 @@ class Simulator(SimulatorInterface):
         # simulator_state = SimulatorState(self.network_dict, self.simulator.params.sf_placement, self.sfc_list,
         #                                  self.sf_list, self.traffic, self.network_stats)
         # logger.debug(f"t={self.env.now}: {simulator_state}")
+        if self.tracer is not None:
+            self.tracer.flush()
         # set time stamp to calculate runtime of next apply call
         self.last_apply_time = time.time()
         # Check to see if init called in warmup, if so, set warmup to false
@@ -227,6 +336,8 @@ class Simulator(SimulatorInterface):
         # self.writer.write_state_results(self.episode, self.env.now, simulator_state,
         # self.params.metrics.get_metrics())
         logger.debug(f"t={self.env.now}: {simulator_state}")
+        if self.tracer is not None:
+            self.tracer.flush()
         # set time stamp to calculate runtime of next apply call
         self.last_apply_time = time.time()
         return simulator_state
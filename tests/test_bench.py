@@ -0,0 +1,46 @@
+from unittest import TestCase
+from coordsim.bench.scenarios import scenario_grid, scenario_name
+from coordsim.bench.runner import run_scenario
+from coordsim.bench.memory import check_memory
+from coordsim.bench.equivalence import check_equivalence, equivalence_scenarios, format_report
+
+
+class TestBench(TestCase):
+
+    def test_scenarios(self):
+        scenarios = scenario_grid(nodes=[3, 20], ingress=[5], controller=['DurationController', 'FlowController'],
+                                  duration=[200])
+        self.assertEqual(len(scenarios), 4)
+        # ingress nodes are limited to the topology size
+        self.assertEqual(scenarios[0]['ingress'], 3)
+        self.assertEqual(len({scenario_name(scenario) for scenario in scenarios}), 4)
+        for scenario in scenarios:
+            result = run_scenario(scenario)
+            self.assertGreaterEqual(result['sim_time'], 200)
+            self.assertGreater(result['flows'], 0)
+            self.assertGreater(result['events_per_s'], 0)
+            self.assertGreater(result['peak_rss_bytes'], 0)
+
+    def test_equivalence(self):
+        scenarios = equivalence_scenarios(duration=300)
+        self.assertEqual(len(scenarios), 8)
+        # result I/O options must not change the simulation or the written result files
+        differences = check_equivalence({}, {'writer_async': True, 'writer_compression': 'gzip', 'profile': True},
+                                        scenarios)
+        self.assertEqual(differences, [], format_report(differences))
+        # the written files are compared
+        differences = check_equivalence({}, {'write_flow_actions': True}, scenarios[:1])
+        self.assertEqual([(difference.kind, difference.key) for difference in differences], [('file', 'flow_actions')])
+        # other data rates change the per-run node metrics and the flow durations
+        differences = check_equivalence({}, {'flow_dr_mean': 2.0}, equivalence_scenarios(['mmpp'], duration=300))
+        self.assertTrue({'run', 'flow'} <= {difference.kind for difference in differences})
+        self.assertIn('differences', format_report(differences))
+
+    def test_memory(self):
+        scenario = scenario_grid(nodes=[5], inter_arrival_mean=[20.0])[0]
+        report = check_memory(scenario, runs=20, max_growth=1e9, top=5)
+        self.assertEqual(report['runs'], 20)
+        self.assertEqual(report['steady_state_run'], 5)
+        self.assertTrue(report['passed'])
+        self.assertLessEqual(len(report['top_allocations']), 5)
+        self.assertTrue(all(sample['traced_bytes'] > 0 for sample in report['samples']))
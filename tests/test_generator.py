@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import TestCase
+import networkx as nx
+from coordsim.reader import reader
+from coordsim.generator.topology import TOPOLOGY_MODELS, create_topology
+from coordsim.generator.generate import generate, parse_args
+from coordsim.bench.runner import scheduling_action
+from coordsim.bench.scenarios import scenario_grid, write_scenario
+from coordsim.generator.flow_workload import generate_workload, open_workload, write_workload
+from coordsim.metrics.metrics import Metrics
+from coordsim.simulation.simulatorparams import SimulatorParams
+from coordsim.simulation.tracer import EventCode
+from siminterface.simulator import Simulator
+
+
+class TestGenerator(TestCase):
+
+    def test_topologies(self):
+        for model in TOPOLOGY_MODELS:
+            network = create_topology(model, 20, 3, seed=1, node_cap=(5, 10))
+            self.assertTrue(nx.is_connected(network), model)
+            self.assertEqual(sum(1 for _, t in network.nodes(data='NodeType') if t == 'Ingress'), 3)
+            self.assertTrue(all(5 <= cap <= 10 for _, cap in network.nodes(data='NodeCap')))
+            self.assertTrue(all(delay >= 1 for _, _, delay in network.edges(data='LinkDelay')))
+            # same seed, same topology
+            self.assertEqual(list(network.edges(data=True)),
+                             list(create_topology(model, 20, 3, seed=1, node_cap=(5, 10)).edges(data=True)))
+        # smallest fat-tree with at least 20 switches: k=4 with 5*4^2/4 switches
+        self.assertEqual(create_topology('fat_tree', 20, 3).number_of_nodes(), 20)
+        self.assertEqual(create_topology('fat_tree', 21, 3).number_of_nodes(), 45)
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            args = parse_args([directory, '--model', 'barabasi_albert', '--nodes', '15', '--ingress', '2',
+                               '--seed', '5', '--resource-functions', 'linear', 'quadratic', '--load', '0.2'])
+            network_file, service_file, config_file = generate(args)
+            network, ingress, _ = reader.read_network(network_file)
+            self.assertEqual(network.number_of_nodes(), 15)
+            self.assertEqual(len(ingress), 2)
+            sf_list = reader.get_sf(service_file, os.path.join(directory, 'resource_functions'))
+            self.assertEqual(sf_list['sf1']['resource_function'](4), 4.8)
+            # 2 ingress nodes * 3 SFs * (5ms processing + 1ms flow duration) / (0.2 * 150 total capacity)
+            self.assertAlmostEqual(reader.get_config(config_file)['inter_arrival_mean'], 1.2)
+
+            simulator = Simulator(network_file, service_file, config_file,
+                                  resource_functions_path=os.path.join(directory, 'resource_functions'))
+            simulator.init(1234)
+            simulator.apply(scheduling_action(simulator))
+            self.assertGreater(simulator.metrics.metrics['generated_flows'], 0)
+
+    def test_workload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            scenario = scenario_grid(nodes=[6], ingress=[2], size_shape=[1.5], inter_arrival_mean=[2.0])[0]
+            workload_file = os.path.join(directory, 'flows.wl')
+            scenario['config'] = {'flow_generator_class': 'MappedListFlowGenerator', 'workload_path': workload_file,
+                                  'flow_dr_stdev': 0.5, 'ttl_choices': [50, 100], 'trace_events': True}
+            network_file, service_file, config_file = write_scenario(scenario, directory)
+            network, ingress, egress = reader.read_network(network_file)
+            sfc_list = reader.get_sfc(service_file)
+            sf_list = reader.get_sf(service_file)
+            params = SimulatorParams(None, network, ingress, egress, sfc_list, sf_list,
+                                     reader.get_config(config_file), Metrics(network, sf_list))
+            write_workload(workload_file, *generate_workload(params, 300, seed=1))
+
+            workload = open_workload(workload_file)
+            for node_id, *_ in ingress:
+                flows = workload.flows(node_id)
+                self.assertTrue(all(len(column) == len(flows['dr']) for column in flows.values()))
+                self.assertGreater(len(flows['dr']), 100)
+                self.assertTrue((flows['dr'] >= 0).all())
+                self.assertTrue(set(flows['ttl']) <= {50, 100})
+
+            # the simulated flows are those of the workload, independent of the simulator's seed
+            generated = []
+            for seed in (1, 2):
+                simulator = Simulator(network_file, service_file, config_file)
+                simulator.init(seed)
+                action = scheduling_action(simulator)
+                while simulator.env.now < 300:
+                    simulator.apply(action)
+                events = simulator.tracer.snapshot()
+                events = events[events['code'] == EventCode.FLOW_GENERATED]
+                generated.append(sorted(zip(events['time'], events['node'], events['value'])))
+                simulator.close()
+            self.assertEqual(generated[0], generated[1])
+            self.assertEqual(len(generated[0]), sum(len(workload.flows(node_id)['dr']) for node_id, *_ in ingress))
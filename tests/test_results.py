@@ -0,0 +1,50 @@
+from unittest import TestCase
+import os
+import tempfile
+from coordsim.results.result_set import ResultSet
+from coordsim.writer.writer import ResultWriter
+
+
+class TestResultSet(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp_dir.name, "test")
+        writer = ResultWriter(True, self.test_dir)
+        rows = [[1, time, node, sf] for time in (200, 100, 0) for node in ('pop0', 'pop1') for sf in ('a', 'b')]
+        writer.backend.write_rows('placements', rows)
+        writer.close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_slicing(self):
+        results = ResultSet(self.test_dir)
+        self.assertTrue(results.has('placements'))
+        self.assertFalse(results.has('resources'))
+        self.assertEqual(list(results.times('placements')), [0, 100, 200])
+        at_100 = results.at('placements', 100)
+        self.assertEqual(list(zip(at_100['node'], at_100['sf'])),
+                         [('pop0', 'a'), ('pop0', 'b'), ('pop1', 'a'), ('pop1', 'b')])
+        self.assertEqual(len(results.at('placements', 50)), 0)
+        self.assertEqual(list(results.node('placements', 'pop1')['time']), [0, 0, 100, 100, 200, 200])
+        self.assertEqual(len(results.between('placements', 1, 200)), 8)
+
+    def test_cache(self):
+        ResultSet(self.test_dir)['placements']
+        cache_file = os.path.join(self.test_dir, ".placements.csv.cache.npz")
+        self.assertTrue(os.path.exists(cache_file))
+        # Cached frames equal the parsed ones, also with missing strings
+        with open(os.path.join(self.test_dir, "placements.csv"), 'a') as f:
+            f.write("1,250,,a\n")
+        parsed = ResultSet(self.test_dir)['placements']
+        self.assertTrue(ResultSet(self.test_dir)['placements'].equals(parsed))
+        self.assertTrue(ResultSet(self.test_dir, cache=False)['placements'].equals(parsed))
+        # A partially written cache is ignored
+        with open(cache_file, 'r+b') as f:
+            f.truncate(100)
+        self.assertTrue(ResultSet(self.test_dir)['placements'].equals(parsed))
+        # A changed result file invalidates the cache
+        with open(os.path.join(self.test_dir, "placements.csv"), 'a') as f:
+            f.write("1,300,pop0,a\n")
+        self.assertEqual(list(ResultSet(self.test_dir).times('placements')), [0, 100, 200, 250, 300])
@@ -1,11 +1,19 @@
+import os
+import tempfile
 from unittest import TestCase
 from coordsim.simulation.flowsimulator import FlowSimulator
 from coordsim.simulation.simulatorparams import SimulatorParams
 from coordsim.network import dummy_data
 from coordsim.reader import reader
 import simpy
+import numpy as np
 import logging
 from coordsim.metrics.metrics import Metrics
+from coordsim.simulation.profiler import Profiler, next_event_id
+from coordsim.simulation.tracer import EventCode, EventTracer, create_tracer
+from coordsim.trace_processor.flow_trace import convert_to_binary
+from coordsim.trace_processor.compiled_trace import cache_path, load_trace
+from coordsim.trace_processor.trace_processor import TraceProcessor
 log = logging.getLogger(__name__)
 
 NETWORK_FILE = "params/networks/triangle.graphml"
@@ -62,3 +70,146 @@ class TestFlowSimulator(TestCase):
                                                                        self.metric_collection['total_active_flows'])
         self.assertIs(gen_flow_check, True)
         # More tests are to come
+
+    def test_profiler(self):
+        """
+        Test the profiling counters of a second simulation with instrumented components
+        """
+        env = simpy.Environment()
+        profiler = Profiler(sample_interval=2)
+        profiler.begin_episode(1, env)
+        self.simulator_params.profiler = profiler
+        profiler.instrument(self.metrics, 'metrics')
+        flow_simulator = FlowSimulator(env, self.simulator_params)
+        flow_simulator.start()
+        env.run(until=SIMULATION_DURATION)
+
+        profile = profiler.get_profile()
+        generated = [entry for entry in profile if entry['method'] == 'generate_flow']
+        # generate_flow is profiled per ingress node
+        self.assertEqual({entry['node'] for entry in generated}, {node[0] for node in self.simulator_params.ing_nodes})
+        self.assertEqual(sum(entry['calls'] for entry in generated), flow_simulator.total_flow_count)
+        # every second call is timed
+        self.assertEqual(sum(entry['timed_calls'] for entry in generated), flow_simulator.total_flow_count // 2)
+        decisions = [entry for entry in profile if entry['method'] == 'decide_next_node']
+        self.assertTrue(decisions)
+        self.assertTrue(all(entry['time_ns'] > 0 for entry in decisions))
+
+        # without SimPy's (private) event id counter, events are reported as unavailable
+        self.assertIsNone(next_event_id(object()))
+        profiler.begin_episode(2, object())
+        self.metrics.calc_max_node_usage('pop0', 0)
+        self.assertTrue(profiler.get_profile())
+        self.assertTrue(all(entry['events'] is None for entry in profiler.get_profile()))
+
+    def test_tracer(self):
+        """
+        Test the flow events of a second simulation, recorded in a small ring buffer and logged
+        """
+        env = simpy.Environment()
+        params = self.simulator_params
+        params.tracer = EventTracer(params.network.nodes, params.sfc_list, params.sf_list, capacity=16)
+        self.metrics.reset_metrics()
+        flow_simulator = FlowSimulator(env, params)
+        flow_simulator.start()
+        env.run(until=SIMULATION_DURATION)
+
+        # the ring buffer keeps the last 16 events, ordered by time
+        records = params.tracer.snapshot()
+        self.assertEqual(len(records), 16)
+        self.assertTrue((records['time'][1:] >= records['time'][:-1]).all())
+        self.assertGreater(params.tracer.num_events, 16)
+
+        # events are logged right away, whenever the logger is enabled, and only buffered if requested
+        logger = logging.getLogger('test_tracer')
+        logger.setLevel(logging.WARNING)
+        tracer = EventTracer(params.network.nodes, params.sfc_list, params.sf_list, logger=logger, buffered=False)
+        tracer.record(EventCode.FLOW_LEAVING, 1, '6', 'pop0', 'pop1')
+        logger.setLevel(logging.INFO)
+        with self.assertLogs(logger, logging.INFO) as logs:
+            tracer.record(EventCode.FLOW_LEAVING, 1.5, '7', 'pop0', 'pop1')
+            tracer.record(EventCode.FLOW_GENERATED, 2, '8', 'pop0', sfc='sfc_1', value=5.0, dr=1.0)
+        self.assertEqual([record.getMessage() for record in logs.records], [
+            "Flow 7 will leave node pop0 towards node pop1. Time 1.5",
+            "Flow 8 generated. arrived at node pop0 Requesting sfc_1 - flow duration: 5.0ms, flow dr: 1.0. Time: 2"])
+        self.assertEqual(len(tracer.snapshot()), 0)
+
+        # without logging (below INFO) and tracing there is no tracer at all
+        params.logger = logger
+        logger.setLevel(logging.WARNING)
+        self.assertIsNone(create_tracer(params))
+        self.assertIsNotNone(create_tracer(params, trace_events=True))
+        logger.setLevel(logging.INFO)
+        self.assertIsNotNone(create_tracer(params))
+
+    def test_flow_trace(self):
+        """
+        Test replaying a per-flow trace (CSV and binary) in small chunks
+        """
+        params = self.simulator_params
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, 'flows.csv')
+            with open(csv_path, 'w') as f:
+                f.write('time,ingress,size,dr,sfc,egress,ttl\n')
+                # flows before flow_trace_start are skipped
+                f.write('1000.0,pop0,1.0,1.0,,,\n')
+                for i in range(50):
+                    f.write(f"{1001.0 + i * 0.5},pop{i % 2},{0.001 * (i + 1)},1.0,sfc_1,,{'' if i % 3 else 20}\n")
+            binary_path = os.path.join(directory, 'flows.bin')
+            self.assertEqual(convert_to_binary(csv_path, binary_path, chunk_size=8), 51)
+
+            generated = []
+            for path in (csv_path, binary_path):
+                env = simpy.Environment()
+                params.config = dict(params.config, flow_trace_path=path, flow_trace_chunk_size=7,
+                                     flow_trace_start=1001.0, flow_trace_time_scale=2.0)
+                params.flow_generator_class = 'TraceFlowGenerator'
+                params.tracer = EventTracer(params.network.nodes, params.sfc_list, params.sf_list)
+                self.metrics.reset_metrics()
+                flow_simulator = FlowSimulator(env, params)
+                flow_simulator.start()
+                env.run(until=SIMULATION_DURATION)
+                records = params.tracer.snapshot()
+                records = records[records['code'] == EventCode.FLOW_GENERATED]
+                generated.append(records[['time', 'node', 'value']].tolist())
+                self.assertEqual(flow_simulator.total_flow_count, 50)
+                self.assertEqual(self.metrics.metrics['generated_flows'], 50)
+        # arrival times are scaled, flow durations are size / dr
+        self.assertEqual(generated[0], generated[1])
+        self.assertEqual([record[0] for record in generated[0]], [i * 1.0 for i in range(50)])
+        self.assertAlmostEqual(generated[0][-1][2], 50.0)
+
+    def test_compiled_trace(self):
+        """
+        Test compiling, caching and replaying a trace with per-node changes
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            trace_file = os.path.join(directory, 'trace.csv')
+            with open(trace_file, 'w') as f:
+                f.write('time,node,inter_arrival_mean,cap\n50,pop1,None,10\n20,pop0,2,12\n20,pop1,4,10\n')
+            trace = load_trace(trace_file)
+            self.assertTrue(os.path.exists(cache_path(trace_file)))
+            # sorted by time, rows with the same time keep their order
+            self.assertEqual(trace.time.tolist(), [20, 20, 50])
+            self.assertEqual([trace.nodes[node] for node in trace.node], ['pop0', 'pop1', 'pop1'])
+            self.assertEqual([(time, start, end) for time, start, end in trace.groups()], [(20, 0, 2), (50, 2, 3)])
+            cached = load_trace(trace_file)
+            self.assertEqual(cached.nodes, trace.nodes)
+            self.assertTrue(np.array_equal(cached.inter_arrival_mean, trace.inter_arrival_mean, equal_nan=True))
+            # a partially written cache is ignored and rewritten
+            with open(cache_path(trace_file), 'r+b') as f:
+                f.truncate(100)
+            self.assertEqual(load_trace(trace_file).time.tolist(), [20, 20, 50])
+            self.assertEqual(load_trace(trace_file).nodes, trace.nodes)
+
+            env = simpy.Environment()
+            params = self.simulator_params
+            TraceProcessor(params, env, trace, self.flow_simulator)
+            # changes are applied one time unit early
+            env.run(until=18.5)
+            self.assertNotEqual(params.inter_arr_mean['pop0'], 2.0)
+            env.run(until=19.5)
+            self.assertEqual(params.inter_arr_mean, {'pop0': 2.0, 'pop1': 4.0})
+            self.assertEqual(params.network.nodes['pop0']['cap'], 12.0)
+            env.run(until=49.5)
+            self.assertIsNone(params.inter_arr_mean['pop1'])
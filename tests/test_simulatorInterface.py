@@ -4,7 +4,10 @@ Simulator interface tests
 """
 from unittest import TestCase
 
+from urllib.request import urlopen
+
 from spinterface import SimulatorInterface, SimulatorAction, SimulatorState
+from coordsim.metrics.exporter import MetricsExporter
 
 NETWORK_FILE = "params/networks/triangle.graphml"
 SERVICE_FUNCTIONS_FILE = "params/services/3sfcs.yaml"
@@ -255,3 +258,45 @@ class TestSimulatorInterface(TestCase):
         self.assertIn('dropped_flows', network_stats)
         self.assertIn('in_network_flows', network_stats)
         self.assertIn('avg_end2end_delay', network_stats)
+
+    def test_subscribe(self):
+        # results are published to subscribers without test mode (no files)
+        metrics = self.simulator.ring_buffer('metrics', capacity=2)
+        drops = []
+        self.simulator.subscribe(lambda table, rows: drops.extend(rows), ['drops'])
+        nodes = ['pop0', 'pop1', 'pop2']
+        placement = {node: [] for node in nodes}
+        flow_schedule = {node: {sfc: {sf: {dest: 1 / 3 for dest in nodes} for sf in ['a', 'b', 'c']}
+                                for sfc in ['sfc_1', 'sfc_2', 'sfc_3']} for node in nodes}
+        for _ in range(3):
+            simulator_state = self.simulator.apply(SimulatorAction(placement=placement, scheduling=flow_schedule))
+        records = metrics.snapshot()
+        self.assertEqual(len(records), 2)
+        self.assertTrue(records['time'][0] < records['time'][1])
+        # nothing is placed: all flows are dropped
+        self.assertTrue(0 < records['dropped_flows'][-1] <= simulator_state.network_stats['dropped_flows'])
+        self.assertEqual(len(drops), simulator_state.network_stats['dropped_flows'])
+        self.assertTrue({drop[3] for drop in drops} <= set(nodes))
+
+    def test_metrics_exporter(self):
+        # attach an exporter on a free port to the running episode
+        exporter = MetricsExporter(port=0, interval=50)
+        self.simulator.writer.subscribe(exporter.update_run_flows, ['run_flows'])
+        exporter.attach(self.simulator.env, self.simulator.params)
+        exporter.start()
+        try:
+            nodes = ['pop0', 'pop1', 'pop2']
+            placement = {node: [] for node in nodes}
+            for _ in range(2):
+                self.simulator.apply(SimulatorAction(placement=placement, scheduling={}))
+            with urlopen(f"http://127.0.0.1:{exporter.port}/metrics") as response:
+                text = response.read().decode()
+        finally:
+            exporter.stop()
+        values = dict(line.split() for line in text.splitlines() if not line.startswith('#'))
+        # the last snapshot is at most one interval old
+        self.assertTrue(self.simulator.env.now - 50 <= float(values['coordsim_sim_time']) < self.simulator.env.now)
+        self.assertGreater(float(values['coordsim_events_total']), 0)
+        self.assertIn('coordsim_events_per_second', values)
+        self.assertEqual(float(values['coordsim_run_drop_rate']), 1.0)
+        self.assertIn('# TYPE coordsim_dropped_flows_total counter', text)
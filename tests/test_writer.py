@@ -0,0 +1,261 @@
+from unittest import TestCase
+import os
+import sqlite3
+import tempfile
+import pandas as pd
+import yaml
+from coordsim.writer.writer import ResultWriter
+from coordsim.writer.backends import ColumnarWriterBackend, read_columnar_table
+from coordsim.writer.async_backend import AsyncWriterBackend
+from coordsim.writer.flow_action_log import FlowActionLog, read_flow_action_log
+from coordsim.writer.merge_shards import merge_shards
+from coordsim.writer.flow_sampling import HashFlowSampler, ReservoirFlowSampler
+from coordsim.network.flow import Flow
+from coordsim.simulation.tracer import BinaryTraceSink, EventCode, EventTracer, read_trace
+from coordsim.writer.delta import DeltaEncoder, DeltaTable
+from coordsim.writer.compression import COMPRESSION_EXTENSIONS, available_compressions, find_result_file, \
+    read_result_csv
+
+
+class TestResultWriter(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.test_dir = os.path.join(self.tmp_dir.name, "test")
+        os.makedirs(self.test_dir)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_csv_backend(self):
+        writer = ResultWriter(True, self.test_dir)
+        writer.write_runtime(0.5)
+        writer.write_rl_state([1, 100, 0.1, 0.2])
+        writer.close()
+        runtimes = pd.read_csv(os.path.join(self.test_dir, "runtimes.csv"))
+        self.assertEqual(list(runtimes.columns), ['run', 'runtime'])
+        self.assertEqual(runtimes['runtime'][0], 0.5)
+        rl_state = pd.read_csv(os.path.join(self.test_dir, "rl_state.csv"), header=None)
+        self.assertEqual(rl_state.shape, (1, 4))
+
+    def test_columnar_backend(self):
+        writer = ResultWriter(True, self.test_dir, backend='columnar', chunk_size=3, columnar_format='npz')
+        self.assertIsInstance(writer.backend, ColumnarWriterBackend)
+        for i in range(7):
+            writer.write_runtime(i / 10)
+        writer.close()
+        # 2 full chunks of 3 rows and one chunk with the remaining row
+        self.assertEqual(len(os.listdir(os.path.join(self.test_dir, "runtimes"))), 3)
+        runtimes = read_columnar_table(self.test_dir, "runtimes")
+        self.assertEqual(list(runtimes['run']), list(range(1, 8)))
+        self.assertAlmostEqual(runtimes['runtime'].iloc[-1], 0.6)
+
+        # None is written as NaN (numeric columns) or '' (string columns), so chunks can be read without pickle
+        backend = ColumnarWriterBackend(self.test_dir, columnar_format='npz')
+        backend.open_table('node_metrics', ['node', 'used_resources'])
+        backend.write_rows('node_metrics', [['pop0', 1], ['pop1', None], [None, 2]])
+        backend.close()
+        node_metrics = read_columnar_table(self.test_dir, "node_metrics")
+        self.assertEqual(list(node_metrics['node']), ['pop0', 'pop1', ''])
+        self.assertEqual(list(node_metrics['used_resources'].isna()), [False, True, False])
+        # rows without header must all have the width of the first row
+        backend = ColumnarWriterBackend(self.test_dir, columnar_format='npz')
+        backend.open_table('rl_state')
+        backend.write_rows('rl_state', [[1, 0.5], [2, 0.5, 0.1]])
+        with self.assertRaises(ValueError):
+            backend.flush()
+
+    def test_async_backend(self):
+        writer = ResultWriter(True, self.test_dir, asynchronous=True, queue_size=2, batch_size=2)
+        self.assertIsInstance(writer.backend, AsyncWriterBackend)
+        for i in range(100):
+            writer.write_runtime(i)
+        writer.close()
+        self.assertFalse(writer.backend.thread.is_alive())
+        runtimes = pd.read_csv(os.path.join(self.test_dir, "runtimes.csv"))
+        self.assertEqual(list(runtimes['runtime']), list(range(100)))
+
+    def test_binary_flow_action_log(self):
+        log = FlowActionLog(os.path.join(self.test_dir, "flow_actions.bin"), block_size=2)
+        for i in range(3):
+            log.write(1, i * 0.5, str(i), 50 - i, 50, 'pop0', 'pop1' if i else None, 1.0, 2.0, 10, 9.5)
+        log.close()
+        records, nodes = read_flow_action_log(os.path.join(self.test_dir, "flow_actions.bin"))
+        self.assertEqual(nodes, ['pop0', 'pop1'])
+        self.assertEqual(list(records['flow_id']), [0, 1, 2])
+        self.assertEqual(list(records['dest_node']), [-1, 1, 1])
+        df = read_flow_action_log(os.path.join(self.test_dir, "flow_actions.bin"), as_frame=True)
+        self.assertEqual(list(df['curr_node_id']), ['pop0'] * 3)
+        self.assertAlmostEqual(df['link_rem_cap'].iloc[-1], 9.5)
+
+    def test_delta_encoding(self):
+        states = [{('pop0', 'a'): None, ('pop1', 'a'): None}, {('pop0', 'a'): None}, {('pop0', 'a'): None},
+                  {('pop1', 'b'): None}]
+        encoder = DeltaEncoder(keyframe_interval=3)
+        rows = []
+        for time, state in enumerate(states):
+            rows.extend([1, time, op, *key] for op, key, _ in encoder.encode(1, state))
+        self.assertEqual([row[2] for row in rows], ['k', 'k', 'd', 'k'])
+        table = DeltaTable(pd.DataFrame(rows, columns=['episode', 'time', 'op', 'node', 'sf']), ['node', 'sf'])
+        self.assertEqual(list(table.at(1)['node']), ['pop0'])
+        expanded = table.expand(range(len(states)))
+        for time, state in enumerate(states):
+            rows = expanded[expanded['time'] == time]
+            self.assertEqual(set(zip(rows['node'], rows['sf'])), set(state.keys()))
+
+    def test_compressed_csv_backend(self):
+        for compression in available_compressions():
+            test_dir = os.path.join(self.test_dir, compression)
+            writer = ResultWriter(True, test_dir, compression=compression, compression_block_size=16)
+            for i in range(10):
+                writer.write_runtime(i)
+            writer.close()
+            path = os.path.join(test_dir, "runtimes.csv")
+            self.assertFalse(os.path.exists(path))
+            self.assertEqual(find_result_file(path), path + COMPRESSION_EXTENSIONS[compression])
+            runtimes = read_result_csv(path)
+            self.assertEqual(list(runtimes['runtime']), list(range(10)))
+
+    def test_sqlite_backend(self):
+        database = os.path.join(self.test_dir, "results.sqlite")
+        for name in ("run1", "run2"):
+            writer = ResultWriter(True, os.path.join(self.test_dir, name), backend='sqlite', database=database,
+                                  experiment={'network': 'triangle.graphml'}, batch_size=3)
+            writer.backend.write_rows('run_flows', [[1, time, 9, 1, 10] for time in range(5)])
+            writer.write_rl_state([1, 0, 0.5])
+            writer.close()
+        connection = sqlite3.connect(database)
+        query = ("SELECT COUNT(*), SUM(r.dropped_flows) FROM run_flows r JOIN experiment_meta m "
+                 "ON m.experiment_id = r.experiment_id WHERE m.key = 'network' AND m.value = 'triangle.graphml'")
+        self.assertEqual(connection.execute(query).fetchone(), (10, 10))
+        self.assertEqual(connection.execute("SELECT row FROM rl_state").fetchall(), [('1,0,0.5',)] * 2)
+        connection.close()
+
+    def test_sharded_backend(self):
+        for worker in ("b", "a"):
+            writer = ResultWriter(True, self.test_dir, backend='sharded', worker=worker)
+            for episode in (2, 1):
+                writer.begin_episode(episode)
+                writer.backend.write_row('run_flows', [episode, 0, worker, 0, 0])
+            writer.close()
+        merge_shards(self.test_dir, tables=['run_flows'])
+        run_flows = pd.read_csv(os.path.join(self.test_dir, "run_flows.csv"))
+        self.assertEqual(list(zip(run_flows['episode'], run_flows['successful_flows'])),
+                         [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b')])
+
+    def test_sharded_files(self):
+        # Two workers with different node tables write their output files to the same test_dir
+        for worker, nodes in (("b", ['pop1', 'pop0']), ("a", ['pop0', 'pop2'])):
+            writer = ResultWriter(True, self.test_dir, write_flow_actions=True, flow_actions_format='binary',
+                                  backend='sharded', worker=worker)
+            tracer = EventTracer(nodes, ['sfc_1'], ['a'], sinks=[BinaryTraceSink(writer.output_path("events.bin"))])
+            for episode in (2, 1):
+                writer.begin_episode(episode)
+                writer.flow_action_log.write(episode, 0.0, episode, 10, 10, nodes[0], nodes[1], 1, 1, 1, 1)
+                tracer.record(EventCode.FLOW_LEAVING, episode, episode, nodes[0], nodes[1])
+            tracer.close()
+            writer.write_dropped_flow_locs({node: {'a': 1, 'EG': 0} for node in nodes})
+            writer.close()
+        merged = merge_shards(self.test_dir, remove=True)
+        self.assertEqual([os.path.basename(path) for path in merged[-3:]],
+                         ['dropped_flows.yaml', 'flow_actions.bin', 'events.bin'])
+        self.assertEqual(os.listdir(os.path.join(self.test_dir, "shards")), [])
+
+        with open(os.path.join(self.test_dir, "dropped_flows.yaml")) as f:
+            self.assertEqual(yaml.safe_load(f), {'pop0': {'a': 2, 'EG': 0}, 'pop1': {'a': 1, 'EG': 0},
+                                                 'pop2': {'a': 1, 'EG': 0}})
+        df = read_flow_action_log(os.path.join(self.test_dir, "flow_actions.bin"), as_frame=True)
+        self.assertEqual(list(df['episode']), [1, 1, 2, 2])
+        self.assertEqual(list(zip(df['curr_node_id'], df['dest_node'])),
+                         [('pop0', 'pop2'), ('pop1', 'pop0'), ('pop0', 'pop2'), ('pop1', 'pop0')])
+        records, names = read_trace(os.path.join(self.test_dir, "events.bin"))
+        self.assertEqual([(names['node'][record['node']], names['node'][record['target']]) for record in records],
+                         [('pop0', 'pop2')] * 2 + [('pop1', 'pop0')] * 2)
+
+    def test_flow_sampling(self):
+        flows = [Flow(str(i), 'sfc_1', 1.0, 1.0, 0) for i in range(100)]
+        sampler = HashFlowSampler(10)
+        sampled = [flow for flow in flows if sampler.offer(flow, [1, 0.0, flow.flow_id])]
+        # The decision is made once per flow and applies to all its actions
+        self.assertTrue(all(sampler.offer(flow, [1, 1.0, flow.flow_id]) for flow in sampled))
+        self.assertTrue(all(flow.trace_weight in (0, 10) for flow in flows))
+
+        flows = [Flow(str(i), 'sfc_1', 1.0, 1.0, 0) for i in range(100)]
+        sampler = ReservoirFlowSampler(5)
+        for hop in range(2):
+            for flow in flows:
+                self.assertEqual(sampler.offer(flow, [1, hop, flow.flow_id]), [])
+        output = sampler.end_run()
+        self.assertEqual(len(output), 10)
+        self.assertEqual({weight for _, weight in output}, {20})
+        # Rows keep the order in which they were offered
+        self.assertEqual([record[1] for record, _ in output], [0] * 5 + [1] * 5)
+        self.assertEqual(sum(flow.trace_weight for flow in flows), 100)
+
+    def test_rollup(self):
+        writer = ResultWriter(True, self.test_dir, rollup=True, rollup_factors=(2, 4), rollup_window=3)
+        for time in range(10):
+            writer.backend.write_row('run_flows', [1, time * 100, time, 0, time])
+            writer.backend.write_rows('node_metrics', [[1, time * 100, node, time, 0, 0]
+                                                       for node in ('pop0', 'pop1')])
+        # finished aggregates are appended through the wrapped backend right away
+        writer.backend.flush()
+        run_flows_2x = pd.read_csv(os.path.join(self.test_dir, "run_flows_2x.csv"))
+        self.assertEqual(list(run_flows_2x['time']), [0, 200, 400, 600])
+        writer.close()
+        # the detail window is measured in runs
+        run_flows = pd.read_csv(os.path.join(self.test_dir, "run_flows.csv"))
+        self.assertEqual(list(run_flows['time']), [700, 800, 900])
+        node_metrics = pd.read_csv(os.path.join(self.test_dir, "node_metrics.csv"))
+        self.assertEqual(list(node_metrics['time']), [700, 700, 800, 800, 900, 900])
+        node_metrics_4x = pd.read_csv(os.path.join(self.test_dir, "node_metrics_4x.csv"))
+        self.assertEqual(list(node_metrics_4x['node']), ['pop0', 'pop1'] * 3)
+        run_flows_2x = pd.read_csv(os.path.join(self.test_dir, "run_flows_2x.csv"))
+        self.assertEqual(list(run_flows_2x['time']), [0, 200, 400, 600, 800])
+        run_flows_4x = pd.read_csv(os.path.join(self.test_dir, "run_flows_4x.csv"))
+        self.assertEqual(list(run_flows_4x['samples']), [4, 4, 2])
+        self.assertEqual(list(run_flows_4x['successful_flows_mean']), [1.5, 5.5, 8.5])
+        self.assertEqual(list(run_flows_4x['successful_flows_max']), [3, 7, 9])
+        # all outputs are written by the wrapped backend, e.g., compressed
+        test_dir = os.path.join(self.test_dir, 'gzip')
+        writer = ResultWriter(True, test_dir, rollup=True, rollup_factors=(2,), rollup_window=3, compression='gzip')
+        for time in range(3):
+            writer.backend.write_row('run_flows', [1, time * 100, time, 0, time])
+        writer.close()
+        self.assertEqual(len(read_result_csv(os.path.join(test_dir, "run_flows.csv"))), 3)
+        self.assertEqual(list(read_result_csv(os.path.join(test_dir, "run_flows_2x.csv"))['samples']), [2, 1])
+        # the detail window of an episode is written when the next episode begins, i.e., to the episode's shard
+        test_dir = os.path.join(self.test_dir, 'sharded')
+        writer = ResultWriter(True, test_dir, backend='sharded', worker='a', rollup=True, rollup_factors=(2,),
+                              rollup_window=2)
+        for episode in (1, 2):
+            writer.begin_episode(episode)
+            for time in range(3):
+                writer.backend.write_row('run_flows', [episode, time * 100, time, 0, time])
+        writer.backend.flush()
+        shard = pd.read_csv(os.path.join(test_dir, "shards", "run_flows", "000001-a.csv"), header=None)
+        self.assertEqual(list(zip(shard[0], shard[1])), [(1, 100), (1, 200)])
+        writer.close()
+        merge_shards(test_dir, tables=['run_flows', 'run_flows_2x'])
+        run_flows = pd.read_csv(os.path.join(test_dir, "run_flows.csv"))
+        self.assertEqual(list(zip(run_flows['episode'], run_flows['time'])), [(1, 100), (1, 200), (2, 100), (2, 200)])
+        self.assertEqual(list(pd.read_csv(os.path.join(test_dir, "run_flows_2x.csv"))['episode']), [1, 1, 2, 2])
+
+    def test_ring_buffer(self):
+        writer = ResultWriter(False, None)
+        runtimes = writer.ring_buffer('runtimes', capacity=3)
+        rows = []
+        writer.subscribe(lambda table, new_rows: rows.extend(new_rows), ['runtimes'])
+        for i in range(5):
+            writer.write_runtime(i / 10)
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(list(runtimes.snapshot()['run']), [3, 4, 5])
+        self.assertAlmostEqual(runtimes.latest()['runtime'][0], 0.4)
+        # Tables without subscribers are not computed
+        self.assertFalse(writer.observed('metrics'))
+        # rl_state has no header: its columns are defined by the dtype
+        with self.assertRaises(ValueError):
+            writer.ring_buffer('rl_state')
+        rl_state = writer.ring_buffer('rl_state', capacity=2, dtype=[('reward', 'f8'), ('action', 'i8')])
+        writer.write_rl_state([0.5, 3])
+        self.assertEqual(rl_state.latest()['action'][0], 3)